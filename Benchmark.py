@@ -0,0 +1,249 @@
+#! /usr/bin/python
+
+"""Simulator speed benchmarks.
+
+Every benchmark case simulates a synthetic trace on one cache class
+and associativity, in a process of its own so that its peak memory
+can be measured, and reports accesses per second and the peak memory
+added by the cache. The synthetic traces:
+
+stream  -> sequential 8 byte elements, every 4th a write
+strided -> a stride of stride bytes, every 4th a write
+random  -> uniformly random 8 byte elements, 30% writes
+matmul  -> naive i, j, k multiply of n x n matrices of doubles, as
+           many as fit in footprint bytes (reads of A and B, writes
+           of C)
+
+Usage:
+
+$ ./Benchmark.py run <output .json> [-q] [-n #accesses]
+$ ./Benchmark.py compare <old .json> <new .json> [-t threshold]
+
+compare lists the cases whose accesses per second dropped, or whose
+memory added by the cache grew, by more than threshold (10% default)
+and exits with 1 if there are any. Cases are matched on all of their
+trace and cache parameters.
+"""
+
+import getopt
+import json
+import math
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+
+import Cache
+import FlatCache
+import Native
+import Trace
+
+PATTERNS = ['stream', 'strided', 'random', 'matmul']
+CACHE_TYPES = ['Cache', 'LRUCache', 'FIFOCache', 'LFUCache',
+               'BucketLFUCache', 'FlatCache', 'NativeCache']
+BASE_ADDR = 0x7f0000000000
+SAMPLE_ADDR = '0x' + '0' * 16
+# Memory growth below this is taken for noise: peak resident memory
+# moves by whole pages and allocator arenas.
+MEMORY_SLACK_KB = 256
+
+def genSyntheticAccesses (pattern, n_accesses, footprint, stride = 4160,
+                          seed = 0):
+    """Yield (op, byte address) for n_accesses accesses of pattern
+    over footprint bytes."""
+    generator = random.Random (seed)
+    if pattern == 'stream':
+        for i in xrange (n_accesses):
+            yield i % 4 == 3, BASE_ADDR + (8 * i) % footprint
+    elif pattern == 'strided':
+        for i in xrange (n_accesses):
+            yield i % 4 == 3, BASE_ADDR + (stride * i) % footprint
+    elif pattern == 'random':
+        for i in xrange (n_accesses):
+            yield (generator.random () < 0.3,
+                   BASE_ADDR + 8 * generator.randrange (footprint / 8))
+    elif pattern == 'matmul':
+        n = max (1, int (math.sqrt (footprint / 8 / 3)))
+        a, b, c = [BASE_ADDR + matrix * 8 * n * n for matrix in range (3)]
+        count = 0
+        while True:
+            for i in xrange (n):
+                for j in xrange (n):
+                    for k in xrange (n):
+                        for addr in [a + 8 * (i * n + k),
+                                     b + 8 * (k * n + j)]:
+                            yield False, addr
+                            count += 1
+                            if count == n_accesses:
+                                return
+                    yield True, c + 8 * (i * n + j)
+                    count += 1
+                    if count == n_accesses:
+                        return
+    else:
+        raise ValueError ("Unknown pattern: " + str (pattern))
+
+def genSyntheticTrace (pattern, n_accesses, footprint, stride = 4160,
+                       seed = 0):
+    """Return (ops, addrs) of the synthetic trace, as Trace.parseTraceLines
+    does."""
+    ops, addrs = [], []
+    for op, addr in genSyntheticAccesses (pattern, n_accesses, footprint,
+                                          stride, seed):
+        ops.append (Cache.Set.dirty if op else Cache.Set.clean)
+        addrs.append (addr)
+    if Trace.numpy is not None:
+        return (Trace.numpy.array (ops, dtype = Trace.numpy.uint8),
+                Trace.numpy.array (addrs, dtype = Trace.numpy.uint64))
+    import array
+    return array.array ('B', ops), addrs
+
+def makeCache (cache_type, cache_size, block_size, n_ways):
+    """Return an empty cache of class (name) cache_type."""
+    n_sets = (cache_size / block_size) / n_ways
+    if cache_type == 'FlatCache':
+        return FlatCache.FlatCache (n_sets, n_ways, block_size, SAMPLE_ADDR)
+    if cache_type == 'NativeCache':
+        return Native.NativeCache (n_sets, n_ways, block_size, SAMPLE_ADDR)
+    return getattr (Cache, cache_type) (n_sets, n_ways, block_size,
+                                        SAMPLE_ADDR)
+
+def _peakMemory ():
+    """Peak resident memory of this process so far, in KB."""
+    return resource.getrusage (resource.RUSAGE_SELF).ru_maxrss
+
+def run_case (case):
+    """Run benchmark case (a dict) in this process, return case with
+    its results."""
+    random.seed (case ['seed'])
+    ops, addrs = genSyntheticTrace (case ['pattern'], case ['n_accesses'],
+                                    case ['footprint'], seed = case ['seed'])
+    memory_before = _peakMemory ()
+    cache = makeCache (case ['cache_type'], case ['cache_size'],
+                       case ['block_size'], case ['n_ways'])
+    start = time.time ()
+    for first in xrange (0, len (ops), case ['chunk_size']):
+        cache.accessArrays (ops [first:first + case ['chunk_size']],
+                            addrs [first:first + case ['chunk_size']])
+    seconds = time.time () - start
+    result = dict (case)
+    result ['seconds'] = seconds
+    result ['accesses_per_second'] = case ['n_accesses'] / max (seconds,
+                                                                1e-9)
+    result ['peak_memory_kb'] = _peakMemory ()
+    result ['cache_memory_kb'] = result ['peak_memory_kb'] - memory_before
+    result ['hit_rate'] = cache.getHitRate ()
+    return result
+
+def caseKey (case):
+    return (case ['pattern'], case ['cache_type'], case ['n_ways'],
+            case ['n_accesses'], case ['footprint'], case ['cache_size'],
+            case ['block_size'])
+
+def genCases (n_accesses = 200000,
+              patterns = PATTERNS,
+              cache_types = CACHE_TYPES,
+              ways_list = [1, 4, 16],
+              cache_size = 32768,
+              block_size = 64,
+              footprint = 1048576):
+    for pattern in patterns:
+        for cache_type in cache_types:
+            if cache_type == 'NativeCache' and not Native.available ():
+                continue
+            for n_ways in ways_list:
+                yield {'pattern': pattern,
+                       'cache_type': cache_type,
+                       'n_ways': n_ways,
+                       'n_accesses': n_accesses,
+                       'cache_size': cache_size,
+                       'block_size': block_size,
+                       'footprint': footprint,
+                       'chunk_size': 65536,
+                       'seed': 0}
+
+def run (output_filename, cases):
+    """Run every case in a fresh process, print a line per case and
+    write all the results to output_filename as JSON."""
+    results = []
+    for case in cases:
+        process = subprocess.Popen ([sys.executable,
+                                     os.path.abspath (__file__),
+                                     'case',
+                                     json.dumps (case)],
+                                    stdout = subprocess.PIPE)
+        output = process.communicate () [0]
+        if process.returncode != 0:
+            raise RuntimeError ("Benchmark case failed: " + json.dumps (case))
+        result = json.loads (output)
+        print ('%-8s %-15s %2d ways: %10.0f accesses/s %8d KB'
+               % (result ['pattern'], result ['cache_type'],
+                  result ['n_ways'], result ['accesses_per_second'],
+                  result ['cache_memory_kb']))
+        results.append (result)
+    f = open (output_filename, 'w')
+    json.dump ({'python': platform.python_version (),
+                'machine': platform.machine (),
+                'numpy': Trace.numpy is not None,
+                'native': Native.available (),
+                'time': time.time (),
+                'results': results},
+               f, indent = 1, sort_keys = True)
+    f.close ()
+    return results
+
+def compare (old_filename, new_filename, threshold = 0.1):
+    """Return [(case key, unit, old value, new value)] for the cases of
+    both runs that got slower ('accesses/s') or whose cache took more
+    memory ('KB') by more than threshold."""
+    runs = []
+    for filename in [old_filename, new_filename]:
+        f = open (filename)
+        runs.append (dict ((caseKey (result), result)
+                           for result in json.load (f) ['results']))
+        f.close ()
+    old, new = runs
+    regressions = []
+    for key in sorted (set (old) & set (new)):
+        before = old [key] ['accesses_per_second']
+        after = new [key] ['accesses_per_second']
+        if after < before * (1 - threshold):
+            regressions.append ((key, 'accesses/s', before, after))
+        before = old [key] ['cache_memory_kb']
+        after = new [key] ['cache_memory_kb']
+        if after > max (before * (1 + threshold), before + MEMORY_SLACK_KB):
+            regressions.append ((key, 'KB', before, after))
+    return regressions
+
+if __name__ == '__main__':
+    usage = __doc__ [__doc__.index ('Usage'):]
+    if len (sys.argv) < 3:
+        print usage
+        exit (2)
+    if sys.argv [1] == 'case':
+        print json.dumps (run_case (json.loads (sys.argv [2])))
+        exit (0)
+    opts, args = getopt.gnu_getopt (sys.argv [2:], "qn:t:")
+    opts = dict (opts)
+    if sys.argv [1] == 'run' and len (args) == 1:
+        n_accesses = int (opts.get ('-n', 200000))
+        if '-q' in opts:
+            cases = genCases (n_accesses / 10, ways_list = [4])
+        else:
+            cases = genCases (n_accesses)
+        run (args [0], cases)
+    elif sys.argv [1] == 'compare' and len (args) == 2:
+        regressions = compare (args [0], args [1],
+                               float (opts.get ('-t', 0.1)))
+        for key, unit, before, after in regressions:
+            print ('%-8s %-15s %2d ways, %d accesses over %d bytes,'
+                   ' %d byte cache of %d byte blocks:'
+                   ' %10.0f -> %10.0f %s'
+                   % (key + (before, after, unit)))
+        exit (1 if regressions else 0)
+    else:
+        print usage
+        exit (2)
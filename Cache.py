@@ -1,12 +1,27 @@
 #! /usr/bin/python
 
+import collections
+import functools
+import heapq
+import itertools
 import math
 import random
-import sys
+
+import Trackers
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 def pad (string, padded_length, padding_char = " "):
     return string + padding_char * (padded_length - len (string))
 
+def setSeed (seed, set_number):
+    """Seed of the random generator of set set_number (see Cache
+    set_seed)."""
+    return (seed << 32) | set_number
+
 def getHumanReadableSize(size_in_bytes):
     """Return human-readable version of size_in_bytes.
 
@@ -26,6 +41,11 @@ def getHumanReadableSize(size_in_bytes):
 class Set (object):
     """Models the set as in the set-associative cache."""
     dirty, clean = 1, 0
+    # There is one of these per set, so no per-instance __dict__.
+    __slots__ = ('dict', 'capacity', 'seen_tags', 'cold_miss_count',
+                 'conflict_miss_count', 'access_count', 'writeback_count',
+                 'tag_bit_length', 'write_no_allocate', 'eviction_listener',
+                 'rng')
 
     def __init__ (self,
                   size,
@@ -37,8 +57,15 @@ class Set (object):
         self.cold_miss_count = 0
         self.conflict_miss_count = 0
         self.access_count = 0
+        self.writeback_count = 0
         self.tag_bit_length = tag_bit_length
         self.write_no_allocate = write_no_allocate
+        # Called as eviction_listener (tag, dirty_status) for every
+        # block evicted from the set, if set.
+        self.eviction_listener = None
+        # The random.Random of the set's random choices, if it has its
+        # own (see Cache set_seed), else they come from random.
+        self.rng = None
 
     def __str__ (self):
         """A suitably space separated list of tags in the set.
@@ -55,13 +82,29 @@ class Set (object):
                 + ' ')
         return str_repr
 
+    def __getstate__ (self):
+        # Listeners are bound to their owners, which attach them again
+        # (see Cache.setEvictionListener), so they are not pickled.
+        return dict ((name, getattr (self, name))
+                     for cls in type (self).__mro__
+                     for name in getattr (cls, '__slots__', ())
+                     if name != 'eviction_listener' and hasattr (self, name))
+
+    def __setstate__ (self, state):
+        for name, value in state.items ():
+            setattr (self, name, value)
+        self.eviction_listener = None
+
     def __writeBack (self, tag):
-        # As we are just counting the number of misses and hits,
-        # and not the performance in terms of time and latency etc,
-        # What happens here is irrlevant.
-        pass
+        # Just count it. Where the block goes is up to whoever
+        # listens to the evictions (see Hierarchy).
+        self.writeback_count += 1
 
     def pickBlockToEvict (self):
+        if self.rng is not None:
+            # In tag order, not the order of a dict that may have been
+            # rebuilt (unpickled) since.
+            return self.rng.choice (sorted (self.dict))
         return random.choice (self.dict.keys ())
 
     def evictAndWrite (self, tag_to_be_written, dirty_status):
@@ -71,21 +114,65 @@ class Set (object):
         dirty_status: whether the block we just wrote to the cache
                        should be marked dirty or clean. """
         tag_to_replace = self.pickBlockToEvict ()
-        if self.dict [tag_to_replace] == self.dirty:
-            self.__writeBack (tag_to_be_written)
-        self.dict.pop (tag_to_replace)
+        replaced_status = self.dict.pop (tag_to_replace)
+        if replaced_status == self.dirty:
+            self.__writeBack (tag_to_replace)
         self.dict [tag_to_be_written] = dirty_status
+        if self.eviction_listener is not None:
+            self.eviction_listener (tag_to_replace, replaced_status)
+
+    def forgetBlock (self, tag):
+        """Drop the replacement policy's bookkeeping for tag, which
+        has just been removed from the set other than by eviction."""
+        pass
+
+    def invalidate (self, tag):
+        """Remove tag from the set, without writing it back.
+        Return its dirty status, None if it was not in the set."""
+        if tag not in self.dict:
+            return None
+        self.forgetBlock (tag)
+        return self.dict.pop (tag)
+
+    def probe (self, tag):
+        """Count an access to tag and return whether it hits, without
+        bringing tag into the set on a miss."""
+        self.access_count += 1
+        if tag in self.dict:
+            return True
+        if tag not in self.seen_tags:
+            self.cold_miss_count += 1
+            self.seen_tags.add (tag)
+        else:
+            self.conflict_miss_count += 1
+        return False
+
+    def insert (self, tag, dirty_status):
+        """Bring tag into the set (evicting if need be) without counting
+        an access, e.g. for a block handed down by an upper level."""
+        counts = (self.access_count,
+                  self.cold_miss_count,
+                  self.conflict_miss_count)
+        self.writeOrRead (tag, self.clean)
+        if dirty_status == self.dirty:
+            self.dict [tag] = self.dirty
+        (self.access_count,
+         self.cold_miss_count,
+         self.conflict_miss_count) = counts
 
     def writeOrRead (self, tag, dirty_status):
+        """Access tag, return True on a hit."""
         self.access_count += 1
         # Hit: Tag is present.
         # Miss: Tag is not present
         # -> tag not in seen tags: cold miss
         # -> else if set is full: conflict miss
+        hit = tag in self.dict
 
-        # Hit
-        if tag in self.dict:
-            pass
+        # Hit: a write makes the block dirty.
+        if hit:
+            if dirty_status == self.dirty:
+                self.dict [tag] = self.dirty
 
         # Also, don't do anything if it is a write miss and we are using
         # write no allocate policy. Just increment the counts.
@@ -116,23 +203,22 @@ class Set (object):
             # that must mean the set is full
             if (len (self.dict) == self.capacity):
                 self.evictAndWrite (tag, dirty_status)
-            # case at hand:
+            # cases at hand:
             # write no allocate, wrote tag foo
             # that will mark tag foo as seen
             # read tag foo
+            # or, tag foo was seen but then invalidated.
             # the set has some space, still the execution will come here
             # and if the set is empty, evictAndWrite will fail.
-            elif (self.write_no_allocate
-                  and dirty_status == self.clean):
-                self.dict [tag] = self.clean
             else:
-                sys.exit ("Logic fail! Should never come here.")
+                self.dict [tag] = dirty_status
+        return hit
 
     def write (self, tag):
-        self.writeOrRead (tag, self.dirty)
+        return self.writeOrRead (tag, self.dirty)
 
     def read (self, tag):
-        self.writeOrRead (tag, self.clean)
+        return self.writeOrRead (tag, self.clean)
 
 
 class Cache (object):
@@ -143,26 +229,72 @@ class Cache (object):
                   block_size,
                   sample_addr = "0xb7737f64",
                   set_class = Set,
-                  write_no_allocate = False):
+                  write_no_allocate = False,
+                  set_options = None,
+                  classify_misses = False,
+                  cold_miss_tracker = None,
+                  set_seed = None):
+        """set_options: dict of extra keyword arguments for set_class.
+        classify_misses: run a fully associative LRU cache of the same
+        capacity alongside, to split the non-cold misses into capacity
+        and conflict misses (see getMissBreakdown).
+        cold_miss_tracker: a Trackers tracker (or its name, 'exact' or
+        'bloom') to remember the blocks seen in, instead of a set of
+        tags in every set.
+        set_seed: give every set a random generator of its own, seeded
+        from set_seed and the set number, so that random choices in a
+        set do not depend on the accesses to the others (see
+        Parallel) nor on the order of dicts (see Checkpoint)."""
         self.n_sets = n_sets
         self.n_ways = n_ways
         self.block_size = block_size
+        self.write_no_allocate = write_no_allocate
 
         # Calculate various bit lengths for splitting up of address
         self.addr_bit_length = 4 * len (sample_addr.split ("x") [1])
+        self.block_offset_bit_length = int (math.log (self.block_size, 2))
         self.block_addr_bit_length = (
             self.addr_bit_length
-            - int (math.log (self.block_size, 2)))
+            - self.block_offset_bit_length)
         self.set_number_bit_length = int (math.log (self.n_sets, 2))
         self.tag_bit_length = (self.block_addr_bit_length
                                -
                                self.set_number_bit_length)
 
         # Now create the sets.
+        set_options = set_options or {}
         self.array = [set_class (n_ways,
                                  self.tag_bit_length,
-                                 write_no_allocate)
+                                 write_no_allocate,
+                                 **set_options)
                       for foo in range (n_sets)]
+        if set_seed is not None:
+            for set_number, set_ in enumerate (self.array):
+                set_.rng = random.Random (setSeed (set_seed, set_number))
+        if isinstance (cold_miss_tracker, str):
+            cold_miss_tracker = Trackers.makeTracker (cold_miss_tracker)
+        self.cold_miss_tracker = cold_miss_tracker
+        if cold_miss_tracker is not None:
+            for set_number, set_ in enumerate (self.array):
+                set_.seen_tags = Trackers.SetView (
+                    cold_miss_tracker, set_number,
+                    self.set_number_bit_length)
+
+        # The fully associative LRU shadow, {block address: None} from
+        # least to most recently used. Misses of the cache that are
+        # not cold and miss in the shadow too are capacity misses.
+        self.shadow = None
+        self.shadow_capacity = n_sets * n_ways
+        self.capacity_miss_count = 0
+        if classify_misses:
+            self.shadow = collections.OrderedDict ()
+        self.eviction_listener = None
+
+    def __getstate__ (self):
+        """The listener is left out, see setEvictionListener."""
+        state = dict (self.__dict__)
+        state ['eviction_listener'] = None
+        return state
 
     def __splitAddr (self, addr):
         """ Returns a tuple with tag, set_number.
@@ -190,13 +322,137 @@ class Cache (object):
                            + self.array[i].__str__()
                            for i in range (len (self.array))])
 
+    def __classifiedAccess (self, tag, set_number, dirty_status):
+        """Access the set and the shadow, counting capacity misses."""
+        set_ = self.array [set_number]
+        conflict_miss_count = set_.conflict_miss_count
+        hit = set_.writeOrRead (tag, dirty_status)
+
+        block_addr = (tag << self.set_number_bit_length) | set_number
+        shadow = self.shadow
+        shadow_hit = block_addr in shadow
+        if shadow_hit:
+            del shadow [block_addr]
+        if (shadow_hit
+            or not (self.write_no_allocate and dirty_status == Set.dirty)):
+            shadow [block_addr] = None
+            if len (shadow) > self.shadow_capacity:
+                shadow.popitem (last = False)
+
+        if (set_.conflict_miss_count != conflict_miss_count
+            and not shadow_hit):
+            self.capacity_miss_count += 1
+        return hit
+
     def write (self, addr):
         tag, set_number = self.__splitAddr (addr)
-        self.array [set_number].write (tag)
+        if self.shadow is not None:
+            return self.__classifiedAccess (tag, set_number, Set.dirty)
+        return self.array [set_number].write (tag)
 
     def read (self, addr):
         tag, set_number = self.__splitAddr (addr)
-        self.array [set_number].read (tag)
+        if self.shadow is not None:
+            return self.__classifiedAccess (tag, set_number, Set.clean)
+        return self.array [set_number].read (tag)
+
+    def access (self, addr, dirty_status):
+        """Read (Set.clean) or write (Set.dirty) addr, return True on
+        a hit."""
+        tag, set_number = self.__splitAddr (addr)
+        if self.shadow is not None:
+            return self.__classifiedAccess (tag, set_number, dirty_status)
+        return self.array [set_number].writeOrRead (tag, dirty_status)
+
+    def probe (self, addr):
+        tag, set_number = self.__splitAddr (addr)
+        return self.array [set_number].probe (tag)
+
+    def insert (self, addr, dirty_status):
+        tag, set_number = self.__splitAddr (addr)
+        self.array [set_number].insert (tag, dirty_status)
+
+    def contains (self, addr):
+        """Return whether addr is in the cache, without counting an
+        access."""
+        tag, set_number = self.__splitAddr (addr)
+        return tag in self.array [set_number].dict
+
+    def markDirty (self, addr):
+        tag, set_number = self.__splitAddr (addr)
+        if tag in self.array [set_number].dict:
+            self.array [set_number].dict [tag] = Set.dirty
+
+    def markClean (self, addr):
+        """Mark addr clean, e.g. once written back by a coherence
+        protocol, so that its eviction writes nothing back."""
+        tag, set_number = self.__splitAddr (addr)
+        if tag in self.array [set_number].dict:
+            self.array [set_number].dict [tag] = Set.clean
+
+    def invalidate (self, addr, size = 1):
+        """Invalidate every block overlapping size bytes from addr.
+        Return Set.dirty if any of them was dirty, Set.clean if any was
+        present, None otherwise."""
+        status = None
+        first = addr - addr % self.block_size
+        for block_start in range (first, addr + size, self.block_size):
+            tag, set_number = self.__splitAddr (block_start)
+            block_status = self.array [set_number].invalidate (tag)
+            if status is None or block_status > status:
+                status = block_status
+        return status
+
+    def blockAddr (self, tag, set_number):
+        """Return the byte address of the first byte of the block."""
+        return (((tag << self.set_number_bit_length) | set_number)
+                << self.block_offset_bit_length)
+
+    def setEvictionListener (self, listener):
+        """Have listener (addr, dirty_status) called for every block
+        evicted from the cache, addr being the block's byte address.
+        None removes the listener. A pickled cache has no listener."""
+        self.eviction_listener = listener
+        for set_number, set_ in enumerate (self.array):
+            if listener is None:
+                set_.eviction_listener = None
+            else:
+                set_.eviction_listener = functools.partial (
+                    self.__onEviction, listener, set_number)
+
+    def __onEviction (self, listener, set_number, tag, dirty_status):
+        listener (self.blockAddr (tag, set_number), dirty_status)
+
+    def accessArrays (self, ops, addrs):
+        """Simulate a batch of accesses, as loaded by Trace.
+
+        ops: Set.clean for a read, Set.dirty for a write, per access.
+        addrs: integer byte address per access.
+
+        For numpy arrays the tags and set numbers of the whole batch
+        are computed with vectorized shifts and masks up front.
+        """
+        offset_bits = self.block_offset_bit_length
+        set_bits = self.set_number_bit_length
+        set_mask = (1 << set_bits) - 1
+        if numpy is not None and isinstance (addrs, numpy.ndarray):
+            block_addrs = addrs >> numpy.uint64 (offset_bits)
+            set_numbers = (block_addrs & numpy.uint64 (set_mask)).tolist ()
+            tags = (block_addrs >> numpy.uint64 (set_bits)).tolist ()
+            ops = ops.tolist ()
+        else:
+            block_addrs = [addr >> offset_bits for addr in addrs]
+            set_numbers = [block_addr & set_mask
+                           for block_addr in block_addrs]
+            tags = [block_addr >> set_bits for block_addr in block_addrs]
+        if self.shadow is not None:
+            for op, tag, set_number in itertools.izip (ops, tags,
+                                                       set_numbers):
+                self.__classifiedAccess (tag, set_number, op)
+            return
+        array = self.array
+        for op, tag, set_number in itertools.izip (ops, tags, set_numbers):
+            array [set_number].writeOrRead (tag, op)
 
     def printStats (self):
         separator = "=================="
@@ -219,34 +475,53 @@ class Cache (object):
         print "sets      :", self.n_sets
         print "ways      :", self.n_ways
         print separator
-        for count in ['access_count',
-                      'cold_miss_count',
-                      'conflict_miss_count']:
-            print (str (self.getCumulativeCount (count))
-                   + '\t'
-                   + ' '.join (count.split ('_')))
+        if self.shadow is None:
+            for count in ['access_count',
+                          'cold_miss_count',
+                          'conflict_miss_count']:
+                print (str (self.getCumulativeCount (count))
+                       + '\t'
+                       + ' '.join (count.split ('_')))
+        else:
+            print (str (self.getCumulativeCount ('access_count'))
+                   + '\taccess count')
+            for count, name in zip (self.getMissBreakdown (),
+                                    ['cold', 'capacity', 'conflict']):
+                print str (count) + '\t' + name + ' miss count'
         miss = (self.getCumulativeCount ('cold_miss_count')
                 + self.getCumulativeCount ('conflict_miss_count'))
         total = self.getCumulativeCount ('access_count')
         print ("Hit Rate: "
                + str (round (100 * (1 - float (miss) / total), 3))
                + "%")
+        if (self.cold_miss_tracker is not None
+            and self.cold_miss_tracker.getErrorBound () > 0):
+            print ("Cold misses possibly undercounted, per miss: "
+                   + str (round (100 * self.cold_miss_tracker.getErrorBound (),
+                                 3))
+                   + "%")
 
     def getCumulativeCount (self, attr_name):
         return sum ([set_.__getattribute__(attr_name)
                      for set_ in self.array])
 
+    def getSetCount (self, attr_name, set_number):
+        return getattr (self.array [set_number], attr_name)
+
+    def getSetCounts (self, attr_name):
+        """Return the list of the attr_name counts of every set."""
+        return [getattr (set_, attr_name) for set_ in self.array]
+
     def getStats (self):
         """Return list of vital cache statistics.
 
         Statistics:
         #accesses
         #cold misses
-        #conflict misses
+        #conflict misses (all the misses that are not cold)
         Hit Rate
 
-        TODO:
-        #capacity misses (???)
+        For capacity misses, see getMissBreakdown.
         """
         l1 = [self.getCumulativeCount (count)
                 for count in ['access_count',
@@ -255,6 +530,19 @@ class Cache (object):
         l2 = [self.getHitRate ()]
         return l1 + l2
 
+    def getMissBreakdown (self):
+        """Return [#compulsory, #capacity, #conflict] misses.
+
+        Needs the cache to be created with classify_misses = True.
+        """
+        if self.shadow is None:
+            raise ValueError ("Cache created without classify_misses")
+        cold = self.getCumulativeCount ('cold_miss_count')
+        not_cold = self.getCumulativeCount ('conflict_miss_count')
+        return [cold,
+                self.capacity_miss_count,
+                not_cold - self.capacity_miss_count]
+
     def getParameters(self):
         """Return list of parameters for this cache.
 
@@ -279,29 +567,34 @@ class Cache (object):
         return 100 * (1 - float (miss) / total)
 
 class LRUSet (Set):
+    __slots__ = ('recency_list',)
+
     def __init__ (self, *args, **kwargs):
         super(LRUSet, self).__init__ (*args, **kwargs)
-        # [least recently used, ...., most recently used]
-        self.recency_list = []
+        # {least recently used: None, ...., most recently used: None}
+        # An ordered dict gives O(1) removal from the middle, so the
+        # cost of an access does not grow with the associativity.
+        self.recency_list = collections.OrderedDict ()
 
     def pickBlockToEvict (self):
-        tag = self.recency_list [0]
-        self.recency_list = self.recency_list [1:]
+        tag, _ = self.recency_list.popitem (last = False)
         return tag
 
     def writeOrRead (self, tag, dirty_status):
-        super(LRUSet, self).writeOrRead (tag, dirty_status)
+        hit = super(LRUSet, self).writeOrRead (tag, dirty_status)
+        # If it was a write miss, and it is write no allocate,
+        # do nothing else.
+        if (self.write_no_allocate
+            and tag not in self.dict
+            and dirty_status == self.dirty): return hit
         # Remove the tag if it were there in the recency list
         # and put it at the end of the list.
-        try:
-            self.recency_list.remove (tag)
-        except:
-            # If it was a write miss, and it is write no allocate,
-            # do nothing else.
-            if (self.write_no_allocate
-                and tag not in self.dict
-                and dirty_status == self.dirty): return
-        self.recency_list.append (tag)
+        self.recency_list.pop (tag, None)
+        self.recency_list [tag] = None
+        return hit
+
+    def forgetBlock (self, tag):
+        self.recency_list.pop (tag, None)
 
 class LRUCache (Cache):
     def __init__ (self, *args, **kwargs):
@@ -309,6 +602,8 @@ class LRUCache (Cache):
         super(LRUCache, self).__init__ (*args, **kwargs)
 
 class LFUSet (Set):
+    __slots__ = ('frequency_dict',)
+
     def __init__ (self, *args, **kwargs):
         super(LFUSet, self).__init__ (*args, **kwargs)
         # {tag:frequency}
@@ -325,54 +620,567 @@ class LFUSet (Set):
                 return tag
 
     def writeOrRead (self, tag, dirty_status):
-        super(LFUSet, self).writeOrRead (tag, dirty_status)
+        hit = super(LFUSet, self).writeOrRead (tag, dirty_status)
 
         # If it was a write miss, and it is write no allocate,
         # do nothing else.
         if (self.write_no_allocate
             and tag not in self.dict
-            and dirty_status == self.dirty): return
+            and dirty_status == self.dirty): return hit
 
         # Update the frequency value of that tag
         try:
             self.frequency_dict [tag] += 1
         except:
             self.frequency_dict [tag] = 1
+        return hit
+
+    def forgetBlock (self, tag):
+        self.frequency_dict.pop (tag, None)
 
 class LFUCache (Cache):
     def __init__ (self, *args, **kwargs):
         kwargs ['set_class'] = LFUSet
         super(LFUCache, self).__init__ (*args, **kwargs)
 
+class BucketLFUSet (Set):
+    """LFU set with O(1) hits and evictions (O(log ways) for tie_break
+    'fifo').
+
+    Tags are grouped in buckets by frequency and the lowest frequency
+    in use is tracked, so nothing is sorted or scanned on a miss.
+    Frequencies are those of the blocks currently in the set: an
+    evicted tag starts again from 1 when it is brought back.
+
+    tie_break: which of the least frequently used tags to evict.
+    'lru'    -> the least recently used one
+    'fifo'   -> the one brought into the set first (kept in a heap
+                per frequency, as promotions reorder the buckets)
+    'random' -> any of them
+    decay_interval: if given, halve all frequencies every
+                    decay_interval accesses to the set (aging).
+    """
+    tie_breaks = ('lru', 'fifo', 'random')
+    __slots__ = ('tie_break', 'decay_interval', 'frequency_dict', 'buckets',
+                 'min_frequency', 'bucket_lists', 'list_positions',
+                 'bucket_heaps')
+
+    def __init__ (self,
+                  size,
+                  tag_bit_length,
+                  write_no_allocate,
+                  tie_break = 'lru',
+                  decay_interval = None):
+        super(BucketLFUSet, self).__init__ (size,
+                                            tag_bit_length,
+                                            write_no_allocate)
+        if tie_break not in self.tie_breaks:
+            raise ValueError ("Unknown tie break: " + str (tie_break))
+        self.tie_break = tie_break
+        self.decay_interval = decay_interval
+        # {tag:frequency}
+        self.frequency_dict = {}
+        # {frequency: {tag:stamp}}, each bucket in order of arrival.
+        # stamp is the access number at which the tag was brought in
+        # (fifo) or last touched (lru, random).
+        self.buckets = {}
+        self.min_frequency = 0
+        # random: {frequency: [tags of the bucket]} and {tag: its index
+        # in its list}, to draw one in O(1).
+        self.bucket_lists = {}
+        self.list_positions = {}
+        # fifo: {frequency: heap of (stamp, tag)}, stale for the tags
+        # that have left the bucket since.
+        self.bucket_heaps = {}
+
+    def __addToBucket (self, tag, frequency, stamp):
+        try:
+            self.buckets [frequency] [tag] = stamp
+        except KeyError:
+            self.buckets [frequency] = collections.OrderedDict (
+                [(tag, stamp)])
+        self.frequency_dict [tag] = frequency
+        if self.tie_break == 'random':
+            tags = self.bucket_lists.setdefault (frequency, [])
+            self.list_positions [tag] = len (tags)
+            tags.append (tag)
+        elif self.tie_break == 'fifo':
+            heap = self.bucket_heaps.setdefault (frequency, [])
+            heapq.heappush (heap, (stamp, tag))
+            bucket = self.buckets [frequency]
+            if len (heap) > 2 * len (bucket):
+                heap [:] = itertools.izip (bucket.itervalues (), bucket)
+                heapq.heapify (heap)
+
+    def __removeFromBucket (self, tag):
+        frequency = self.frequency_dict.pop (tag)
+        bucket = self.buckets [frequency]
+        stamp = bucket.pop (tag)
+        if self.tie_break == 'random':
+            # Move the last tag of the list in its place.
+            tags = self.bucket_lists [frequency]
+            position = self.list_positions.pop (tag)
+            last_tag = tags.pop ()
+            if last_tag != tag:
+                tags [position] = last_tag
+                self.list_positions [last_tag] = position
+        if not bucket:
+            del self.buckets [frequency]
+            self.bucket_lists.pop (frequency, None)
+            self.bucket_heaps.pop (frequency, None)
+            if self.min_frequency == frequency:
+                self.min_frequency = frequency + 1
+        return frequency, stamp
+
+    def __decay (self):
+        entries = sorted ((stamp, tag, self.frequency_dict [tag])
+                          for bucket in self.buckets.values ()
+                          for tag, stamp in bucket.iteritems ())
+        self.buckets = {}
+        self.bucket_lists = {}
+        self.list_positions = {}
+        self.bucket_heaps = {}
+        for stamp, tag, frequency in entries:
+            self.__addToBucket (tag, max (1, frequency / 2), stamp)
+        if self.buckets:
+            self.min_frequency = min (self.buckets)
+
+    def pickBlockToEvict (self):
+        bucket = self.buckets [self.min_frequency]
+        if self.tie_break == 'lru':
+            tag = next (iter (bucket))
+        elif self.tie_break == 'fifo':
+            heap = self.bucket_heaps [self.min_frequency]
+            while True:
+                stamp, tag = heapq.heappop (heap)
+                if bucket.get (tag) == stamp:
+                    break
+        else:
+            tag = (self.rng or random).choice (
+                self.bucket_lists [self.min_frequency])
+        self.__removeFromBucket (tag)
+        return tag
+
+    def writeOrRead (self, tag, dirty_status):
+        hit = super(BucketLFUSet, self).writeOrRead (tag, dirty_status)
+
+        if (self.decay_interval
+            and self.access_count % self.decay_interval == 0):
+            self.__decay ()
+
+        # If it was a write miss, and it is write no allocate,
+        # do nothing else.
+        if (self.write_no_allocate
+            and tag not in self.dict
+            and dirty_status == self.dirty): return hit
+
+        if tag in self.frequency_dict:
+            frequency, stamp = self.__removeFromBucket (tag)
+            if self.tie_break != 'fifo':
+                stamp = self.access_count
+            self.__addToBucket (tag, frequency + 1, stamp)
+        else:
+            self.__addToBucket (tag, 1, self.access_count)
+            self.min_frequency = 1
+        return hit
+
+    def forgetBlock (self, tag):
+        if tag in self.frequency_dict:
+            self.__removeFromBucket (tag)
+            if self.buckets:
+                self.min_frequency = min (self.buckets)
+
+class BucketLFUCache (Cache):
+    """LFU cache built out of BucketLFUSet.
+
+    Takes the tie_break and decay_interval keyword arguments of
+    BucketLFUSet on top of the usual Cache ones.
+    """
+    def __init__ (self, *args, **kwargs):
+        kwargs ['set_class'] = BucketLFUSet
+        set_options = kwargs.get ('set_options') or {}
+        for option in ['tie_break', 'decay_interval']:
+            if option in kwargs:
+                set_options [option] = kwargs.pop (option)
+        kwargs ['set_options'] = set_options
+        super(BucketLFUCache, self).__init__ (*args, **kwargs)
+
 class FIFOSet (Set):
+    __slots__ = ('tag_queue',)
+
     def __init__ (self, *args, **kwargs):
         super(FIFOSet, self).__init__ (*args, **kwargs)
-        # [oldest tag added to set, ..., newest tag added to set]
-        self.tag_queue = []
+        # {oldest tag added to set: None, ..., newest tag added to set: None}
+        # Ordered dict: O(1) membership test and O(1) pop of the oldest.
+        self.tag_queue = collections.OrderedDict ()
 
     def pickBlockToEvict (self):
-        tag = self.tag_queue [0]
-        self.tag_queue = self.tag_queue [1:]
+        tag, _ = self.tag_queue.popitem (last = False)
         return tag
 
     def writeOrRead (self, tag, dirty_status):
-        super(FIFOSet, self).writeOrRead (tag, dirty_status)
+        hit = super(FIFOSet, self).writeOrRead (tag, dirty_status)
 
         # If it was a write miss, and it is write no allocate,
         # do nothing else.
         if (self.write_no_allocate
             and tag not in self.dict
-            and dirty_status == self.dirty): return
+            and dirty_status == self.dirty): return hit
 
         # If it is a new tag, add it as the newest tag
         if tag not in self.tag_queue:
-            self.tag_queue.append (tag)
+            self.tag_queue [tag] = None
+        return hit
+
+    def forgetBlock (self, tag):
+        self.tag_queue.pop (tag, None)
 
 class FIFOCache (Cache):
     def __init__ (self, *args, **kwargs):
         kwargs ['set_class'] = FIFOSet
         super(FIFOCache, self).__init__ (*args, **kwargs)
 
+class WaySet (Set):
+    """Set whose replacement state is kept per way, as in hardware.
+
+    Subclasses keep their state in arrays indexed by way and define
+    victimWay (the way to evict from a full set) and touchWay (update
+    for a hit, or for a fill when inserted is True). releaseWay is
+    called when a way is freed.
+    """
+    __slots__ = ('ways', 'way_of', 'free_ways')
+
+    def __init__ (self, *args, **kwargs):
+        super(WaySet, self).__init__ (*args, **kwargs)
+        # The tag in each way (None if free) and {tag: way}.
+        self.ways = [None] * self.capacity
+        self.way_of = {}
+        self.free_ways = range (self.capacity - 1, -1, -1)
+
+    def __freeWay (self, tag):
+        way = self.way_of.pop (tag)
+        self.ways [way] = None
+        self.free_ways.append (way)
+        self.releaseWay (way)
+
+    def releaseWay (self, way):
+        pass
+
+    def pickBlockToEvict (self):
+        tag = self.ways [self.victimWay ()]
+        self.__freeWay (tag)
+        return tag
+
+    def writeOrRead (self, tag, dirty_status):
+        hit = super(WaySet, self).writeOrRead (tag, dirty_status)
+        if tag in self.way_of:
+            self.touchWay (self.way_of [tag], False)
+        elif tag in self.dict:
+            way = self.free_ways.pop ()
+            self.ways [way] = tag
+            self.way_of [tag] = way
+            self.touchWay (way, True)
+        return hit
+
+    def forgetBlock (self, tag):
+        if tag in self.way_of:
+            self.__freeWay (tag)
+
+class TreePLRUSet (WaySet):
+    """Tree pseudo-LRU: a binary tree of bits over the ways (a power of
+    2), each pointing to the half less recently used. O(log ways)."""
+    __slots__ = ('tree',)
+
+    def __init__ (self, *args, **kwargs):
+        super(TreePLRUSet, self).__init__ (*args, **kwargs)
+        if self.capacity & (self.capacity - 1):
+            raise ValueError ("Tree PLRU needs a power of 2 ways")
+        # Node i has children 2i + 1 (bit 0) and 2i + 2 (bit 1).
+        self.tree = [0] * (self.capacity - 1)
+
+    def victimWay (self):
+        node = 0
+        while node < self.capacity - 1:
+            node = 2 * node + 1 + self.tree [node]
+        return node - (self.capacity - 1)
+
+    def touchWay (self, way, inserted):
+        node = way + self.capacity - 1
+        while node:
+            parent = (node - 1) / 2
+            # Point away from the way just used.
+            self.tree [parent] = 1 if node == 2 * parent + 1 else 0
+            node = parent
+
+class TreePLRUCache (Cache):
+    def __init__ (self, *args, **kwargs):
+        kwargs ['set_class'] = TreePLRUSet
+        super(TreePLRUCache, self).__init__ (*args, **kwargs)
+
+class BitPLRUSet (WaySet):
+    """Bit pseudo-LRU (MRU bits): a bit per way set on use, all but the
+    last one cleared when they are all set. Evicts the first way with
+    its bit clear."""
+    __slots__ = ('mru_bits',)
+
+    def __init__ (self, *args, **kwargs):
+        super(BitPLRUSet, self).__init__ (*args, **kwargs)
+        self.mru_bits = 0
+
+    def victimWay (self):
+        # The lowest clear bit.
+        return (~self.mru_bits & (self.mru_bits + 1)).bit_length () - 1
+
+    def touchWay (self, way, inserted):
+        self.mru_bits |= 1 << way
+        if self.mru_bits == (1 << self.capacity) - 1:
+            self.mru_bits = 1 << way
+
+class BitPLRUCache (Cache):
+    def __init__ (self, *args, **kwargs):
+        kwargs ['set_class'] = BitPLRUSet
+        super(BitPLRUCache, self).__init__ (*args, **kwargs)
+
+class PolicySelector (object):
+    """Saturating counter shared by the sets of a DRRIPCache (PSEL).
+    Misses in SRRIP leader sets count up, in BRRIP leader sets down."""
+    def __init__ (self, bit_length = 10):
+        self.max_value = (1 << bit_length) - 1
+        self.value = self.max_value / 2
+
+    def count (self, srrip_miss):
+        if srrip_miss:
+            self.value = min (self.max_value, self.value + 1)
+        else:
+            self.value = max (0, self.value - 1)
+
+    def useBRRIP (self):
+        return self.value > self.max_value / 2
+
+class RRIPSet (WaySet):
+    """Re-reference interval prediction (Jaleel et al., ISCA 2010).
+
+    Each way has a re-reference prediction value (RRPV) of rrpv_bit_length
+    bits; a hit sets it to 0, the victim is the first way predicted
+    to be re-referenced furthest (RRPV at its maximum), ageing all
+    ways until there is one.
+
+    insertion:
+    'srrip' -> new blocks get RRPV max - 1
+    'brrip' -> new blocks get RRPV max, max - 1 once in
+               brrip_interval (at random)
+    'drrip' -> set dueling between the two through selector, a
+               PolicySelector, with role 'srrip' or 'brrip' for leader
+               sets and None for followers (see DRRIPCache)
+    """
+    insertions = ('srrip', 'brrip', 'drrip')
+    __slots__ = ('stored', 'buckets', 'offset', 'max_rrpv', 'insertion',
+                 'brrip_interval', 'selector', 'role')
+
+    def __init__ (self,
+                  size,
+                  tag_bit_length,
+                  write_no_allocate,
+                  insertion = 'srrip',
+                  rrpv_bit_length = 2,
+                  brrip_interval = 32,
+                  selector = None):
+        super(RRIPSet, self).__init__ (size,
+                                       tag_bit_length,
+                                       write_no_allocate)
+        if insertion not in self.insertions:
+            raise ValueError ("Unknown RRIP insertion: " + str (insertion))
+        self.max_rrpv = (1 << rrpv_bit_length) - 1
+        # Ageing adds to offset instead of to every RRPV: the RRPV of
+        # a way in use is stored [way] + offset. buckets maps each
+        # stored value to the bitmask of its ways, so it has at most
+        # max_rrpv + 1 keys.
+        self.stored = [None] * size
+        self.buckets = {}
+        self.offset = 0
+        self.insertion = insertion
+        self.brrip_interval = brrip_interval
+        self.selector = selector
+        self.role = None
+
+    def releaseWay (self, way):
+        stored = self.stored [way]
+        if stored is None:
+            return
+        self.stored [way] = None
+        ways = self.buckets [stored] & ~(1 << way)
+        if ways:
+            self.buckets [stored] = ways
+        else:
+            del self.buckets [stored]
+
+    def victimWay (self):
+        oldest = max (self.buckets)
+        # Age all ways until the oldest ones reach the maximum.
+        self.offset = self.max_rrpv - oldest
+        ways = self.buckets [oldest]
+        return (ways & -ways).bit_length () - 1
+
+    def __insertionPolicy (self):
+        if self.insertion != 'drrip':
+            return self.insertion
+        if self.role is not None:
+            self.selector.count (self.role == 'srrip')
+            return self.role
+        return 'brrip' if self.selector.useBRRIP () else 'srrip'
+
+    def touchWay (self, way, inserted):
+        if not inserted:
+            rrpv = 0
+        elif (self.__insertionPolicy () == 'brrip'
+              and (self.rng or random).randrange (self.brrip_interval)):
+            rrpv = self.max_rrpv
+        else:
+            rrpv = self.max_rrpv - 1
+        self.releaseWay (way)
+        stored = rrpv - self.offset
+        self.stored [way] = stored
+        self.buckets [stored] = self.buckets.get (stored, 0) | (1 << way)
+
+class RRIPCache (Cache):
+    """Cache of RRIPSet, takes the insertion, rrpv_bit_length and
+    brrip_interval keyword arguments of RRIPSet."""
+    def __init__ (self, *args, **kwargs):
+        kwargs ['set_class'] = RRIPSet
+        set_options = kwargs.get ('set_options') or {}
+        for option in ['insertion', 'rrpv_bit_length', 'brrip_interval']:
+            if option in kwargs:
+                set_options [option] = kwargs.pop (option)
+        kwargs ['set_options'] = set_options
+        super(RRIPCache, self).__init__ (*args, **kwargs)
+
+class SRRIPCache (RRIPCache):
+    def __init__ (self, *args, **kwargs):
+        kwargs ['insertion'] = 'srrip'
+        super(SRRIPCache, self).__init__ (*args, **kwargs)
+
+class BRRIPCache (RRIPCache):
+    def __init__ (self, *args, **kwargs):
+        kwargs ['insertion'] = 'brrip'
+        super(BRRIPCache, self).__init__ (*args, **kwargs)
+
+class DRRIPCache (RRIPCache):
+    """Dynamic RRIP: sets 0, 32, 64... always use SRRIP and sets 31, 63,
+    95... (or the last set, in caches of fewer than 32 sets) BRRIP,
+    the others follow whichever of the two misses less."""
+    def __init__ (self, *args, **kwargs):
+        kwargs ['insertion'] = 'drrip'
+        selector = PolicySelector ()
+        set_options = dict (kwargs.get ('set_options') or {},
+                            selector = selector)
+        kwargs ['set_options'] = set_options
+        super(DRRIPCache, self).__init__ (*args, **kwargs)
+        self.selector = selector
+        for set_number, set_ in enumerate (self.array):
+            if set_number % 32 == 0:
+                set_.role = 'srrip'
+            elif (set_number % 32 == 31
+                  or (self.n_sets < 32 and set_number == self.n_sets - 1)):
+                set_.role = 'brrip'
+
+def computeNextUses (block_addrs):
+    """Return, for each access to block_addrs [i], the index of the
+    next access to the same block (len (block_addrs) if none)."""
+    n = len (block_addrs)
+    if numpy is not None:
+        block_addrs = numpy.asarray (block_addrs, dtype = numpy.uint64)
+        order = numpy.argsort (block_addrs, kind = 'mergesort')
+        next_uses = numpy.full (n, n, dtype = numpy.int64)
+        same = block_addrs [order [:-1]] == block_addrs [order [1:]]
+        next_uses [order [:-1] [same]] = order [1:] [same]
+        return next_uses.tolist ()
+    next_uses = [n] * n
+    last_use = {}
+    for i in xrange (n - 1, -1, -1):
+        next_uses [i] = last_use.get (block_addrs [i], n)
+        last_use [block_addrs [i]] = i
+    return next_uses
+
+class OPTSet (Set):
+    """Belady's optimal replacement: evicts the block used again the
+    furthest in the future. upcoming is the next use of the access
+    being simulated, set by OPTCache."""
+    __slots__ = ('next_use', 'heap', 'upcoming')
+
+    def __init__ (self, *args, **kwargs):
+        super(OPTSet, self).__init__ (*args, **kwargs)
+        # {tag: index of its next access}, and a heap of
+        # (-next use, tag), stale once next_use has moved on.
+        self.next_use = {}
+        self.heap = []
+        self.upcoming = None
+
+    def pickBlockToEvict (self):
+        while True:
+            upcoming, tag = heapq.heappop (self.heap)
+            if self.next_use.get (tag) == -upcoming:
+                del self.next_use [tag]
+                return tag
+
+    def writeOrRead (self, tag, dirty_status):
+        hit = super(OPTSet, self).writeOrRead (tag, dirty_status)
+        if tag in self.dict:
+            self.next_use [tag] = self.upcoming
+            heapq.heappush (self.heap, (-self.upcoming, tag))
+            if len (self.heap) > 2 * self.capacity:
+                # Drop the stale entries.
+                self.heap = [(-upcoming, tag) for tag, upcoming
+                             in self.next_use.iteritems ()]
+                heapq.heapify (self.heap)
+        return hit
+
+    def forgetBlock (self, tag):
+        self.next_use.pop (tag, None)
+
+class OPTCache (Cache):
+    """Offline optimal cache, for the trace of byte addresses addrs
+    (or trace file filename) given up front: every access must be the
+    next one of that trace. Bounds the hit rate any policy can get
+    (among those that fill every miss)."""
+    def __init__ (self, *args, **kwargs):
+        addrs = kwargs.pop ('addrs', None)
+        filename = kwargs.pop ('filename', None)
+        kwargs ['set_class'] = OPTSet
+        super(OPTCache, self).__init__ (*args, **kwargs)
+        if filename is not None:
+            import Trace
+            addrs = Trace.readTraceArrays (filename) [1]
+        if numpy is not None and isinstance (addrs, numpy.ndarray):
+            block_addrs = addrs >> numpy.uint64 (self.block_offset_bit_length)
+        else:
+            block_addrs = [addr >> self.block_offset_bit_length
+                           for addr in addrs]
+        self.next_uses = computeNextUses (block_addrs)
+        self.position = 0
+        self.set_mask = self.n_sets - 1
+
+    def access (self, addr, dirty_status):
+        try:
+            addr = int (addr, 0)
+        except TypeError:
+            pass
+        set_number = (addr >> self.block_offset_bit_length) & self.set_mask
+        self.array [set_number].upcoming = self.next_uses [self.position]
+        self.position += 1
+        return super(OPTCache, self).access (addr, dirty_status)
+
+    def read (self, addr):
+        return self.access (addr, Set.clean)
+
+    def write (self, addr):
+        return self.access (addr, Set.dirty)
+
+    def accessArrays (self, ops, addrs):
+        if numpy is not None and isinstance (addrs, numpy.ndarray):
+            ops, addrs = ops.tolist (), addrs.tolist ()
+        for op, addr in itertools.izip (ops, addrs):
+            self.access (addr, op)
+
 if __name__ == "__main__":
     foo = FIFOCache (16, 3, 1, '0xb00', write_no_allocate = False)
     foo.write (0xa2b)
@@ -0,0 +1,168 @@
+#! /usr/bin/python
+
+"""Snapshots of simulations, to resume them or branch them off.
+
+A snapshot is the pickled (protocol 2, zlib compressed) state of a
+cache, FlatCache, NativeCache or CacheHierarchy: the blocks and their
+dirty bits, the replacement metadata, the counters and the blocks
+seen so far. With it go the state of the random module and the
+number of trace accesses simulated so far, so that
+
+    cache, offset = restore (snapshot (cache, offset))
+    simulate_file_from (cache, filename, offset)
+
+gives the same statistics as an uninterrupted run. The exception is
+random replacement in Set based caches (Cache, BucketLFUCache with
+tie_break = 'random') without set_seed, which picks from the order of
+a dict that a restored dict may not keep; FlatCache's random policy
+resumes exactly.
+
+Eviction listeners are not part of a snapshot, CacheHierarchy attaches
+its own again.
+"""
+
+import cPickle as pickle
+import random
+import sys
+import zlib
+
+from Cache import *
+from FlatCache import FlatCache
+import Trace
+
+def snapshot (cache, trace_offset = 0):
+    """Return the snapshot of cache after trace_offset accesses, as a
+    string."""
+    return zlib.compress (pickle.dumps ({'cache': cache,
+                                         'random_state': random.getstate (),
+                                         'trace_offset': trace_offset},
+                                        2))
+
+def restore (data, restore_random = True):
+    """Return (cache, trace offset) from a snapshot. restore_random:
+    also put the random module back in the state of the snapshot."""
+    state = pickle.loads (zlib.decompress (data))
+    if restore_random:
+        random.setstate (state ['random_state'])
+    return state ['cache'], state ['trace_offset']
+
+def save (filename, cache, trace_offset = 0):
+    """Write the snapshot of cache to filename."""
+    f = open (filename, 'wb')
+    f.write (snapshot (cache, trace_offset))
+    f.close ()
+
+def load (filename, restore_random = True):
+    """Return (cache, trace offset) from the snapshot in filename."""
+    f = open (filename, 'rb')
+    data = f.read ()
+    f.close ()
+    return restore (data, restore_random)
+
+def fork (cache):
+    """Return an independent copy of cache, leaving the random module
+    alone."""
+    return restore (snapshot (cache), restore_random = False) [0]
+
+def _residentBlocks (cache):
+    """Return [(block address, dirty status)] of the blocks in cache,
+    each set's from the first to the last to evict (as far as the
+    policy keeps an order)."""
+    if isinstance (cache, FlatCache):
+        slots = [slot for slot in range (cache.n_sets * cache.n_ways)
+                 if cache.valid [slot]]
+        slots.sort (key = lambda slot: (cache.frequencies [slot]
+                                        if cache.policy == 'lfu' else 0,
+                                        cache.stamps [slot]))
+        return [(cache.blocks [slot], cache.dirty [slot]) for slot in slots]
+    blocks = []
+    for set_number, set_ in enumerate (cache.array):
+        order = (getattr (set_, 'recency_list', None)
+                 or getattr (set_, 'tag_queue', None)
+                 or set_.dict)
+        blocks.extend (((tag << cache.set_number_bit_length) | set_number,
+                        set_.dict [tag])
+                       for tag in order)
+    return blocks
+
+def _seenBlocks (cache):
+    if isinstance (cache, FlatCache):
+        if cache.seen_blocks is None:
+            # NativeCache keeps them in the kernel.
+            return cache.__getstate__ () ['seen_blocks']
+        return list (cache.seen_blocks)
+    return [(tag << cache.set_number_bit_length) | set_number
+            for set_number, set_ in enumerate (cache.array)
+            for tag in set_.seen_tags]
+
+_counts = ['access_count', 'cold_miss_count', 'conflict_miss_count',
+           'writeback_count']
+
+def _getCounts (cache, set_number):
+    if isinstance (cache, FlatCache):
+        return [cache.counts [count] [set_number] for count in _counts]
+    return [getattr (cache.array [set_number], count) for count in _counts]
+
+def _setCounts (cache, set_number, counts):
+    for count, value in zip (_counts, counts):
+        if isinstance (cache, FlatCache):
+            cache.counts [count] [set_number] = value
+        else:
+            setattr (cache.array [set_number], count, value)
+
+def warmCopy (cache, new_cache):
+    """Fill new_cache, empty and of the same geometry as cache but of
+    any class or policy, with the blocks of cache, and give it the
+    counters and the blocks seen of cache. The blocks go in in their
+    replacement order, replacement metadata beyond that (frequencies)
+    is not carried over. Return new_cache."""
+    if ((new_cache.n_sets, new_cache.n_ways, new_cache.block_size)
+        != (cache.n_sets, cache.n_ways, cache.block_size)):
+        raise ValueError ("Caches of different geometry")
+    if getattr (cache, 'cold_miss_tracker', None) is not None:
+        raise ValueError ("Blocks seen by a tracker can not be listed,"
+                          " fork the cache instead")
+    offset = cache.block_offset_bit_length
+    for block_addr, dirty_status in _residentBlocks (cache):
+        new_cache.insert (block_addr << offset, dirty_status)
+    for block_addr in _seenBlocks (cache):
+        # A probe counts as an access and maybe a miss, the counters
+        # are set below anyway.
+        if not new_cache.contains (block_addr << offset):
+            new_cache.probe (block_addr << offset)
+    for set_number in range (cache.n_sets):
+        _setCounts (new_cache, set_number, _getCounts (cache, set_number))
+    return new_cache
+
+def simulate_file_from (cache, filename, trace_offset = 0,
+                        checkpoint_filename = None,
+                        checkpoint_interval = None):
+    """Simulate trace file filename on cache, skipping its first
+    trace_offset accesses. If checkpoint_filename is given, save a
+    snapshot to it every checkpoint_interval accesses (or so: at the
+    end of the chunk that crosses the interval) and at the end.
+    Return the number of accesses of the trace."""
+    position = 0
+    last_checkpoint = trace_offset
+    for ops, addrs in Trace.genTraceChunks (filename):
+        if position + len (ops) > trace_offset:
+            skip = max (0, trace_offset - position)
+            cache.accessArrays (ops [skip:], addrs [skip:])
+        position += len (ops)
+        if (checkpoint_filename is not None
+            and checkpoint_interval is not None
+            and position - last_checkpoint >= checkpoint_interval):
+            save (checkpoint_filename, cache, position)
+            last_checkpoint = position
+    if checkpoint_filename is not None:
+        save (checkpoint_filename, cache, max (position, trace_offset))
+    return position
+
+if __name__ == '__main__':
+    if len (sys.argv) != 3:
+        print 'Usage: ./Checkpoint.py <snapshot> <trace file>'
+        print 'Resumes the simulation of the snapshot on the trace file.'
+        exit (1)
+    cache, trace_offset = load (sys.argv [1])
+    simulate_file_from (cache, sys.argv [2], trace_offset, sys.argv [1])
+    cache.printStats ()
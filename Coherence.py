@@ -0,0 +1,331 @@
+#! /usr/bin/python
+
+"""Multi-core simulation: private caches kept coherent, a shared last
+level.
+
+Every core has its own cache (any Cache, FlatCache or NativeCache of
+the same block size), fed by its own trace; below them all is a
+shared cache (or directly memory, if there is none). A directory
+keeps the coherence state of every block held by a private cache, as
+in a snooping MSI or MESI protocol:
+
+M (modified)  -> the only copy, dirty.
+E (exclusive) -> the only copy, clean (MESI only: a read miss no
+                 other core holds the block for). Written silently.
+S (shared)    -> a clean copy, maybe among others. Writing it
+                 invalidates the others first (an upgrade).
+
+A write miss invalidates every other copy, a read miss turns a
+modified copy elsewhere into a shared one, written back to the shared
+cache. Both take the block from the core that had it modified (a
+cache to cache transfer) instead of from the shared cache.
+
+A miss on a block that was invalidated by another core's write is a
+coherence miss: true sharing if the word accessed was written by
+another core since, false sharing if only other words of the block
+were.
+"""
+
+import functools
+import heapq
+import sys
+
+from Cache import *
+import MatrixTrace
+import Trace
+
+_counts = ['upgrade_count', 'invalidations_sent', 'invalidations_received',
+           'coherence_miss_count', 'true_sharing_miss_count',
+           'false_sharing_miss_count', 'cache_to_cache_count',
+           'writeback_count']
+
+class MultiCoreSystem (object):
+    """caches: the private cache of each core.
+    shared_cache: the last level, None for memory right below.
+    protocol: 'msi' or 'mesi'.
+    word_size: bytes of the words true and false sharing tell apart.
+    """
+    protocols = ('msi', 'mesi')
+
+    def __init__ (self, caches, shared_cache = None, protocol = 'mesi',
+                  word_size = 4):
+        if protocol not in self.protocols:
+            raise ValueError ("Unknown protocol: " + str (protocol))
+        if len (set (cache.block_size for cache in caches)) > 1:
+            raise ValueError ("Private caches need equal block sizes")
+        if (shared_cache is not None
+            and shared_cache.block_size < caches [0].block_size):
+            raise ValueError ("Shared cache blocks smaller than private")
+        self.caches = caches
+        self.shared_cache = shared_cache
+        self.protocol = protocol
+        self.word_size = word_size
+        self.block_size = caches [0].block_size
+        self.block_offset_bit_length = caches [0].block_offset_bit_length
+        # {block address: {core: 'M', 'E' or 'S'}}
+        self.directory = {}
+        # {block address: {core it was invalidated in: set of the
+        #                  words written by others since}}
+        self.invalidated = {}
+        # Per core: {count name: value}
+        self.counts = [dict ((count, 0) for count in _counts)
+                       for cache in caches]
+        self.memory_read_count = 0
+        self.memory_write_count = 0
+        # Blocks evicted from each private cache, not handled yet.
+        self.victims = [[] for cache in caches]
+        self.__attachListeners ()
+
+    def __attachListeners (self):
+        for core, cache in enumerate (self.caches):
+            cache.setEvictionListener (
+                functools.partial (self.__onEviction, core))
+        if self.shared_cache is not None:
+            self.shared_cache.setEvictionListener (self.__onSharedEviction)
+
+    def __setstate__ (self, state):
+        # Pickled caches come without listeners.
+        self.__dict__.update (state)
+        self.__attachListeners ()
+
+    def __onEviction (self, core, addr, dirty_status):
+        self.victims [core].append ((addr, dirty_status))
+
+    def __onSharedEviction (self, addr, dirty_status):
+        if dirty_status == Set.dirty:
+            self.__memoryAccess (Set.dirty)
+
+    def __sharedAccess (self, addr, dirty_status):
+        """Read a block from, or write one back to, the shared cache."""
+        if self.shared_cache is None:
+            self.__memoryAccess (dirty_status)
+        elif (not self.shared_cache.access (addr, dirty_status)
+              and (dirty_status == Set.clean
+                   or self.shared_cache.write_no_allocate)):
+            # Whole-block write backs need not fetch the block.
+            self.__memoryAccess (dirty_status)
+
+    def __memoryAccess (self, dirty_status):
+        if dirty_status == Set.dirty:
+            self.memory_write_count += 1
+        else:
+            self.memory_read_count += 1
+
+    def __handleVictims (self, core):
+        victims = self.victims [core]
+        while victims:
+            addr, dirty_status = victims.pop (0)
+            block_addr = addr >> self.block_offset_bit_length
+            states = self.directory [block_addr]
+            del states [core]
+            if not states:
+                del self.directory [block_addr]
+            if dirty_status == Set.dirty:
+                self.counts [core] ['writeback_count'] += 1
+                self.__sharedAccess (addr, Set.dirty)
+
+    def __invalidateOthers (self, core, block_addr, word):
+        """Invalidate the copies of block_addr of cores other than core.
+        Return True if one of them was modified (and so supplies the
+        block)."""
+        supplied = False
+        states = self.directory [block_addr]
+        addr = block_addr << self.block_offset_bit_length
+        for other in [other for other in states if other != core]:
+            if states.pop (other) == 'M':
+                supplied = True
+            self.caches [other].invalidate (addr, self.block_size)
+            self.counts [core] ['invalidations_sent'] += 1
+            self.counts [other] ['invalidations_received'] += 1
+            self.invalidated.setdefault (block_addr, {}) [other] = set ([word])
+        return supplied
+
+    def __countSharingMiss (self, core, block_addr, word):
+        invalidated = self.invalidated.get (block_addr)
+        if invalidated is None or core not in invalidated:
+            return
+        words = invalidated.pop (core)
+        if not invalidated:
+            del self.invalidated [block_addr]
+        counts = self.counts [core]
+        counts ['coherence_miss_count'] += 1
+        if word in words:
+            counts ['true_sharing_miss_count'] += 1
+        else:
+            counts ['false_sharing_miss_count'] += 1
+
+    def access (self, core, addr, dirty_status):
+        """Read (Set.clean) or write (Set.dirty) addr from core, return
+        True on a hit in its private cache."""
+        try:
+            addr = int (addr, 0)
+        except TypeError:
+            pass
+        block_addr = addr >> self.block_offset_bit_length
+        word = addr / self.word_size
+        states = self.directory.setdefault (block_addr, {})
+        state = states.get (core)
+        cache = self.caches [core]
+        if state is None:
+            self.__countSharingMiss (core, block_addr, word)
+            if dirty_status == Set.dirty:
+                supplied = self.__invalidateOthers (core, block_addr, word)
+            else:
+                supplied = False
+                block_start = block_addr << self.block_offset_bit_length
+                for other, other_state in states.items ():
+                    if other_state == 'M':
+                        # Write it back and keep a clean copy.
+                        self.caches [other].markClean (block_start)
+                        self.counts [other] ['writeback_count'] += 1
+                        self.__sharedAccess (block_start, Set.dirty)
+                        supplied = True
+                    states [other] = 'S'
+            if supplied:
+                self.counts [core] ['cache_to_cache_count'] += 1
+            elif not (dirty_status == Set.dirty and cache.write_no_allocate):
+                self.__sharedAccess (addr, Set.clean)
+        elif dirty_status == Set.dirty and state == 'S':
+            self.counts [core] ['upgrade_count'] += 1
+            self.__invalidateOthers (core, block_addr, word)
+        if dirty_status == Set.dirty:
+            for other, words in self.invalidated.get (block_addr,
+                                                      {}).items ():
+                if other != core:
+                    words.add (word)
+        hit = cache.access (addr, dirty_status)
+        if cache.contains (addr):
+            if dirty_status == Set.dirty:
+                states [core] = 'M'
+            elif state is None:
+                states [core] = ('E' if self.protocol == 'mesi'
+                                 and not states else 'S')
+        else:
+            # Written around the private cache.
+            self.__sharedAccess (addr, Set.dirty)
+        if not states:
+            del self.directory [block_addr]
+        self.__handleVictims (core)
+        return hit
+
+    def read (self, core, addr):
+        return self.access (core, addr, Set.clean)
+
+    def write (self, core, addr):
+        return self.access (core, addr, Set.dirty)
+
+    def getCoherenceCounts (self, count):
+        """Return count (e.g. 'invalidations_sent') of every core."""
+        return [counts [count] for counts in self.counts]
+
+    def getStats (self):
+        """Return, per core, its cache's getStats () followed by its
+        coherence counts (in the order of printStats), then the shared
+        cache's getStats () (None if there is none), then [#memory
+        reads, #memory writes]."""
+        return ([cache.getStats () + [counts [count] for count in _counts]
+                 for cache, counts in zip (self.caches, self.counts)]
+                + [self.shared_cache.getStats ()
+                   if self.shared_cache is not None else None]
+                + [[self.memory_read_count, self.memory_write_count]])
+
+    def printStats (self):
+        for core, cache in enumerate (self.caches):
+            print 'Core ' + str (core)
+            cache.printStats ()
+            for count in _counts:
+                print (str (self.counts [core] [count]) + '\t'
+                       + ' '.join (count.split ('_')))
+            print
+        if self.shared_cache is not None:
+            print 'Shared'
+            self.shared_cache.printStats ()
+            print
+        print 'Memory (' + self.protocol + ')'
+        print str (self.memory_read_count) + '\tread count'
+        print str (self.memory_write_count) + '\twrite count'
+
+
+def simulate_accesses (system, streams):
+    """Simulate on system the iterables of (dirty status, addr) of each
+    core, one access of each core in turn."""
+    streams = list (enumerate (iter (stream) for stream in streams))
+    while streams:
+        running = []
+        for core, stream in streams:
+            for dirty_status, addr in stream:
+                system.access (core, addr, dirty_status)
+                running.append ((core, stream))
+                break
+        streams = running
+
+def simulate_traces (system, filenames, interleave = 'round-robin'):
+    """Simulate the trace file of each core on system.
+
+    interleave:
+    'round-robin'  -> one access of each core in turn
+    'instructions' -> in the order of the instruction count of each
+                      core, from the third column of the traces (the
+                      instructions before each access, plus one for
+                      the access itself)
+    """
+    if interleave not in ['round-robin', 'instructions']:
+        raise ValueError ("Unknown interleaving: " + str (interleave))
+    traces = [Trace.readTraceArrays (filename, with_gaps = True)
+              for filename in filenames]
+    if Trace.numpy is not None:
+        traces = [[column.tolist () for column in trace]
+                  for trace in traces]
+    step = lambda gap: gap + 1 if interleave == 'instructions' else 1
+    # (time of the next access of core, core, its position in the trace)
+    queue = [(step (trace [2] [0]), core, 0)
+             for core, trace in enumerate (traces) if len (trace [0])]
+    heapq.heapify (queue)
+    while queue:
+        time, core, position = heapq.heappop (queue)
+        ops, addrs, gaps = traces [core]
+        system.access (core, addrs [position], ops [position])
+        position += 1
+        if position < len (ops):
+            heapq.heappush (queue,
+                            (time + step (gaps [position]), core, position))
+
+def simulate_matmul (system, matrix_size, blocking_factor, layout = None):
+    """Simulate the multiply of MatrixTrace on system, split among its
+    cores as MatrixTrace does among threads."""
+    n_cores = len (system.caches)
+    simulate_accesses (
+        system,
+        [((Set.dirty if mode == 'W' else Set.clean, addr)
+          for mode, addr in MatrixTrace.genMatmulAccesses (
+              matrix_size, blocking_factor, layout, core, n_cores))
+         for core in range (n_cores)])
+
+def makeSystem (n_cores, protocol = 'mesi', sample_addr = "0xb7737f64"):
+    """Return a MultiCoreSystem of n_cores cores with 32K 8 way LRU
+    private caches and a 1M 16 way LRU shared cache, 64 byte blocks."""
+    caches = [LRUCache (64, 8, 64, sample_addr) for core in range (n_cores)]
+    return MultiCoreSystem (caches,
+                            LRUCache (1024, 16, 64, sample_addr),
+                            protocol)
+
+if __name__ == '__main__':
+    if len (sys.argv) < 3:
+        print ('Usage: ./Coherence.py <msi|mesi> <trace of core 0>'
+               ' [<trace of core 1> ...]\n'
+               '       ./Coherence.py <msi|mesi> matmul <cores>'
+               ' <matrix size> <blocking factor>')
+        exit (1)
+    protocol = sys.argv [1]
+    if sys.argv [2] == 'matmul':
+        n_cores, matrix_size, blocking_factor = [int (arg)
+                                                 for arg in sys.argv [3:6]]
+        system = makeSystem (n_cores, protocol)
+        simulate_matmul (system, matrix_size, blocking_factor)
+    else:
+        system = makeSystem (len (sys.argv) - 2, protocol,
+                             Trace.binarySampleAddr (sys.argv [2])
+                             if Trace.isBinaryTrace (sys.argv [2])
+                             else "0xb7737f64")
+        simulate_traces (system, sys.argv [2:])
+    system.printStats ()
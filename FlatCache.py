@@ -0,0 +1,309 @@
+#! /usr/bin/python
+
+"""A cache whose state lives in flat arrays instead of Set objects."""
+
+import array
+import itertools
+import math
+import random
+
+from Cache import *
+import Trace
+import Trackers
+
+class FlatCache (Cache):
+    """Set associative cache kept in a handful of flat arrays.
+
+    Slot set_number * n_ways + way of each array is one way of one
+    set: the block address in it, whether it is valid and dirty, and
+    its replacement metadata. The per-set counters are arrays of n_sets
+    counts. A single dict maps the blocks in the cache to their slots
+    and a single set holds every block seen so far (for cold misses),
+    instead of a dict and a set in each of n_sets Set objects.
+
+    policy:
+    'lru'    -> same statistics as LRUCache
+    'fifo'   -> same statistics as FIFOCache
+    'lfu'    -> same statistics as BucketLFUCache (tie_break = 'lru')
+    'random' -> random replacement, like Cache (but not the same
+                random choices)
+
+    cold_miss_tracker and set_seed are as for Cache.
+    """
+    policies = ('random', 'lru', 'fifo', 'lfu')
+
+    def __init__ (self,
+                  n_sets,
+                  n_ways,
+                  block_size,
+                  sample_addr = "0xb7737f64",
+                  policy = 'lru',
+                  write_no_allocate = False,
+                  cold_miss_tracker = None,
+                  set_seed = None):
+        if policy not in self.policies:
+            raise ValueError ("Unknown replacement policy: " + str (policy))
+        self.n_sets = n_sets
+        self.n_ways = n_ways
+        self.block_size = block_size
+        self.write_no_allocate = write_no_allocate
+        self.policy = policy
+
+        self.addr_bit_length = 4 * len (sample_addr.split ("x") [1])
+        self.block_offset_bit_length = int (math.log (self.block_size, 2))
+        self.block_addr_bit_length = (self.addr_bit_length
+                                      - self.block_offset_bit_length)
+        self.set_number_bit_length = int (math.log (self.n_sets, 2))
+        self.tag_bit_length = (self.block_addr_bit_length
+                               - self.set_number_bit_length)
+        self.set_mask = (1 << self.set_number_bit_length) - 1
+
+        n_slots = n_sets * n_ways
+        self.blocks = array.array ('L', [0]) * n_slots
+        self.valid = bytearray (n_slots)
+        self.dirty = bytearray (n_slots)
+        # lru: last access, fifo: insertion, lfu: last access (ties).
+        self.stamps = array.array ('L', [0]) * n_slots
+        self.frequencies = array.array ('L', [0]) * n_slots
+        # lru and fifo: each set's slots in a list from the oldest
+        # stamp to the newest, linked by slot (-1 ends it).
+        self.older = array.array ('l', [-1]) * n_slots
+        self.newer = array.array ('l', [-1]) * n_slots
+        self.oldest = array.array ('l', [-1]) * n_sets
+        self.newest = array.array ('l', [-1]) * n_sets
+        self.occupancy = array.array ('L', [0]) * n_sets
+        self.counts = dict ((count, array.array ('L', [0]) * n_sets)
+                            for count in ['access_count',
+                                          'cold_miss_count',
+                                          'conflict_miss_count',
+                                          'writeback_count'])
+        # {block address: slot}
+        self.slots = {}
+        if isinstance (cold_miss_tracker, str):
+            cold_miss_tracker = Trackers.makeTracker (cold_miss_tracker)
+        self.cold_miss_tracker = cold_miss_tracker
+        if cold_miss_tracker is None:
+            self.seen_blocks = set ()
+        else:
+            self.seen_blocks = cold_miss_tracker
+        self.clock = 0
+        # Per set random generators, if set_seed is given.
+        self.set_rngs = None
+        if set_seed is not None:
+            self.set_rngs = [random.Random (setSeed (set_seed, set_number))
+                             for set_number in range (n_sets)]
+        self.eviction_listener = None
+        self.shadow = None
+        self.capacity_miss_count = 0
+
+    def __str__ (self):
+        lines = []
+        for set_number in range (self.n_sets):
+            base = set_number * self.n_ways
+            tags = [pad ('%x' % (self.blocks [slot]
+                                 >> self.set_number_bit_length)
+                         + ('*' if self.dirty [slot] else ' '),
+                         1 + self.tag_bit_length / 4)
+                    for slot in range (base, base + self.n_ways)
+                    if self.valid [slot]]
+            lines.append (pad ('%x' % set_number,
+                               self.set_number_bit_length / 4)
+                          + ": " + ''.join (' ' + tag + ' ' for tag in tags))
+        return "\n".join (lines)
+
+    def __getstate__ (self):
+        """The listener is left out, as for Cache."""
+        state = dict (self.__dict__)
+        state ['eviction_listener'] = None
+        return state
+
+    def __blockAddr (self, addr):
+        try:
+            addr = int (addr, 0)
+        except TypeError:
+            pass
+        return addr >> self.block_offset_bit_length
+
+    def __unlink (self, slot):
+        set_number = slot / self.n_ways
+        older, newer = self.older [slot], self.newer [slot]
+        if older < 0:
+            self.oldest [set_number] = newer
+        else:
+            self.newer [older] = newer
+        if newer < 0:
+            self.newest [set_number] = older
+        else:
+            self.older [newer] = older
+
+    def __append (self, slot):
+        set_number = slot / self.n_ways
+        newest = self.newest [set_number]
+        self.older [slot] = newest
+        self.newer [slot] = -1
+        if newest < 0:
+            self.oldest [set_number] = slot
+        else:
+            self.newer [newest] = slot
+        self.newest [set_number] = slot
+
+    def __touch (self, slot):
+        """Update the replacement metadata of slot for a hit."""
+        if self.policy == 'lru':
+            self.stamps [slot] = self.clock
+            if self.newer [slot] >= 0:
+                self.__unlink (slot)
+                self.__append (slot)
+        elif self.policy == 'lfu':
+            self.stamps [slot] = self.clock
+            self.frequencies [slot] += 1
+
+    def __pickSlotToEvict (self, base):
+        if self.policy == 'random':
+            if self.set_rngs is not None:
+                return base + self.set_rngs [base / self.n_ways].randrange (
+                    self.n_ways)
+            return base + random.randrange (self.n_ways)
+        if self.policy == 'lfu':
+            ways = xrange (base, base + self.n_ways)
+            frequencies, stamps = self.frequencies, self.stamps
+            return min (ways, key = lambda slot: (frequencies [slot],
+                                                  stamps [slot]))
+        return self.oldest [base / self.n_ways]
+
+    def __allocate (self, set_number, block_addr, dirty_status):
+        base = set_number * self.n_ways
+        if self.occupancy [set_number] < self.n_ways:
+            slot = self.valid.index ('\x00', base, base + self.n_ways)
+            self.occupancy [set_number] += 1
+            evicted = None
+        else:
+            slot = self.__pickSlotToEvict (base)
+            evicted = (self.blocks [slot], self.dirty [slot])
+            del self.slots [evicted [0]]
+            if evicted [1]:
+                self.counts ['writeback_count'] [set_number] += 1
+            if self.policy in ('lru', 'fifo'):
+                self.__unlink (slot)
+        self.blocks [slot] = block_addr
+        self.valid [slot] = 1
+        self.dirty [slot] = dirty_status
+        self.stamps [slot] = self.clock
+        self.frequencies [slot] = 1
+        self.slots [block_addr] = slot
+        if self.policy in ('lru', 'fifo'):
+            self.__append (slot)
+        if evicted is not None and self.eviction_listener is not None:
+            self.eviction_listener (
+                evicted [0] << self.block_offset_bit_length, evicted [1])
+
+    def __miss (self, set_number, block_addr):
+        """Count a miss as cold or conflict."""
+        if block_addr in self.seen_blocks:
+            self.counts ['conflict_miss_count'] [set_number] += 1
+        else:
+            self.counts ['cold_miss_count'] [set_number] += 1
+            self.seen_blocks.add (block_addr)
+
+    def accessBlock (self, block_addr, dirty_status):
+        """Access the block at block address block_addr, return True on
+        a hit."""
+        set_number = block_addr & self.set_mask
+        self.counts ['access_count'] [set_number] += 1
+        self.clock += 1
+        slot = self.slots.get (block_addr)
+        if slot is not None:
+            self.__touch (slot)
+            if dirty_status == Set.dirty:
+                self.dirty [slot] = 1
+            return True
+        self.__miss (set_number, block_addr)
+        if not (self.write_no_allocate and dirty_status == Set.dirty):
+            self.__allocate (set_number, block_addr, dirty_status)
+        return False
+
+    def access (self, addr, dirty_status):
+        return self.accessBlock (self.__blockAddr (addr), dirty_status)
+
+    def read (self, addr):
+        return self.accessBlock (self.__blockAddr (addr), Set.clean)
+
+    def write (self, addr):
+        return self.accessBlock (self.__blockAddr (addr), Set.dirty)
+
+    def accessArrays (self, ops, addrs):
+        """Simulate a batch of accesses, as loaded by Trace."""
+        if Trace.numpy is not None and isinstance (addrs,
+                                                   Trace.numpy.ndarray):
+            block_addrs = (addrs >> Trace.numpy.uint64 (
+                self.block_offset_bit_length)).tolist ()
+            ops = ops.tolist ()
+        else:
+            block_addrs = [addr >> self.block_offset_bit_length
+                           for addr in addrs]
+        accessBlock = self.accessBlock
+        for op, block_addr in itertools.izip (ops, block_addrs):
+            accessBlock (block_addr, op)
+
+    def probe (self, addr):
+        block_addr = self.__blockAddr (addr)
+        set_number = block_addr & self.set_mask
+        self.counts ['access_count'] [set_number] += 1
+        if block_addr in self.slots:
+            return True
+        self.__miss (set_number, block_addr)
+        return False
+
+    def insert (self, addr, dirty_status):
+        block_addr = self.__blockAddr (addr)
+        self.clock += 1
+        slot = self.slots.get (block_addr)
+        if slot is not None:
+            self.__touch (slot)
+            if dirty_status == Set.dirty:
+                self.dirty [slot] = 1
+            return
+        self.seen_blocks.add (block_addr)
+        self.__allocate (block_addr & self.set_mask, block_addr,
+                         dirty_status)
+
+    def contains (self, addr):
+        return self.__blockAddr (addr) in self.slots
+
+    def markDirty (self, addr):
+        slot = self.slots.get (self.__blockAddr (addr))
+        if slot is not None:
+            self.dirty [slot] = 1
+
+    def markClean (self, addr):
+        slot = self.slots.get (self.__blockAddr (addr))
+        if slot is not None:
+            self.dirty [slot] = 0
+
+    def invalidate (self, addr, size = 1):
+        status = None
+        first = addr - addr % self.block_size
+        for block_start in range (first, addr + size, self.block_size):
+            block_addr = block_start >> self.block_offset_bit_length
+            slot = self.slots.pop (block_addr, None)
+            if slot is None:
+                continue
+            self.valid [slot] = 0
+            if self.policy in ('lru', 'fifo'):
+                self.__unlink (slot)
+            self.occupancy [block_addr & self.set_mask] -= 1
+            if status is None or self.dirty [slot] > status:
+                status = self.dirty [slot]
+        return status
+
+    def setEvictionListener (self, listener):
+        self.eviction_listener = listener
+
+    def getCumulativeCount (self, attr_name):
+        return sum (self.counts [attr_name])
+
+    def getSetCount (self, attr_name, set_number):
+        return self.counts [attr_name] [set_number]
+
+    def getSetCounts (self, attr_name):
+        return list (self.counts [attr_name])
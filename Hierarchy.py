@@ -0,0 +1,170 @@
+#! /usr/bin/python
+
+"""Multi-level cache hierarchies built out of Cache objects."""
+
+import functools
+
+from Cache import *
+import Trace
+
+class CacheHierarchy (object):
+    """A stack of caches, levels [0] being L1, driven by one trace.
+
+    A miss at a level is looked up at the next one, main memory being
+    below the last level. Dirty blocks evicted from a level are
+    written back to the next one. How the levels share blocks depends
+    on policy:
+
+    'nine'      -> non-inclusive non-exclusive: a miss fills every
+                   level it went through, evictions at one level do
+                   not concern the others.
+    'inclusive' -> like 'nine', but a block evicted from a level is
+                   also invalidated in every level above it (dirty
+                   copies there are folded into the write back).
+    'exclusive' -> a block lives in at most one level. Misses fill L1
+                   only, a block found further down is moved up to L1,
+                   and blocks evicted from a level are moved down to
+                   the next one (victim caches).
+
+    Block sizes must not shrink going down; for 'exclusive' they must
+    all be equal.
+    """
+    policies = ('nine', 'inclusive', 'exclusive')
+
+    def __init__ (self, levels, policy = 'nine'):
+        if policy not in self.policies:
+            raise ValueError ("Unknown inclusion policy: " + str (policy))
+        block_sizes = [level.block_size for level in levels]
+        if block_sizes != sorted (block_sizes):
+            raise ValueError ("Block sizes must not shrink going down")
+        if policy == 'exclusive' and len (set (block_sizes)) > 1:
+            raise ValueError ("Exclusive levels need equal block sizes")
+        self.levels = levels
+        self.policy = policy
+        self.memory_read_count = 0
+        self.memory_write_count = 0
+        # Blocks evicted from each level and not handled yet.
+        self.victims = [[] for level in levels]
+        for level, cache in enumerate (levels):
+            cache.setEvictionListener (
+                functools.partial (self.__onEviction, level))
+
+    def __setstate__ (self, state):
+        # Pickled levels come without listeners.
+        self.__dict__.update (state)
+        for level, cache in enumerate (self.levels):
+            cache.setEvictionListener (
+                functools.partial (self.__onEviction, level))
+
+    def __onEviction (self, level, addr, dirty_status):
+        self.victims [level].append ((addr, dirty_status))
+
+    def __memoryAccess (self, dirty_status):
+        if dirty_status == Set.dirty:
+            self.memory_write_count += 1
+        else:
+            self.memory_read_count += 1
+
+    def __access (self, level, addr, dirty_status, fill = True):
+        """Access addr at level and below as needed. fill: whether a
+        write miss that allocates needs to fetch the rest of the block
+        (not so for whole-block write backs)."""
+        if level == len (self.levels):
+            self.__memoryAccess (dirty_status)
+            return
+        cache = self.levels [level]
+        if not cache.access (addr, dirty_status):
+            if dirty_status == Set.dirty and cache.write_no_allocate:
+                # Write around this level.
+                self.__access (level + 1, addr, Set.dirty, fill)
+            elif fill or dirty_status == Set.clean:
+                self.__access (level + 1, addr, Set.clean)
+        self.__handleVictims (level)
+
+    def __handleVictims (self, level):
+        victims = self.victims [level]
+        while victims:
+            addr, dirty_status = victims.pop (0)
+            if self.policy == 'inclusive':
+                size = self.levels [level].block_size
+                for upper in self.levels [:level]:
+                    status = upper.invalidate (addr, size)
+                    if status == Set.dirty:
+                        dirty_status = Set.dirty
+            if dirty_status == Set.dirty:
+                self.__access (level + 1, addr, Set.dirty, fill = False)
+
+    def __accessExclusive (self, addr, dirty_status):
+        l1 = self.levels [0]
+        if l1.access (addr, dirty_status):
+            pass
+        elif dirty_status == Set.dirty and l1.write_no_allocate:
+            # Write around L1, to wherever the block is.
+            for cache in self.levels [1:]:
+                if cache.probe (addr):
+                    cache.markDirty (addr)
+                    break
+            else:
+                self.__memoryAccess (Set.dirty)
+        else:
+            for cache in self.levels [1:]:
+                if cache.probe (addr):
+                    if cache.invalidate (addr) == Set.dirty:
+                        l1.markDirty (addr)
+                    break
+            else:
+                self.__memoryAccess (Set.clean)
+        self.__moveVictimsDown ()
+
+    def __moveVictimsDown (self):
+        for level, victims in enumerate (self.victims):
+            while victims:
+                addr, dirty_status = victims.pop (0)
+                if level + 1 < len (self.levels):
+                    self.levels [level + 1].insert (addr, dirty_status)
+                elif dirty_status == Set.dirty:
+                    self.__memoryAccess (Set.dirty)
+
+    def access (self, addr, dirty_status):
+        try:
+            addr = int (addr, 0)
+        except TypeError:
+            pass
+        if self.policy == 'exclusive':
+            self.__accessExclusive (addr, dirty_status)
+        else:
+            self.__access (0, addr, dirty_status)
+
+    def read (self, addr):
+        self.access (addr, Set.clean)
+
+    def write (self, addr):
+        self.access (addr, Set.dirty)
+
+    def accessArrays (self, ops, addrs):
+        """Simulate a batch of accesses, as loaded by Trace."""
+        if Trace.numpy is not None and isinstance (addrs,
+                                                   Trace.numpy.ndarray):
+            ops, addrs = ops.tolist (), addrs.tolist ()
+        for op, addr in zip (ops, addrs):
+            self.access (addr, op)
+
+    def getStats (self):
+        """Return the list of getStats () of each level followed by
+        [#writebacks] of each level, then [#memory reads, #memory
+        writes]."""
+        return ([level.getStats () for level in self.levels]
+                + [[level.getCumulativeCount ('writeback_count')
+                    for level in self.levels]]
+                + [[self.memory_read_count, self.memory_write_count]])
+
+    def printStats (self):
+        for number, level in enumerate (self.levels):
+            print 'L' + str (number + 1)
+            level.printStats ()
+            print (str (level.getCumulativeCount ('writeback_count'))
+                   + '\twriteback count')
+            print
+        print 'Memory (' + self.policy + ')'
+        print str (self.memory_read_count) + '\tread count'
+        print str (self.memory_write_count) + '\twrite count'
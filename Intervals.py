@@ -0,0 +1,180 @@
+#! /usr/bin/python
+
+"""Streaming simulation with per-interval statistics.
+
+The trace is read chunk by chunk and every interval accesses a row of
+statistics for just that interval is written out (CSV or JSON lines),
+so that phases of long traces show up. The working set is estimated
+by a fixed-size sketch, but the blocks seen so far (to tell cold
+misses apart) grow with the footprint of the trace unless the cache
+has a fixed-size cold_miss_tracker, such as 'bloom' (see Trackers),
+as the one of __main__ does.
+"""
+
+import csv
+import json
+import math
+import sys
+
+from Cache import *
+import Trace
+
+# Multipliers of the 64-bit finalizer of MurmurHash3, which scatters
+# even consecutive block addresses like random ones.
+_mix_1, _mix_2 = 0xff51afd7ed558ccd, 0xc4ceb9fe1a85ec53
+_mask_64 = (1 << 64) - 1
+
+class WorkingSetSketch (object):
+    """Estimates the number of distinct blocks touched, in bounded
+    memory (linear counting over a bitmap of n_bits bits)."""
+    def __init__ (self, n_bits):
+        self.bit_length = max (10, int (math.ceil (math.log (n_bits, 2))))
+        self.n_bits = 1 << self.bit_length
+        self.clear ()
+
+    def clear (self):
+        if Trace.numpy is not None:
+            self.bitmap = Trace.numpy.zeros (self.n_bits, dtype = bool)
+        else:
+            self.bitmap = bytearray (self.n_bits)
+
+    def add (self, block_addrs):
+        """Add a sequence (list or numpy array) of block addresses."""
+        shift = 64 - self.bit_length
+        if Trace.numpy is not None:
+            numpy = Trace.numpy
+            h = numpy.array (block_addrs, dtype = numpy.uint64)
+            h ^= h >> numpy.uint64 (33)
+            h *= numpy.uint64 (_mix_1)
+            h ^= h >> numpy.uint64 (33)
+            h *= numpy.uint64 (_mix_2)
+            h ^= h >> numpy.uint64 (33)
+            self.bitmap [h >> numpy.uint64 (shift)] = True
+        else:
+            for h in block_addrs:
+                h ^= h >> 33
+                h = (h * _mix_1) & _mask_64
+                h ^= h >> 33
+                h = (h * _mix_2) & _mask_64
+                h ^= h >> 33
+                self.bitmap [h >> shift] = 1
+
+    def estimate (self):
+        """Return the estimated number of distinct blocks added."""
+        if Trace.numpy is not None:
+            empty = self.n_bits - int (self.bitmap.sum ())
+        else:
+            empty = self.bitmap.count ('\x00')
+        if empty == 0:
+            # Saturated; the estimate is a lower bound from here on.
+            empty = 1
+        return int (round (self.n_bits * math.log (float (self.n_bits)
+                                                   / empty)))
+
+
+class IntervalWriter (object):
+    """Writes interval rows (dicts) to filename, as CSV if it ends in
+    '.csv', as JSON lines otherwise."""
+    def __init__ (self, filename, fields):
+        self.file = open (filename, 'w')
+        self.fields = fields
+        self.csv = None
+        if filename.endswith ('.csv'):
+            self.csv = csv.DictWriter (self.file, fields)
+            self.csv.writeheader ()
+
+    def write (self, row):
+        if self.csv is not None:
+            self.csv.writerow (row)
+        else:
+            self.file.write (json.dumps (row, sort_keys = True) + '\n')
+        self.file.flush ()
+
+    def close (self):
+        self.file.close ()
+
+
+def _counts (cache):
+    counts = [cache.getCumulativeCount (count)
+              for count in ['access_count',
+                            'cold_miss_count',
+                            'conflict_miss_count']]
+    if cache.shadow is not None:
+        counts.append (cache.capacity_miss_count)
+    return counts
+
+def simulate_intervals (cache, filename, interval, writer):
+    """Simulate trace file filename on cache, writing a row of
+    statistics for every interval accesses to writer (see
+    fields_for) and a last row for the remainder, if any."""
+    sketch = WorkingSetSketch (8 * cache.n_sets * cache.n_ways)
+    previous = _counts (cache)
+    state = {'number': 0, 'start': 0, 'seen': 0}
+
+    def emitRow ():
+        counts = _counts (cache)
+        delta = [now - before for now, before in zip (counts, previous)]
+        accesses = delta [0]
+        row = {'interval': state ['number'],
+               'first_access': state ['start'],
+               'access_count': accesses,
+               'cold_miss_count': delta [1],
+               'conflict_miss_count': delta [2],
+               'hit_rate': (100 * (1 - float (delta [1] + delta [2])
+                                   / accesses) if accesses else 0.0),
+               'working_set_blocks': sketch.estimate (),
+               'working_set_bytes': sketch.estimate () * cache.block_size}
+        if cache.shadow is not None:
+            row ['capacity_miss_count'] = delta [3]
+            row ['conflict_miss_count'] = delta [2] - delta [3]
+        writer.write (row)
+        previous [:] = counts
+        sketch.clear ()
+        state ['number'] += 1
+        state ['start'] = state ['seen']
+
+    for ops, addrs in Trace.genTraceChunks (filename):
+        start = 0
+        while start < len (ops):
+            left = interval - (state ['seen'] - state ['start'])
+            chunk_ops = ops [start:start + left]
+            chunk_addrs = addrs [start:start + left]
+            cache.accessArrays (chunk_ops, chunk_addrs)
+            if Trace.numpy is not None:
+                sketch.add (chunk_addrs
+                            >> Trace.numpy.uint64 (
+                                cache.block_offset_bit_length))
+            else:
+                sketch.add ([addr >> cache.block_offset_bit_length
+                             for addr in chunk_addrs])
+            start += len (chunk_ops)
+            state ['seen'] += len (chunk_ops)
+            if state ['seen'] - state ['start'] == interval:
+                emitRow ()
+    if state ['seen'] > state ['start']:
+        emitRow ()
+    return state ['number']
+
+def fields_for (cache):
+    """Return the row fields simulate_intervals writes for cache."""
+    fields = ['interval', 'first_access', 'access_count', 'hit_rate',
+              'cold_miss_count', 'conflict_miss_count']
+    if cache.shadow is not None:
+        fields.append ('capacity_miss_count')
+    return fields + ['working_set_blocks', 'working_set_bytes']
+
+if __name__ == '__main__':
+    if len (sys.argv) != 4:
+        print ('Usage: ./Intervals.py <trace file> <interval>'
+               ' <output .csv or .jsonl>')
+        exit (1)
+    trace_file, interval, output = sys.argv [1:]
+    block_size, cache_size, num_ways = 1024, 1048576, 16
+    cache = LRUCache ((cache_size / block_size) / num_ways,
+                      num_ways,
+                      block_size,
+                      classify_misses = True,
+                      cold_miss_tracker = 'bloom')
+    writer = IntervalWriter (output, fields_for (cache))
+    simulate_intervals (cache, trace_file, int (interval), writer)
+    writer.close ()
@@ -0,0 +1,214 @@
+#! /usr/bin/python
+
+"""The memory trace of src/block-multiplication.c, without pin.
+
+Generates the data accesses of the loops of block_matrix_product as
+compiled without optimization, in order. Every iteration of the
+innermost loop does
+
+    temp += A[scaled_i + sub_i][scaled_k + sub_k]
+            * B[scaled_k + sub_k][scaled_j + sub_j];
+
+that is, reads the row pointer of A and the element, then the row
+pointer of B and the element, and after the innermost loop
+
+    C[scaled_i + sub_i][scaled_j + sub_j] += temp;
+
+reads the row pointer of C, reads the element and writes it. The loop
+counters and temp are left out (they are in registers or on the
+stack, not in the matrices). Blocking factor 1 is the naive multiply.
+
+The matrices are laid out by a Layout: 'pointers' (the default, as in
+the program: an array of row pointers and a malloc'd block per row)
+or 'contiguous' (a single 2D array, no row pointers read).
+
+For a multithreaded multiply, thread of n_threads threads computes
+the blocks C_i_j with i * blocking factor + j = thread (mod n_threads),
+so neighbouring blocks of C go to different threads.
+"""
+
+import array
+import itertools
+import sys
+
+from Cache import *
+import Trace
+
+HEAP_BASE = 0x603010
+
+def mallocChunkSize (request_size):
+    """Bytes between consecutive blocks malloc'd of request_size bytes
+    (glibc on 64-bit: 8 bytes of header, 16 byte aligned, 32 min)."""
+    return max (32, (request_size + 8 + 15) & ~15)
+
+
+class Layout (object):
+    """Where the elements (and row pointers) of A, B and C are.
+
+    For each matrix: the address of its row pointer array (None for
+    'contiguous'), the address of row 0 and the bytes from one row to
+    the next. By default A, B and C are malloc'd one after the other
+    from base_addr, in the order of the program (the row pointers of
+    a matrix, then its rows).
+    """
+    def __init__ (self,
+                  matrix_size,
+                  element_size = 4,
+                  pointer_size = 8,
+                  kind = 'pointers',
+                  base_addr = HEAP_BASE,
+                  bases = None):
+        """bases: the address of the first allocation of A, B and C,
+        instead of one after the other from base_addr."""
+        if kind not in ['pointers', 'contiguous']:
+            raise ValueError ("Unknown layout: " + str (kind))
+        self.matrix_size = matrix_size
+        self.element_size = element_size
+        self.pointer_size = pointer_size
+        self.kind = kind
+        if kind == 'pointers':
+            pointers_size = mallocChunkSize (matrix_size * pointer_size)
+            row_stride = mallocChunkSize (matrix_size * element_size)
+        else:
+            pointers_size = 0
+            row_stride = matrix_size * element_size
+        matrix_bytes = pointers_size + matrix_size * row_stride
+        if bases is None:
+            bases = [base_addr + matrix * matrix_bytes
+                     for matrix in range (3)]
+        # [(row pointers, row 0, row stride)] of A, B and C
+        self.matrices = [(base if kind == 'pointers' else None,
+                          base + pointers_size,
+                          row_stride)
+                         for base in bases]
+
+    def pointerAddr (self, matrix, row):
+        return self.matrices [matrix] [0] + row * self.pointer_size
+
+    def elementAddr (self, matrix, row, column):
+        pointers, row_0, row_stride = self.matrices [matrix]
+        return row_0 + row * row_stride + column * self.element_size
+
+
+def _checkSizes (matrix_size, blocking_factor):
+    if matrix_size % blocking_factor != 0:
+        raise ValueError ("Matrix size should be a multiple of blocking"
+                          " factor")
+
+def genMatmulAccesses (matrix_size, blocking_factor, layout = None,
+                       thread = 0, n_threads = 1):
+    """Yield (mode, addr) for every access (of thread), 'R' or 'W' and
+    the byte address, like Simulator.genMemtrace does for a trace
+    file."""
+    _checkSizes (matrix_size, blocking_factor)
+    layout = layout or Layout (matrix_size)
+    pointers = layout.kind == 'pointers'
+    block_size = matrix_size / blocking_factor
+    blocks = xrange (blocking_factor)
+    sub = xrange (block_size)
+    for i in blocks:
+        for j in blocks:
+            if (i * blocking_factor + j) % n_threads != thread:
+                continue
+            for k in blocks:
+                scaled_i = i * block_size
+                scaled_j = j * block_size
+                scaled_k = k * block_size
+                for sub_i in sub:
+                    row = scaled_i + sub_i
+                    for sub_j in sub:
+                        column = scaled_j + sub_j
+                        for sub_k in sub:
+                            inner = scaled_k + sub_k
+                            if pointers:
+                                yield 'R', layout.pointerAddr (0, row)
+                            yield 'R', layout.elementAddr (0, row, inner)
+                            if pointers:
+                                yield 'R', layout.pointerAddr (1, inner)
+                            yield 'R', layout.elementAddr (1, inner, column)
+                        if pointers:
+                            yield 'R', layout.pointerAddr (2, row)
+                        yield 'R', layout.elementAddr (2, row, column)
+                        yield 'W', layout.elementAddr (2, row, column)
+
+def genMatmulChunks (matrix_size, blocking_factor, layout = None,
+                     chunk_iterations = 65536, thread = 0, n_threads = 1):
+    """Yield (ops, addrs) for successive chunks of the accesses, as
+    Trace.genTraceChunks does for a trace file. A chunk has the
+    accesses of chunk_iterations iterations of the innermost loop."""
+    _checkSizes (matrix_size, blocking_factor)
+    layout = layout or Layout (matrix_size)
+    if Trace.numpy is None:
+        accesses = genMatmulAccesses (matrix_size, blocking_factor, layout,
+                                      thread, n_threads)
+        n_accesses = chunk_iterations * (6 if layout.kind == 'pointers'
+                                         else 3)
+        while True:
+            ops, addrs = array.array ('B'), []
+            for mode, addr in itertools.islice (accesses, n_accesses):
+                ops.append (Set.dirty if mode == 'W' else Set.clean)
+                addrs.append (addr)
+            if not ops:
+                return
+            yield ops, addrs
+    numpy = Trace.numpy
+    block_size = matrix_size / blocking_factor
+    n_iterations = matrix_size ** 3
+    # Loop order i, j, k, sub_i, sub_j, sub_k: the digits of the
+    # iteration number in a mixed radix.
+    radices = [blocking_factor] * 3 + [block_size] * 3
+    for first in xrange (0, n_iterations, chunk_iterations):
+        iteration = numpy.arange (first,
+                                  min (first + chunk_iterations,
+                                       n_iterations),
+                                  dtype = numpy.uint64)
+        digits = []
+        for radix in reversed (radices):
+            digits.append (iteration % numpy.uint64 (radix))
+            iteration = iteration // numpy.uint64 (radix)
+        sub_k, sub_j, sub_i, k, j, i = digits
+        size = numpy.uint64 (block_size)
+        row = i * size + sub_i
+        column = j * size + sub_j
+        inner = k * size + sub_k
+        columns = []
+        for matrix, (r, c) in enumerate ([(row, inner),
+                                          (inner, column),
+                                          (row, column)]):
+            pointers, row_0, row_stride = layout.matrices [matrix]
+            if layout.kind == 'pointers':
+                columns.append (numpy.uint64 (pointers)
+                                + r * numpy.uint64 (layout.pointer_size))
+            columns.append (numpy.uint64 (row_0)
+                            + r * numpy.uint64 (row_stride)
+                            + c * numpy.uint64 (layout.element_size))
+        columns.append (columns [-1])
+        addrs = numpy.column_stack (columns)
+        ops = numpy.zeros (addrs.shape, dtype = numpy.uint8)
+        ops [:, -1] = Set.dirty
+        # The accesses to C only follow the last inner iteration.
+        keep = numpy.ones (addrs.shape, dtype = bool)
+        n_c = 3 if layout.kind == 'pointers' else 2
+        keep [:, -n_c:] = (sub_k == size - numpy.uint64 (1)) [:, None]
+        if n_threads > 1:
+            keep &= ((i * numpy.uint64 (blocking_factor) + j)
+                     % numpy.uint64 (n_threads)
+                     == numpy.uint64 (thread)) [:, None]
+            if not keep.any ():
+                continue
+        yield ops [keep], addrs [keep]
+
+def simulate_matmul (cache, matrix_size, blocking_factor, layout = None):
+    """Simulate the multiply on cache, straight from the generator."""
+    for ops, addrs in genMatmulChunks (matrix_size, blocking_factor,
+                                       layout):
+        cache.accessArrays (ops, addrs)
+
+if __name__ == '__main__':
+    if len (sys.argv) != 3:
+        print 'Usage: ./MatrixTrace.py <matrix size> <blocking factor>'
+        print 'Writes the trace to the standard output.'
+        exit (1)
+    matrix_size, blocking_factor = [int (arg) for arg in sys.argv [1:]]
+    for mode, addr in genMatmulAccesses (matrix_size, blocking_factor):
+        print mode, '0x%012x' % addr
@@ -0,0 +1,306 @@
+#! /usr/bin/python
+
+"""Miss ratio curves and working set profile of a trace, in one pass.
+
+For every block size and associativity asked for, the miss ratio of
+LRU caches of every cache size follows from stack distance histograms
+(see StackDistance): one per block size and number of sets. The
+fully associative curve is the one of a single set.
+
+For long traces, the accesses are sampled at rate (0 < rate <= 1):
+
+- caches of many sets are set sampled: only a random subset of rate
+  of their sets (picked with a seed as in Sampling) is simulated,
+  exactly, as the sets do not interact. Their miss ratio is out of
+  the accesses to those sets.
+- caches of fewer sets keep _min_sampled_sets of them (or all) and
+  sample the blocks for the rest of the rate (SHARDS, Waldspurger et
+  al., FAST 2015): only the accesses to blocks whose hash falls under
+  that rate are simulated, and a stack distance d among those stands
+  for d / rate in the full trace. Their miss ratio is out of the
+  accesses expected in the sample (SHARDS-adj).
+
+The working set profile counts the distinct blocks (of the first
+block size) touched in every interval of accesses, estimated in
+bounded memory by Intervals.WorkingSetSketch.
+
+The report is written as CSV, and as 'x,y' files for
+Simulator.plot_files to render.
+"""
+
+import csv
+import getopt
+import random
+import sys
+
+from Cache import *
+import Intervals
+import StackDistance
+import Trace
+
+FULLY_ASSOCIATIVE = 'full'
+
+# Set sampling keeps at least this many sets, for the few sets it
+# would keep otherwise to stand for the others.
+_min_sampled_sets = 32
+# Sampling thresholds are out of 2 ** _hash_bit_length.
+_hash_bit_length = 24
+_mix_1, _mix_2 = 0xff51afd7ed558ccd, 0xc4ceb9fe1a85ec53
+_mask_64 = (1 << 64) - 1
+
+def _hashBlocks (block_addrs):
+    """Return the top _hash_bit_length bits of the murmur finalizer
+    of each block address (a numpy array or a list)."""
+    numpy = Trace.numpy
+    if numpy is not None and isinstance (block_addrs, numpy.ndarray):
+        h = block_addrs.astype (numpy.uint64)
+        h ^= h >> numpy.uint64 (33)
+        h *= numpy.uint64 (_mix_1)
+        h ^= h >> numpy.uint64 (33)
+        h *= numpy.uint64 (_mix_2)
+        h ^= h >> numpy.uint64 (33)
+        return h >> numpy.uint64 (64 - _hash_bit_length)
+    hashes = []
+    for h in block_addrs:
+        h ^= h >> 33
+        h = (h * _mix_1) & _mask_64
+        h ^= h >> 33
+        h = (h * _mix_2) & _mask_64
+        h ^= h >> 33
+        hashes.append (h >> (64 - _hash_bit_length))
+    return hashes
+
+
+class SampledStackDistances (object):
+    """Stack distance histogram of a trace for one block size and
+    number of sets, of the sample of the accesses taken at rate (see
+    the module docstring). The sets sampled are picked with seed."""
+    def __init__ (self, n_sets, block_size, rate = 1.0, seed = 0):
+        self.n_sets = n_sets
+        self.block_size = block_size
+        self.analyzer = StackDistance.StackDistanceAnalyzer (n_sets,
+                                                             block_size)
+        # The sets set in sampled_sets are simulated (all of them if
+        # n_sampled_sets is n_sets), and the blocks whose hash is under
+        # threshold in them.
+        self.n_sampled_sets = min (n_sets, max (_min_sampled_sets,
+                                                int (n_sets * rate)))
+        self.sampled_sets = bytearray (n_sets)
+        for set_number in random.Random (seed).sample (
+                xrange (n_sets), self.n_sampled_sets):
+            self.sampled_sets [set_number] = 1
+        self.block_rate = min (1.0,
+                               rate * n_sets / self.n_sampled_sets)
+        self.threshold = int (self.block_rate * (1 << _hash_bit_length))
+        # The accesses to the sampled sets, block sampled or not.
+        self.access_count = 0
+
+    def accessArrays (self, ops, addrs):
+        numpy = Trace.numpy
+        offset_bits = self.analyzer.block_offset_bit_length
+        set_mask = self.n_sets - 1
+        if numpy is not None and isinstance (addrs, numpy.ndarray):
+            block_addrs = addrs >> numpy.uint64 (offset_bits)
+            if self.n_sampled_sets < self.n_sets:
+                in_sets = numpy.frombuffer (self.sampled_sets,
+                                            dtype = numpy.uint8) [
+                    block_addrs & numpy.uint64 (set_mask)].astype (bool)
+                addrs, block_addrs = addrs [in_sets], block_addrs [in_sets]
+            self.access_count += len (addrs)
+            if self.block_rate < 1:
+                addrs = addrs [_hashBlocks (block_addrs) < self.threshold]
+        else:
+            if self.n_sampled_sets < self.n_sets:
+                addrs = [addr for addr in addrs
+                         if self.sampled_sets [(addr >> offset_bits)
+                                               & set_mask]]
+            self.access_count += len (addrs)
+            if self.block_rate < 1:
+                addrs = [addr for addr, h in zip (
+                             addrs,
+                             _hashBlocks ([addr >> offset_bits
+                                           for addr in addrs]))
+                         if h < self.threshold]
+        self.analyzer.accessArrays (ops, addrs)
+
+    def getMissRatio (self, n_ways):
+        """Return the estimated miss ratio (%) of an LRU cache of these
+        sets and block size with n_ways."""
+        analyzer = self.analyzer
+        if self.access_count == 0:
+            return 0.0
+        # A sampled distance d stands for d / block_rate.
+        limit = n_ways * self.block_rate
+        hits = sum (count
+                    for distance, count in analyzer.histogram.iteritems ()
+                    if 0 <= distance < limit)
+        # Out of the accesses to the sampled sets, times block_rate:
+        # those expected in the block sample rather than those in it,
+        # which a few hot blocks sampled in (or out) would skew
+        # (SHARDS-adj).
+        expected = self.access_count * self.block_rate
+        return min (100.0, 100 * (analyzer.access_count - hits) / expected)
+
+
+def _nSets (cache_size, block_size, n_ways):
+    if n_ways == FULLY_ASSOCIATIVE:
+        return 1
+    return cache_size / (block_size * n_ways)
+
+def _nWays (cache_size, block_size, n_ways):
+    if n_ways == FULLY_ASSOCIATIVE:
+        return cache_size / block_size
+    return n_ways
+
+def computeMissRatioCurves (filename, block_sizes, ways_list, cache_sizes,
+                            rate = 1.0, interval = None):
+    """Return the miss ratio curves of trace file filename, as rows
+    [block size, ways, cache size, miss ratio (%)] for every
+    combination (ways FULLY_ASSOCIATIVE for fully associative), and
+    the working set profile, as rows [first access, #accesses,
+    #distinct blocks] of every interval accesses (none if interval is
+    None). Reads the trace once."""
+    analyzers = {}
+    for block_size in block_sizes:
+        for n_ways in ways_list:
+            for cache_size in cache_sizes:
+                n_sets = _nSets (cache_size, block_size, n_ways)
+                if n_sets >= 1 and (block_size, n_sets) not in analyzers:
+                    analyzers [(block_size, n_sets)] = (
+                        SampledStackDistances (n_sets, block_size, rate))
+    sketch = None
+    if interval is not None:
+        sketch = Intervals.WorkingSetSketch (4 * interval)
+    working_set = []
+    position = 0
+    offset_bits = int (math.log (block_sizes [0], 2))
+    for ops, addrs in Trace.genTraceChunks (filename):
+        for analyzer in analyzers.itervalues ():
+            analyzer.accessArrays (ops, addrs)
+        if sketch is None:
+            continue
+        if Trace.numpy is not None and isinstance (addrs,
+                                                   Trace.numpy.ndarray):
+            block_addrs = addrs >> Trace.numpy.uint64 (offset_bits)
+        else:
+            block_addrs = [addr >> offset_bits for addr in addrs]
+        first = 0
+        while first < len (block_addrs):
+            # Up to the end of the current interval.
+            end = min (len (block_addrs),
+                       first + interval - position % interval)
+            sketch.add (block_addrs [first:end])
+            position += end - first
+            first = end
+            if position % interval == 0:
+                working_set.append ([position - interval, interval,
+                                     sketch.estimate ()])
+                sketch.clear ()
+    if sketch is not None and position % interval:
+        working_set.append ([position - position % interval,
+                             position % interval, sketch.estimate ()])
+    curves = []
+    for block_size in block_sizes:
+        for n_ways in ways_list:
+            for cache_size in cache_sizes:
+                n_sets = _nSets (cache_size, block_size, n_ways)
+                if n_sets < 1:
+                    continue
+                curves.append ([block_size, n_ways, cache_size,
+                                analyzers [(block_size, n_sets)].getMissRatio (
+                                    _nWays (cache_size, block_size, n_ways))])
+    return curves, working_set
+
+def writeCSV (filename, header, rows):
+    f = open (filename, 'wb')
+    writer = csv.writer (f)
+    writer.writerow (header)
+    writer.writerows (rows)
+    f.close ()
+
+def writeReport (curves, working_set, prefix = 'mrc'):
+    """Write the curves to <prefix>.csv and <prefix>-<block size>-<ways>.txt
+    ('cache size,miss ratio' lines), the working set profile to
+    <prefix>-working-set.csv and <prefix>-working-set.txt. Return the
+    list of (label, .txt filename) of the curves of each block size."""
+    import Simulator
+    writeCSV (prefix + '.csv',
+              ['block_size', 'ways', 'cache_size', 'miss_ratio'], curves)
+    series = {}
+    for block_size, n_ways, cache_size, miss_ratio in curves:
+        series.setdefault ((block_size, n_ways), []).append (
+            (cache_size, miss_ratio))
+    plots = {}
+    for (block_size, n_ways), points in sorted (series.items ()):
+        filename = '{0}-{1}-{2}.txt'.format (prefix, block_size, n_ways)
+        Simulator.write_result_to_file (filename, points)
+        label = ('fully associative' if n_ways == FULLY_ASSOCIATIVE
+                 else '{0} ways'.format (n_ways))
+        plots.setdefault (block_size, []).append ((label, filename))
+    writeCSV (prefix + '-working-set.csv',
+              ['first_access', 'access_count', 'distinct_blocks'],
+              working_set)
+    Simulator.write_result_to_file (
+        prefix + '-working-set.txt',
+        [(first, blocks) for first, count, blocks in working_set])
+    return plots
+
+def plotReport (plots, working_set, prefix = 'mrc'):
+    """Render the report written by writeReport with
+    Simulator.plot_files, one graph per block size and one of the
+    working set (needs matplotlib)."""
+    import Simulator
+    for block_size, series in sorted (plots.items ()):
+        Simulator.plot_files (
+            series, 'Cache Size (bytes)', 'Miss Ratio (%)',
+            'Miss ratio curves, {0} byte blocks'.format (block_size),
+            '{0}-{1}.png'.format (prefix, block_size),
+            logx = True)
+    if working_set:
+        Simulator.plot_files (
+            [('distinct blocks', prefix + '-working-set.txt')],
+            'Access', 'Working Set (blocks)', 'Working set over time',
+            prefix + '-working-set.png')
+
+if __name__ == '__main__':
+    help_message = """
+Usage: ./MissRatio.py [options] <trace file>
+
+-r --rate     : sampling rate, 1 (no sampling) default
+-i --interval : accesses per working set interval, 100000 default
+-o --output   : prefix of the files written, 'mrc' default
+-p --plot     : also plot the curves (needs matplotlib)
+"""
+    try:
+        opts, args = getopt.gnu_getopt (sys.argv [1:], "hr:i:o:p",
+                                        ["rate=", "interval=", "output=",
+                                         "plot"])
+    except getopt.GetoptError:
+        print help_message
+        sys.exit (2)
+    rate, interval, prefix, plot = 1.0, 100000, 'mrc', False
+    for opt, arg in opts:
+        if opt == '-h':
+            print help_message
+            sys.exit ()
+        elif opt in ("-r", "--rate"):
+            rate = float (arg)
+        elif opt in ("-i", "--interval"):
+            interval = int (arg)
+        elif opt in ("-o", "--output"):
+            prefix = arg
+        elif opt in ("-p", "--plot"):
+            plot = True
+    if len (args) != 1:
+        print help_message
+        sys.exit (2)
+    curves, working_set = computeMissRatioCurves (
+        args [0],
+        block_sizes = [32, 64, 128],
+        ways_list = [1, 2, 4, 8, 16, FULLY_ASSOCIATIVE],
+        cache_sizes = [1 << bits for bits in range (10, 25)],
+        rate = rate,
+        interval = interval)
+    plots = writeReport (curves, working_set, prefix)
+    if plot:
+        plotReport (plots, working_set, prefix)
@@ -0,0 +1,333 @@
+#! /usr/bin/python
+
+"""FlatCache with its core loop in C (kernel/cache-kernel.c).
+
+Build the kernel with 'make kernel'. NativeCache gives the same
+statistics as FlatCache with the same policy (random choices
+included: the kernel draws from a generator of its own, started from
+the state of the random module when the cache is made, where the
+Python caches draw from random itself), at a fraction of the time per
+access for batches (accessArrays, as used by Simulator.simulate_file).
+
+NativeCache also has two legacy policies, with the same statistics
+as the classes of Cache.py (random choices included):
+
+'random_legacy' -> Cache
+'lfu_legacy'    -> LFUCache
+
+FastCache returns a NativeCache if the kernel is built and a FlatCache
+(or for the legacy policies, the class of Cache.py) otherwise;
+fastCacheOf does so for a class of Cache.py (as Simulator and Sweep
+build their caches).
+"""
+
+import ctypes
+import os
+import random
+
+from Cache import *
+from FlatCache import FlatCache
+import Trace
+
+KERNEL_PATH = os.path.join (os.path.dirname (os.path.abspath (__file__)),
+                            'kernel', 'libcache-kernel.so')
+
+RESULT_HIT, RESULT_EVICTED, RESULT_DIRTY = 1, 2, 4
+# Out of memory for the blocks seen.
+RESULT_ERROR = -1
+
+_uint64_p = ctypes.POINTER (ctypes.c_uint64)
+_uint8_p = ctypes.POINTER (ctypes.c_uint8)
+
+def _loadKernel ():
+    try:
+        kernel = ctypes.CDLL (KERNEL_PATH)
+    except OSError:
+        return None
+    kernel.ck_new.restype = ctypes.c_void_p
+    kernel.ck_new.argtypes = ([ctypes.c_uint64, ctypes.c_uint64,
+                               ctypes.c_int, ctypes.c_int]
+                              + [_uint64_p] * 4 + [_uint8_p] * 2
+                              + [_uint64_p] * 4)
+    kernel.ck_free.argtypes = [ctypes.c_void_p]
+    kernel.ck_rebuild.argtypes = [ctypes.c_void_p]
+    kernel.ck_set_dicts.argtypes = ([ctypes.c_void_p, ctypes.c_uint64]
+                                    + [_uint64_p] * 2 + [_uint8_p]
+                                    + [_uint64_p] * 3)
+    kernel.ck_set_random_state.argtypes = [ctypes.c_void_p,
+                                           ctypes.POINTER (ctypes.c_uint32),
+                                           ctypes.c_int]
+    kernel.ck_get_random_state.argtypes = [ctypes.c_void_p,
+                                           ctypes.POINTER (ctypes.c_uint32)]
+    kernel.ck_clock.restype = ctypes.c_uint64
+    kernel.ck_clock.argtypes = [ctypes.c_void_p]
+    kernel.ck_set_clock.argtypes = [ctypes.c_void_p, ctypes.c_uint64]
+    kernel.ck_seen_count.restype = ctypes.c_uint64
+    kernel.ck_seen_count.argtypes = [ctypes.c_void_p]
+    kernel.ck_seen_blocks.argtypes = [ctypes.c_void_p, _uint64_p]
+    kernel.ck_seen_add.argtypes = [ctypes.c_void_p, ctypes.c_uint64]
+    kernel.ck_seen_add.restype = ctypes.c_int
+    for name in ['ck_access', 'ck_insert']:
+        getattr (kernel, name).argtypes = [ctypes.c_void_p, ctypes.c_uint64,
+                                           ctypes.c_uint8, _uint64_p]
+    kernel.ck_access_batch.restype = ctypes.c_int64
+    kernel.ck_access_batch.argtypes = [ctypes.c_void_p, _uint8_p, _uint64_p,
+                                       ctypes.c_uint64, ctypes.c_int]
+    for name in ['ck_probe', 'ck_contains', 'ck_mark_dirty', 'ck_mark_clean',
+                 'ck_invalidate']:
+        getattr (kernel, name).argtypes = [ctypes.c_void_p, ctypes.c_uint64]
+    return kernel
+
+kernel = _loadKernel ()
+
+def available ():
+    """Return True if the kernel is built."""
+    return kernel is not None
+
+
+class NativeCache (FlatCache):
+    """FlatCache whose accesses are simulated by the kernel.
+
+    The arrays of FlatCache are ctypes arrays shared with the kernel;
+    the blocks seen so far are kept by the kernel, so cold_miss_tracker
+    is not supported.
+
+    policy: one of FlatCache.policies, or of legacy_policies.
+    """
+    # {legacy policy: the class of Cache.py it has the statistics of}
+    legacy_policies = {'random_legacy': Cache, 'lfu_legacy': LFUCache}
+    policies = FlatCache.policies + ('random_legacy', 'lfu_legacy')
+
+    def __init__ (self, *args, **kwargs):
+        if kernel is None:
+            raise RuntimeError ("Cache kernel not built, see 'make kernel'")
+        if kwargs.get ('cold_miss_tracker') is not None:
+            raise ValueError ("NativeCache keeps its own cold miss tracker")
+        if kwargs.get ('set_seed') is not None:
+            raise ValueError ("NativeCache has a single random generator")
+        FlatCache.__init__ (self, *args, **kwargs)
+        self.__newState ()
+        # The random choices start where random is now.
+        internal_state = random.getstate () [1]
+        self.__setRandomState (list (internal_state [:624]),
+                               internal_state [624])
+
+    def __newState (self):
+        n_slots = self.n_sets * self.n_ways
+        self.blocks = (ctypes.c_uint64 * n_slots) ()
+        self.stamps = (ctypes.c_uint64 * n_slots) ()
+        self.frequencies = (ctypes.c_uint64 * n_slots) ()
+        self.occupancy = (ctypes.c_uint64 * self.n_sets) ()
+        self.valid = (ctypes.c_uint8 * n_slots) ()
+        self.dirty = (ctypes.c_uint8 * n_slots) ()
+        # The kernel keeps its own lists of the slots by stamp.
+        self.older = self.newer = self.oldest = self.newest = None
+        self.counts = dict ((count, (ctypes.c_uint64 * self.n_sets) ())
+                            for count in self.counts)
+        self.seen_blocks = None
+        # The legacy policies keep the tags of every set in a copy of a
+        # Python 2 dict (see the kernel), of at most dict_capacity
+        # entries: the smallest power of 2 over 4 * n_ways.
+        self.dict_capacity = 0
+        if self.policy in self.legacy_policies:
+            self.dict_capacity = 8
+            while self.dict_capacity <= 4 * self.n_ways:
+                self.dict_capacity *= 2
+        n_entries = self.n_sets * self.dict_capacity
+        self.dict_keys = (ctypes.c_uint64 * n_entries) ()
+        self.dict_slots = (ctypes.c_uint64 * n_entries) ()
+        self.dict_states = (ctypes.c_uint8 * n_entries) ()
+        self.dict_masks = (ctypes.c_uint64 * self.n_sets) (
+            *([7] * self.n_sets))
+        self.dict_fills = (ctypes.c_uint64 * self.n_sets) ()
+        self.dict_used = (ctypes.c_uint64 * self.n_sets) ()
+        self.state = kernel.ck_new (
+            self.n_sets, self.n_ways, self.policies.index (self.policy),
+            self.write_no_allocate,
+            self.blocks, self.stamps, self.frequencies, self.occupancy,
+            self.valid, self.dirty,
+            self.counts ['access_count'], self.counts ['cold_miss_count'],
+            self.counts ['conflict_miss_count'],
+            self.counts ['writeback_count'])
+        if not self.state:
+            raise MemoryError ()
+        self.victim = ctypes.c_uint64 ()
+        self.__afterAllocate (kernel.ck_set_dicts (
+            self.state, self.dict_capacity,
+            self.dict_keys, self.dict_slots, self.dict_states,
+            self.dict_masks, self.dict_fills, self.dict_used))
+
+    __arrays = ['blocks', 'stamps', 'frequencies', 'occupancy', 'valid',
+                'dirty', 'dict_keys', 'dict_slots', 'dict_states',
+                'dict_masks', 'dict_fills', 'dict_used']
+
+    def __getstate__ (self):
+        """Plain lists instead of the ctypes arrays, and the state kept
+        by the kernel."""
+        state = FlatCache.__getstate__ (self)
+        del state ['state'], state ['victim']
+        for name in self.__arrays:
+            state [name] = list (state [name])
+        state ['counts'] = dict ((count, list (counts))
+                                 for count, counts in self.counts.items ())
+        state ['clock'] = kernel.ck_clock (self.state)
+        mt = (ctypes.c_uint32 * 624) ()
+        index = kernel.ck_get_random_state (self.state, mt)
+        state ['random_state'] = (list (mt), index)
+        seen_blocks = (ctypes.c_uint64 * kernel.ck_seen_count (self.state)) ()
+        kernel.ck_seen_blocks (self.state, seen_blocks)
+        state ['seen_blocks'] = list (seen_blocks)
+        return state
+
+    def __setstate__ (self, state):
+        if kernel is None:
+            raise RuntimeError ("Cache kernel not built, see 'make kernel'")
+        if getattr (self, 'state', None):
+            kernel.ck_free (self.state)
+        self.__dict__.update (state)
+        self.__newState ()
+        for name in self.__arrays:
+            getattr (self, name) [:] = state [name]
+        for count, counts in state ['counts'].items ():
+            self.counts [count] [:] = counts
+        kernel.ck_rebuild (self.state)
+        kernel.ck_set_clock (self.state, state ['clock'])
+        self.__setRandomState (*state ['random_state'])
+        del self.random_state
+        for block_addr in state ['seen_blocks']:
+            self.__afterAllocate (kernel.ck_seen_add (self.state,
+                                                      block_addr))
+        self.seen_blocks = None
+
+    def __del__ (self):
+        if getattr (self, 'state', None) and kernel is not None:
+            kernel.ck_free (self.state)
+            self.state = None
+
+    def __setRandomState (self, mt, index):
+        kernel.ck_set_random_state (self.state,
+                                    (ctypes.c_uint32 * 624) (*mt), index)
+
+    def __afterAllocate (self, result):
+        if result == RESULT_ERROR:
+            raise MemoryError ("Out of memory for the blocks seen")
+        if (result & RESULT_EVICTED and self.eviction_listener is not None):
+            self.eviction_listener (
+                self.victim.value << self.block_offset_bit_length,
+                Set.dirty if result & RESULT_DIRTY else Set.clean)
+
+    def accessBlock (self, block_addr, dirty_status):
+        result = kernel.ck_access (self.state, block_addr, dirty_status,
+                                   self.victim)
+        self.__afterAllocate (result)
+        return result == RESULT_HIT
+
+    def accessArrays (self, ops, addrs):
+        if self.eviction_listener is not None:
+            # The listener is called between accesses.
+            return FlatCache.accessArrays (self, ops, addrs)
+        n = len (ops)
+        if Trace.numpy is not None and isinstance (addrs,
+                                                   Trace.numpy.ndarray):
+            numpy = Trace.numpy
+            ops = numpy.ascontiguousarray (ops, dtype = numpy.uint8)
+            addrs = numpy.ascontiguousarray (addrs, dtype = numpy.uint64)
+            ops_p = ops.ctypes.data_as (_uint8_p)
+            addrs_p = addrs.ctypes.data_as (_uint64_p)
+        else:
+            ops_p = (ctypes.c_uint8 * n) (*ops)
+            addrs_p = (ctypes.c_uint64 * n) (*addrs)
+        hits = kernel.ck_access_batch (self.state, ops_p, addrs_p, n,
+                                       self.block_offset_bit_length)
+        self.__afterAllocate (min (hits, 0))
+
+    def __blockAddr (self, addr):
+        try:
+            addr = int (addr, 0)
+        except TypeError:
+            pass
+        return addr >> self.block_offset_bit_length
+
+    def probe (self, addr):
+        result = kernel.ck_probe (self.state, self.__blockAddr (addr))
+        self.__afterAllocate (min (result, 0))
+        return bool (result)
+
+    def insert (self, addr, dirty_status):
+        result = kernel.ck_insert (self.state, self.__blockAddr (addr),
+                                   dirty_status, self.victim)
+        self.__afterAllocate (result)
+
+    def contains (self, addr):
+        return bool (kernel.ck_contains (self.state,
+                                         self.__blockAddr (addr)))
+
+    def markDirty (self, addr):
+        kernel.ck_mark_dirty (self.state, self.__blockAddr (addr))
+
+    def markClean (self, addr):
+        kernel.ck_mark_clean (self.state, self.__blockAddr (addr))
+
+    def invalidate (self, addr, size = 1):
+        status = None
+        first = addr - addr % self.block_size
+        for block_start in range (first, addr + size, self.block_size):
+            block_status = kernel.ck_invalidate (
+                self.state, block_start >> self.block_offset_bit_length)
+            if block_status >= 0 and (status is None
+                                      or block_status > status):
+                status = block_status
+        return status
+
+
+def FastCache (n_sets,
+               n_ways,
+               block_size,
+               sample_addr = "0xb7737f64",
+               policy = 'lru',
+               write_no_allocate = False,
+               cold_miss_tracker = None,
+               set_seed = None):
+    """Return a NativeCache if the kernel is built (and can do without
+    a cold_miss_tracker and set_seed), a FlatCache otherwise, or for
+    the legacy policies the class of Cache.py they stand for. Same
+    arguments as NativeCache."""
+    kwargs = dict (write_no_allocate = write_no_allocate,
+                   cold_miss_tracker = cold_miss_tracker,
+                   set_seed = set_seed)
+    if (kernel is not None and cold_miss_tracker is None
+        and set_seed is None):
+        return NativeCache (n_sets, n_ways, block_size, sample_addr,
+                            policy, **kwargs)
+    if policy in NativeCache.legacy_policies:
+        return NativeCache.legacy_policies [policy] (
+            n_sets, n_ways, block_size, sample_addr, **kwargs)
+    return FlatCache (n_sets, n_ways, block_size, sample_addr, policy,
+                      **kwargs)
+
+# {class of Cache.py: the FastCache policy of the same statistics}
+class_policies = {Cache: 'random_legacy',
+                  FIFOCache: 'fifo',
+                  LRUCache: 'lru',
+                  LFUCache: 'lfu_legacy'}
+
+def fastCacheOf (cache_type,
+                 n_sets,
+                 n_ways,
+                 block_size,
+                 sample_addr = "0xb7737f64",
+                 write_no_allocate = False,
+                 classify_misses = False,
+                 cold_miss_tracker = None,
+                 set_seed = None):
+    """Return an empty cache of the statistics of cache_type (a class
+    of Cache.py): through FastCache if class_policies has it and
+    classify_misses is not set, a cache_type otherwise."""
+    kwargs = dict (write_no_allocate = write_no_allocate,
+                   cold_miss_tracker = cold_miss_tracker,
+                   set_seed = set_seed)
+    if cache_type in class_policies and not classify_misses:
+        return FastCache (n_sets, n_ways, block_size, sample_addr,
+                          class_policies [cache_type], **kwargs)
+    return cache_type (n_sets, n_ways, block_size, sample_addr,
+                       classify_misses = classify_misses, **kwargs)
@@ -0,0 +1,213 @@
+#! /usr/bin/python
+
+"""Simulation of one trace across processes, split by set.
+
+The sets of a cache do not interact, so the accesses of a trace can be
+split by set number into n_shards streams (set_number % n_shards) and
+simulated by as many worker processes, each on its own copy of the
+cache. The trace is read once, here, and split into a binary trace
+per shard, so that every worker reads only its own accesses. The sets
+of every shard are then put back together in the cache, which ends up
+as after the serial simulate_file: the same blocks and counters in
+every set.
+
+Random choices keep them the same only if every set draws from a
+generator of its own (set_seed, see Cache), a single generator being
+shared by the sets of a shard in a different order: caches that draw
+from random are refused. Caches whose sets do interact can not be
+split either: DRRIPCache (set dueling), OPTCache (next uses over the
+whole trace), classify_misses (the fully associative shadow) and
+cold_miss_tracker. Nor can caches with an eviction listener, as the
+listener stays in this process.
+"""
+
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+
+from Cache import *
+from FlatCache import FlatCache
+import Native
+import Trace
+
+def _checkShardable (cache):
+    if isinstance (cache, (DRRIPCache, OPTCache)):
+        raise ValueError (cache.__class__.__name__ + " sets interact")
+    if cache.shadow is not None:
+        raise ValueError ("Can not classify misses by shard: the fully"
+                          " associative shadow spans all sets")
+    if getattr (cache, 'cold_miss_tracker', None) is not None:
+        raise ValueError ("A cold miss tracker spans all sets")
+    if cache.eviction_listener is not None:
+        raise ValueError ("Eviction listeners can not follow the shards")
+    if _drawsFromRandom (cache):
+        if isinstance (cache, Native.NativeCache):
+            raise ValueError ("NativeCache has a single random generator,"
+                              " give a FlatCache a set_seed instead")
+        raise ValueError ("The sets of " + cache.__class__.__name__
+                          + " share the random generator, see set_seed")
+
+def _drawsFromRandom (cache):
+    """Whether cache makes random choices from the random module
+    rather than from a generator per set."""
+    if isinstance (cache, FlatCache):
+        return (cache.policy in ['random', 'random_legacy']
+                and getattr (cache, 'set_rngs', None) is None)
+    set_ = cache.array [0]
+    return set_.rng is None and (
+        type (set_).pickBlockToEvict.im_func is Set.pickBlockToEvict.im_func
+        or getattr (set_, 'tie_break', None) == 'random'
+        or getattr (set_, 'insertion', None) == 'brrip')
+
+def _splitTrace (cache, filename, n_shards, directory):
+    """Write the accesses of trace file filename to the sets of each
+    shard to a binary trace in directory. Return the list of their
+    filenames and the number of non-memory instructions in the trace
+    (as Simulator.simulate_file)."""
+    offset_bits = cache.block_offset_bit_length
+    set_mask = cache.n_sets - 1
+    filenames = [os.path.join (directory, str (shard) + '.trace')
+                 for shard in range (n_shards)]
+    # Raw records, as Sweep.prepare_traces.
+    writers = [Trace.BinaryTraceWriter (shard_filename)
+               for shard_filename in filenames]
+    instruction_count = 0
+    for ops, addrs, gaps in Trace.genTraceChunks (filename,
+                                                  with_gaps = True):
+        instruction_count += int (sum (gaps))
+        if Trace.numpy is not None and isinstance (addrs,
+                                                   Trace.numpy.ndarray):
+            numpy = Trace.numpy
+            shards = (((addrs >> numpy.uint64 (offset_bits))
+                       & numpy.uint64 (set_mask))
+                      % numpy.uint64 (n_shards))
+            for shard, writer in enumerate (writers):
+                keep = shards == numpy.uint64 (shard)
+                writer.write (ops [keep], addrs [keep])
+        else:
+            shard_records = [([], []) for writer in writers]
+            for op, addr in zip (ops, addrs):
+                shard_ops, shard_addrs = shard_records [
+                    ((addr >> offset_bits) & set_mask) % n_shards]
+                shard_ops.append (op)
+                shard_addrs.append (addr)
+            for writer, (shard_ops, shard_addrs) in zip (writers,
+                                                         shard_records):
+                writer.write (shard_ops, shard_addrs)
+    for writer in writers:
+        writer.close ()
+    return filenames, instruction_count
+
+def _simulateShard (args):
+    """Simulate the accesses of shard trace file filename (see
+    _splitTrace) on cache, return the state of the sets of shard."""
+    cache, filename, shard, n_shards = args
+    for ops, addrs in Trace.genTraceChunks (filename):
+        cache.accessArrays (ops, addrs)
+    if isinstance (cache, FlatCache):
+        return cache.__getstate__ ()
+    return dict ((set_number, cache.array [set_number])
+                 for set_number in range (shard, cache.n_sets, n_shards))
+
+def _mergeFlatStates (cache, states, n_shards):
+    """Put the sets of the FlatCache (or NativeCache) states of each
+    shard together in cache."""
+    merged = cache.__getstate__ ()
+    n_ways = cache.n_ways
+    set_mask = cache.n_sets - 1
+    for name in ['blocks', 'valid', 'dirty', 'stamps', 'frequencies',
+                 'older', 'newer']:
+        if merged [name] is None:
+            continue
+        for set_number in range (cache.n_sets):
+            first = set_number * n_ways
+            merged [name] [first:first + n_ways] = (
+                states [set_number % n_shards] [name] [first:first + n_ways])
+    # The dicts of the tags of the legacy policies of NativeCache.
+    capacity = merged.get ('dict_capacity', 0)
+    for name in ['dict_keys', 'dict_slots', 'dict_states']:
+        for set_number in range (cache.n_sets if capacity else 0):
+            first = set_number * capacity
+            merged [name] [first:first + capacity] = (
+                states [set_number % n_shards] [name] [
+                    first:first + capacity])
+    for set_number in range (cache.n_sets):
+        state = states [set_number % n_shards]
+        merged ['occupancy'] [set_number] = state ['occupancy'] [set_number]
+        for name in ['oldest', 'newest', 'dict_masks', 'dict_fills',
+                     'dict_used']:
+            if merged.get (name) is not None:
+                merged [name] [set_number] = state [name] [set_number]
+        for count in merged ['counts']:
+            merged ['counts'] [count] [set_number] = (
+                state ['counts'] [count] [set_number])
+        if state.get ('set_rngs') is not None:
+            merged ['set_rngs'] [set_number] = state ['set_rngs'] [set_number]
+    seen_blocks = [block_addr
+                   for shard, state in enumerate (states)
+                   for block_addr in state ['seen_blocks']
+                   if (block_addr & set_mask) % n_shards == shard]
+    if isinstance (merged ['seen_blocks'], set):
+        merged ['seen_blocks'] = set (seen_blocks)
+        merged ['slots'] = dict (
+            (block_addr, slot)
+            for shard, state in enumerate (states)
+            for block_addr, slot in state ['slots'].iteritems ()
+            if (block_addr & set_mask) % n_shards == shard)
+    else:
+        merged ['seen_blocks'] = seen_blocks
+    merged ['clock'] = max (state ['clock'] for state in states)
+    if hasattr (cache, '__setstate__'):
+        cache.__setstate__ (merged)
+    else:
+        cache.__dict__.update (merged)
+
+def simulate_file_sharded (cache, filename, n_shards = None,
+                           processes = None):
+    """Simulate trace file filename on cache like simulate_file, in
+    n_shards shards (one per CPU by default) run by processes worker
+    processes (n_shards by default; 1 runs them all here). Return the
+    number of non-memory instructions in the trace, as simulate_file."""
+    _checkShardable (cache)
+    if n_shards is None:
+        n_shards = multiprocessing.cpu_count ()
+    n_shards = max (1, min (n_shards, cache.n_sets))
+    directory = tempfile.mkdtemp (prefix = 'shards-')
+    try:
+        filenames, instruction_count = _splitTrace (cache, filename,
+                                                    n_shards, directory)
+        jobs = [(cache, filenames [shard], shard, n_shards)
+                for shard in range (n_shards)]
+        if processes == 1 or n_shards == 1:
+            states = map (_simulateShard, jobs)
+        else:
+            pool = multiprocessing.Pool (processes or n_shards)
+            try:
+                states = pool.map (_simulateShard, jobs, chunksize = 1)
+            finally:
+                pool.close ()
+                pool.join ()
+    finally:
+        shutil.rmtree (directory)
+    if isinstance (cache, FlatCache):
+        _mergeFlatStates (cache, states, n_shards)
+    else:
+        for shard_sets in states:
+            for set_number, set_ in shard_sets.iteritems ():
+                cache.array [set_number] = set_
+    return instruction_count
+
+if __name__ == '__main__':
+    if len (sys.argv) not in [2, 3]:
+        print 'Usage: ./Parallel.py <trace file> [<shards>]'
+        exit (1)
+    block_size, cache_size, num_ways = 1024, 1048576, 16
+    cache = LRUCache ((cache_size / block_size) / num_ways,
+                      num_ways,
+                      block_size)
+    simulate_file_sharded (cache, sys.argv [1],
+                           int (sys.argv [2]) if len (sys.argv) == 3
+                           else None)
+    cache.printStats ()
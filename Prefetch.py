@@ -0,0 +1,250 @@
+#! /usr/bin/python
+
+"""Hardware prefetchers in front of a cache.
+
+A PrefetchingCache passes every access to its cache and shows it to a
+prefetcher, which answers with the block addresses to fetch ahead of
+demand. They reach the cache (through Cache.insert, so they count as
+neither accesses nor misses) latency accesses later. Every prefetch
+ends up:
+
+useful  -> the block was accessed while in the cache.
+late    -> the block was accessed before it arrived (still a miss).
+useless -> the block was evicted without being accessed.
+
+Prefetchers, all O(1) per access:
+
+NextLinePrefetcher     -> the next degree blocks, on a miss or the
+                          first access to a prefetched block (tagged).
+StridePrefetcher       -> a reference prediction table of the last
+                          block and stride per stream, prefetching once
+                          a stride repeats. With no PCs in the traces,
+                          a stream is the accesses to one region of
+                          2 ** region_bit_length bytes.
+StreamBufferPrefetcher -> n_streams sequential streams, each kept depth
+                          blocks ahead of its last access; a miss
+                          outside every stream starts a new one in
+                          place of the least recently used. The
+                          buffered blocks go in the cache itself.
+"""
+
+import collections
+import sys
+
+from Cache import *
+import Trace
+
+class NextLinePrefetcher (object):
+    def __init__ (self, degree = 1):
+        self.degree = degree
+
+    def observe (self, addr, block_addr, hit, prefetch_hit):
+        if hit and not prefetch_hit:
+            return []
+        return [block_addr + distance
+                for distance in range (1, self.degree + 1)]
+
+class StridePrefetcher (object):
+    """Prefetches degree strides ahead once confidence (out of 3)
+    reaches threshold. The table keeps the entries of the n_entries
+    most recently used regions."""
+    def __init__ (self, degree = 2, region_bit_length = 12,
+                  n_entries = 256, threshold = 2):
+        self.degree = degree
+        self.region_bit_length = region_bit_length
+        self.n_entries = n_entries
+        self.threshold = threshold
+        # {region: [last block address, stride, confidence]}
+        self.table = collections.OrderedDict ()
+
+    def observe (self, addr, block_addr, hit, prefetch_hit):
+        region = addr >> self.region_bit_length
+        entry = self.table.pop (region, None)
+        if entry is None:
+            if len (self.table) == self.n_entries:
+                self.table.popitem (last = False)
+            self.table [region] = [block_addr, 0, 0]
+            return []
+        self.table [region] = entry
+        last_block_addr, stride, confidence = entry
+        new_stride = block_addr - last_block_addr
+        if new_stride == 0:
+            return []
+        if new_stride == stride:
+            confidence = min (3, confidence + 1)
+        elif confidence > 0:
+            confidence -= 1
+        else:
+            stride = new_stride
+        entry [:] = [block_addr, stride, confidence]
+        if confidence < self.threshold:
+            return []
+        return [block_addr + stride * distance
+                for distance in range (1, self.degree + 1)]
+
+class StreamBufferPrefetcher (object):
+    def __init__ (self, n_streams = 4, depth = 4):
+        self.n_streams = n_streams
+        self.depth = depth
+        # {stream id: [next block address expected, last prefetched]},
+        # least recently used first.
+        self.streams = collections.OrderedDict ()
+        self.next_id = 0
+
+    def observe (self, addr, block_addr, hit, prefetch_hit):
+        for stream_id, stream in self.streams.items ():
+            expected, prefetched = stream
+            if expected <= block_addr <= prefetched:
+                del self.streams [stream_id]
+                self.streams [stream_id] = stream
+                stream [0] = block_addr + 1
+                stream [1] = block_addr + self.depth
+                return range (prefetched + 1, block_addr + self.depth + 1)
+        if hit:
+            return []
+        if len (self.streams) == self.n_streams:
+            self.streams.popitem (last = False)
+        self.streams [self.next_id] = [block_addr + 1,
+                                       block_addr + self.depth]
+        self.next_id += 1
+        return range (block_addr + 1, block_addr + self.depth + 1)
+
+def makePrefetcher (kind, **kwargs):
+    """kind: 'next-line', 'stride' or 'stream'."""
+    prefetchers = {'next-line': NextLinePrefetcher,
+                   'stride': StridePrefetcher,
+                   'stream': StreamBufferPrefetcher}
+    if kind not in prefetchers:
+        raise ValueError ("Unknown prefetcher: " + str (kind))
+    return prefetchers [kind] (**kwargs)
+
+
+class PrefetchingCache (object):
+    """cache (a Cache, FlatCache or NativeCache) with prefetcher in
+    front of it. latency: accesses between a prefetch and the arrival
+    of its block.
+
+    Sets the eviction listener of cache, calling any it had before."""
+    def __init__ (self, cache, prefetcher, latency = 0):
+        self.cache = cache
+        self.prefetcher = prefetcher
+        self.latency = latency
+        self.offset = cache.block_offset_bit_length
+        self.clock = 0
+        # Block addresses in the cache, prefetched and not accessed yet.
+        self.prefetched = set ()
+        # {block address: arrival time}, in the order of arrival.
+        self.in_flight = collections.OrderedDict ()
+        self.prefetch_counts = dict ((count, 0) for count in
+                                     ['issued', 'useful', 'late', 'useless'])
+        self.previous_listener = cache.eviction_listener
+        cache.setEvictionListener (self.__onEviction)
+
+    def __onEviction (self, addr, dirty_status):
+        block_addr = addr >> self.offset
+        if block_addr in self.prefetched:
+            self.prefetched.remove (block_addr)
+            self.prefetch_counts ['useless'] += 1
+        if self.previous_listener is not None:
+            self.previous_listener (addr, dirty_status)
+
+    def __arrive (self):
+        in_flight = self.in_flight
+        while in_flight:
+            block_addr, arrival = next (in_flight.iteritems ())
+            if arrival > self.clock:
+                break
+            del in_flight [block_addr]
+            if not self.cache.contains (block_addr << self.offset):
+                self.cache.insert (block_addr << self.offset, Set.clean)
+                self.prefetched.add (block_addr)
+
+    def access (self, addr, dirty_status):
+        try:
+            addr = int (addr, 0)
+        except TypeError:
+            pass
+        self.clock += 1
+        self.__arrive ()
+        block_addr = addr >> self.offset
+        if self.in_flight.pop (block_addr, None) is not None:
+            self.prefetch_counts ['late'] += 1
+        hit = self.cache.access (addr, dirty_status)
+        prefetch_hit = hit and block_addr in self.prefetched
+        if prefetch_hit:
+            self.prefetched.remove (block_addr)
+            self.prefetch_counts ['useful'] += 1
+        for prefetch_block_addr in self.prefetcher.observe (
+                addr, block_addr, hit, prefetch_hit):
+            if (prefetch_block_addr < 0
+                or prefetch_block_addr in self.in_flight
+                or self.cache.contains (prefetch_block_addr << self.offset)):
+                continue
+            self.prefetch_counts ['issued'] += 1
+            self.in_flight [prefetch_block_addr] = self.clock + self.latency
+        if not self.latency:
+            self.__arrive ()
+        return hit
+
+    def read (self, addr):
+        return self.access (addr, Set.clean)
+
+    def write (self, addr):
+        return self.access (addr, Set.dirty)
+
+    def accessArrays (self, ops, addrs):
+        if Trace.numpy is not None and isinstance (addrs,
+                                                   Trace.numpy.ndarray):
+            ops, addrs = ops.tolist (), addrs.tolist ()
+        access = self.access
+        for op, addr in zip (ops, addrs):
+            access (addr, op)
+
+    def getPrefetchStats (self):
+        """Return [#issued, #useful, #late, #useless, accuracy], accuracy
+        being the fraction of the prefetches issued that were useful."""
+        counts = self.prefetch_counts
+        accuracy = (float (counts ['useful']) / counts ['issued']
+                    if counts ['issued'] else 0.0)
+        return [counts ['issued'], counts ['useful'], counts ['late'],
+                counts ['useless'], accuracy]
+
+    def getStats (self):
+        return self.cache.getStats ()
+
+    def printStats (self):
+        self.cache.printStats ()
+        for count in ['issued', 'useful', 'late', 'useless']:
+            print (str (self.prefetch_counts [count])
+                   + '\t' + count + ' prefetches')
+
+
+def compare_file (make_cache, prefetcher, filename, latency = 0):
+    """Simulate trace file filename on make_cache () without, then with
+    prefetcher. Return (getStats () without, getStats () with,
+    getPrefetchStats ())."""
+    ops, addrs = Trace.readTraceArrays (filename)
+    cache = make_cache ()
+    cache.accessArrays (ops, addrs)
+    prefetching_cache = PrefetchingCache (make_cache (), prefetcher,
+                                          latency)
+    prefetching_cache.accessArrays (ops, addrs)
+    return (cache.getStats (), prefetching_cache.getStats (),
+            prefetching_cache.getPrefetchStats ())
+
+if __name__ == '__main__':
+    if len (sys.argv) not in [3, 4]:
+        print ('Usage: ./Prefetch.py <next-line|stride|stream> <trace file>'
+               ' [<latency>]')
+        exit (1)
+    block_size, cache_size, num_ways = 64, 32768, 8
+    make_cache = lambda: LRUCache ((cache_size / block_size) / num_ways,
+                                   num_ways,
+                                   block_size)
+    without, with_prefetcher, prefetch_stats = compare_file (
+        make_cache, makePrefetcher (sys.argv [1]), sys.argv [2],
+        int (sys.argv [3]) if len (sys.argv) == 4 else 0)
+    print 'Hit rate without prefetcher: %.3f%%' % without [3]
+    print 'Hit rate with prefetcher   : %.3f%%' % with_prefetcher [3]
+    print ('Prefetches: %d issued, %d useful, %d late, %d useless'
+           ' (accuracy %.3f)' % tuple (prefetch_stats))
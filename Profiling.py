@@ -0,0 +1,208 @@
+#! /usr/bin/python
+
+"""Where the misses of a simulation come from, and where its time goes.
+
+The per-set counters every cache keeps already give per-set access
+and miss histograms (getSetHistogram, getHotSets). For more, a
+Profiler attaches to one cache and, until detached, counts the
+accesses and misses of every address region, why blocks were evicted
+and calls on_miss and on_evict hooks. It does so by shadowing the
+access methods of that one cache object, so caches without a Profiler
+run the usual code and pay nothing.
+
+profile_file simulates a trace file like Simulator.simulate_file,
+timing the parsing of the trace and the simulation separately.
+"""
+
+import collections
+import sys
+import time
+
+from Cache import *
+import Trace
+
+def getSetHistogram (cache):
+    """Return [(#accesses, #misses)] of every set of cache."""
+    misses = [cold + conflict
+              for cold, conflict in zip (
+                  cache.getSetCounts ('cold_miss_count'),
+                  cache.getSetCounts ('conflict_miss_count'))]
+    return zip (cache.getSetCounts ('access_count'), misses)
+
+def getHotSets (cache, n = 10):
+    """Return [(set number, #accesses, #misses)] of the n sets of cache
+    with the most misses, most first."""
+    histogram = getSetHistogram (cache)
+    hot = sorted (range (len (histogram)),
+                  key = lambda set_number: -histogram [set_number] [1])
+    return [(set_number,) + tuple (histogram [set_number])
+            for set_number in hot [:n]]
+
+
+class Profiler (object):
+    """Instrumentation of one cache.
+
+    region_bit_length: accesses and misses are counted per region of
+    2 ** region_bit_length bytes (4K pages by default).
+    on_miss: called as on_miss (addr, kind) for every miss, kind being
+             'cold' or 'conflict'.
+    on_evict: called as on_evict (addr, dirty_status, reason) for every
+              eviction, addr being the evicted block's address and
+              reason the kind of miss that caused it, or 'insert' for
+              blocks put in by insert (e.g. by a CacheHierarchy).
+
+    Attach after putting the cache in a CacheHierarchy (which sets its
+    own eviction listener) and detach before pickling the cache.
+    """
+    def __init__ (self,
+                  cache,
+                  region_bit_length = 12,
+                  on_miss = None,
+                  on_evict = None):
+        self.cache = cache
+        self.region_bit_length = region_bit_length
+        self.on_miss = on_miss
+        self.on_evict = on_evict
+        self.set_mask = cache.n_sets - 1
+        # {region: [#accesses, #misses]}
+        self.regions = collections.defaultdict (lambda: [0, 0])
+        # {(reason, dirty_status): #evictions}
+        self.eviction_reasons = collections.defaultdict (int)
+        # Evictions during an access, until its miss is classified.
+        self.pending = None
+        self.previous_listener = None
+        self.attached = False
+
+    def attach (self):
+        cache = self.cache
+        self.original = dict ((name, getattr (cache, name))
+                              for name in ['access', 'read', 'write',
+                                           'accessArrays'])
+        cache.access = self.access
+        cache.read = lambda addr: self.access (addr, Set.clean)
+        cache.write = lambda addr: self.access (addr, Set.dirty)
+        cache.accessArrays = self.accessArrays
+        self.previous_listener = cache.eviction_listener
+        cache.setEvictionListener (self.__onEviction)
+        self.attached = True
+        return self
+
+    def detach (self):
+        for name in self.original:
+            delattr (self.cache, name)
+        self.cache.setEvictionListener (self.previous_listener)
+        self.attached = False
+
+    def __recordEviction (self, addr, dirty_status, reason):
+        self.eviction_reasons [(reason, dirty_status)] += 1
+        if self.on_evict is not None:
+            self.on_evict (addr, dirty_status, reason)
+
+    def __onEviction (self, addr, dirty_status):
+        if self.pending is None:
+            self.__recordEviction (addr, dirty_status, 'insert')
+        else:
+            self.pending.append ((addr, dirty_status))
+        if self.previous_listener is not None:
+            self.previous_listener (addr, dirty_status)
+
+    def access (self, addr, dirty_status):
+        try:
+            addr = int (addr, 0)
+        except TypeError:
+            pass
+        set_number = ((addr >> self.cache.block_offset_bit_length)
+                      & self.set_mask)
+        cold_before = self.cache.getSetCount ('cold_miss_count', set_number)
+        self.pending = []
+        hit = self.original ['access'] (addr, dirty_status)
+        evicted, self.pending = self.pending, None
+        region = self.regions [addr >> self.region_bit_length]
+        region [0] += 1
+        if not hit:
+            region [1] += 1
+            kind = ('cold' if self.cache.getSetCount ('cold_miss_count',
+                                                      set_number)
+                    > cold_before else 'conflict')
+            if self.on_miss is not None:
+                self.on_miss (addr, kind)
+            for evicted_addr, evicted_status in evicted:
+                self.__recordEviction (evicted_addr, evicted_status,
+                                       kind + ' miss')
+        return hit
+
+    def accessArrays (self, ops, addrs):
+        if Trace.numpy is not None and isinstance (addrs,
+                                                   Trace.numpy.ndarray):
+            ops, addrs = ops.tolist (), addrs.tolist ()
+        access = self.access
+        for op, addr in zip (ops, addrs):
+            access (addr, op)
+
+    def getRegionMisses (self, n = 10):
+        """Return [(region start address, #accesses, #misses)] of the n
+        regions with the most misses, most first."""
+        regions = sorted (self.regions.items (),
+                          key = lambda (region, counts): -counts [1])
+        return [(region << self.region_bit_length,) + tuple (counts)
+                for region, counts in regions [:n]]
+
+    def printReport (self, n = 10):
+        separator = "=================="
+        print pad (self.cache.__class__.__name__ + " profile",
+                   len (separator))
+        print separator
+        print "Hot sets (set: accesses, misses):"
+        for set_number, accesses, misses in getHotSets (self.cache, n):
+            print "  %6x: %10d %10d" % (set_number, accesses, misses)
+        print "Hot regions (address: accesses, misses):"
+        for start, accesses, misses in self.getRegionMisses (n):
+            print "  %#14x: %10d %10d" % (start, accesses, misses)
+        print "Evictions (reason: clean, dirty):"
+        for reason in sorted (set (reason for reason, dirty_status
+                                   in self.eviction_reasons)):
+            print "  %-15s %10d %10d" % (
+                reason + ':',
+                self.eviction_reasons.get ((reason, Set.clean), 0),
+                self.eviction_reasons.get ((reason, Set.dirty), 0))
+
+
+def profile_file (cache, filename):
+    """Simulate trace file filename on cache like simulate_file, return
+    {'parse_seconds', 'simulate_seconds', 'access_count'}."""
+    timings = {'parse_seconds': 0.0,
+               'simulate_seconds': 0.0,
+               'access_count': 0}
+    chunks = Trace.genTraceChunks (filename)
+    while True:
+        start = time.time ()
+        try:
+            ops, addrs = next (chunks)
+        except StopIteration:
+            break
+        parsed = time.time ()
+        cache.accessArrays (ops, addrs)
+        timings ['parse_seconds'] += parsed - start
+        timings ['simulate_seconds'] += time.time () - parsed
+        timings ['access_count'] += len (ops)
+    return timings
+
+if __name__ == '__main__':
+    if len (sys.argv) != 2:
+        print 'Usage: ./Profiling.py <trace file>'
+        exit (1)
+    block_size, cache_size, num_ways = 1024, 1048576, 16
+    cache = LRUCache ((cache_size / block_size) / num_ways,
+                      num_ways,
+                      block_size)
+    timings = profile_file (cache, sys.argv [1])
+    print ("%d accesses: %.3f s parsing, %.3f s simulating"
+           % (timings ['access_count'], timings ['parse_seconds'],
+              timings ['simulate_seconds']))
+    cache = LRUCache ((cache_size / block_size) / num_ways,
+                      num_ways,
+                      block_size)
+    profiler = Profiler (cache).attach ()
+    ops, addrs = Trace.readTraceArrays (sys.argv [1])
+    cache.accessArrays (ops, addrs)
+    profiler.printReport ()
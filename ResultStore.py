@@ -0,0 +1,195 @@
+#! /usr/bin/python
+
+"""Persistent store of simulation results, in an SQLite file.
+
+A result is keyed by the content of the trace (its SHA-1), the cache
+class, the parameters of the run, the random seed and RESULTS_VERSION,
+so a result is found again as long as none of these changed, whatever
+the trace file is called. Sweep.sweep and 'Simulator.py simulate' look
+results up here before simulating and store the new ones.
+"""
+
+import getopt
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+
+DEFAULT_FILENAME = 'results.sqlite'
+# Bump whenever the simulator gives other results for the same
+# parameters (or their format changes): the results stored before are
+# then left for evict.
+RESULTS_VERSION = 1
+
+def traceDigest (filename, block_size = 1 << 20):
+    """Return the SHA-1 of the content of trace file filename."""
+    digest = hashlib.sha1 ()
+    f = open (filename, 'rb')
+    block = f.read (block_size)
+    while block:
+        digest.update (block)
+        block = f.read (block_size)
+    f.close ()
+    return digest.hexdigest ()
+
+
+class ResultStore (object):
+    """Results (dicts) stored by trace digest, cache type, parameters
+    (a dict) and seed."""
+    def __init__ (self, filename = DEFAULT_FILENAME):
+        self.connection = sqlite3.connect (filename)
+        self.connection.executescript ("""
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                trace_digest TEXT,
+                cache_type TEXT,
+                params TEXT,
+                seed TEXT,
+                result TEXT,
+                created REAL,
+                accessed REAL);
+            CREATE TABLE IF NOT EXISTS digests (
+                path TEXT PRIMARY KEY,
+                size INTEGER,
+                mtime REAL,
+                digest TEXT);
+            """)
+
+    def close (self):
+        self.connection.close ()
+
+    def getTraceDigest (self, filename):
+        """traceDigest (filename), remembered as long as the size and
+        modification time of the file stay the same."""
+        path = os.path.abspath (filename)
+        stat = os.stat (path)
+        row = self.connection.execute (
+            "SELECT digest FROM digests WHERE path = ? AND size = ?"
+            " AND mtime = ?", (path, stat.st_size, stat.st_mtime)).fetchone ()
+        if row is not None:
+            return row [0]
+        digest = traceDigest (path)
+        self.connection.execute (
+            "INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?)",
+            (path, stat.st_size, stat.st_mtime, digest))
+        self.connection.commit ()
+        return digest
+
+    def __key (self, trace_digest, cache_type, params, seed):
+        return hashlib.sha1 (json.dumps ([trace_digest, cache_type, params,
+                                          seed, RESULTS_VERSION],
+                                         sort_keys = True)).hexdigest ()
+
+    def get (self, trace_digest, cache_type, params, seed = None):
+        """Return the stored result, or None."""
+        key = self.__key (trace_digest, cache_type, params, seed)
+        row = self.connection.execute (
+            "SELECT result FROM results WHERE key = ?", (key,)).fetchone ()
+        if row is None:
+            return None
+        self.connection.execute (
+            "UPDATE results SET accessed = ? WHERE key = ?",
+            (time.time (), key))
+        self.connection.commit ()
+        return json.loads (row [0])
+
+    def put (self, trace_digest, cache_type, params, seed, result):
+        now = time.time ()
+        self.connection.execute (
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (self.__key (trace_digest, cache_type, params, seed),
+             trace_digest,
+             cache_type,
+             json.dumps (params, sort_keys = True),
+             json.dumps (seed),
+             json.dumps (result, sort_keys = True),
+             now,
+             now))
+        self.connection.commit ()
+
+    def evict (self, max_age = None, max_bytes = None):
+        """Drop the results not used for max_age seconds, then the least
+        recently used ones until the stored results take at most
+        max_bytes. Return the number of results dropped."""
+        dropped = 0
+        if max_age is not None:
+            dropped += self.connection.execute (
+                "DELETE FROM results WHERE accessed < ?",
+                (time.time () - max_age,)).rowcount
+        if max_bytes is not None:
+            total = 0
+            stale = []
+            for key, size in self.connection.execute (
+                    "SELECT key, length (params) + length (result)"
+                    " FROM results ORDER BY accessed DESC"):
+                total += size
+                if total > max_bytes:
+                    stale.append ((key,))
+            self.connection.executemany ("DELETE FROM results WHERE key = ?",
+                                         stale)
+            dropped += len (stale)
+        self.connection.commit ()
+        return dropped
+
+    def getResults (self, cache_type = None, where = None):
+        """Return [(params, result)] of cache_type (all by default) whose
+        params have the values of the dict where."""
+        query = "SELECT params, result FROM results"
+        args = ()
+        if cache_type is not None:
+            query += " WHERE cache_type = ?"
+            args = (cache_type,)
+        results = []
+        for params, result in self.connection.execute (query, args):
+            params = json.loads (params)
+            if all (params.get (name) == value
+                    for name, value in (where or {}).items ()):
+                results.append ((params, json.loads (result)))
+        return results
+
+    def exportResults (self, cache_type, blocking_factor, where = None,
+                       value = 'hit_rate'):
+        """Write the matrix size and value of the results of cache_type
+        and blocking_factor to 'results-<Cache>-<BF>.txt', as
+        'Simulator.py simulate' does, for plot_graph. Return the
+        filename."""
+        where = dict (where or {}, blocking_factor = blocking_factor)
+        points = sorted ((params ['matrix_size'], result [value])
+                         for params, result in self.getResults (cache_type,
+                                                                where))
+        filename = 'results-{0}-{1}.txt'.format (cache_type, blocking_factor)
+        f = open (filename, 'w')
+        f.write ('\n'.join (','.join ((str (key), str (val)))
+                            for key, val in points))
+        f.close ()
+        return filename
+
+if __name__ == '__main__':
+    usage = ('Usage: ./ResultStore.py <store> evict [-a <max age (s)>]'
+             ' [-b <max bytes>]\n'
+             '       ./ResultStore.py <store> export <cache type>'
+             ' <blocking factor>')
+    if len (sys.argv) < 3 or sys.argv [2] not in ['evict', 'export']:
+        print usage
+        exit (1)
+    if sys.argv [2] == 'evict':
+        try:
+            opts, args = getopt.getopt (sys.argv [3:], "a:b:",
+                                        ["max-age=", "max-bytes="])
+        except getopt.GetoptError:
+            print usage
+            exit (1)
+        limits = {}
+        for opt, arg in opts:
+            if opt in ("-a", "--max-age"):
+                limits ['max_age'] = float (arg)
+            elif opt in ("-b", "--max-bytes"):
+                limits ['max_bytes'] = int (arg)
+    store = ResultStore (sys.argv [1])
+    if sys.argv [2] == 'evict':
+        print store.evict (**limits)
+    else:
+        print store.exportResults (sys.argv [3], int (sys.argv [4]))
+    store.close ()
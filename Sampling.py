@@ -0,0 +1,192 @@
+#! /usr/bin/python
+
+"""Approximate simulation of a sample of the trace, for quick triage.
+
+Time sampling simulates windows of the trace: every period accesses,
+warmup accesses to warm the cache up and then window accesses that are
+counted; the rest of the period is skipped. Misses of the windows to
+blocks last touched in a skipped stretch count as cold (or conflict)
+misses, so warm-up should be long enough to hide most of them.
+
+Set sampling simulates only the accesses that map to a random subset
+of the sets of the cache. Sets do not interact, so the sampled sets
+behave exactly as in a full simulation.
+
+Both return an estimate of the statistics of the full simulation,
+in the order of Cache.getStats, followed by the half width of the
+confidence interval of the hit rate:
+
+[#accesses, #cold misses, #conflict misses, hit rate, hit rate error]
+
+The hit rate is a ratio estimate over the windows (or sets) sampled;
+its error is z times its standard error (z = 1.96 for 95%), infinite
+when fewer than 2 of them have accesses and the sample does not cover
+the whole trace (or cache).
+"""
+
+import math
+import random
+import sys
+
+from Cache import *
+import Trace
+
+Z_95 = 1.96
+
+def _estimate (samples, total_accesses, sampled_fraction, z):
+    """Estimate from samples, a list of [#accesses, #cold misses,
+    #conflict misses] of each window or set, making up sampled_fraction
+    of the whole."""
+    sampled = [sum (column) for column in zip (*samples)] or [0, 0, 0]
+    accesses = sampled [0]
+    if accesses == 0:
+        return [total_accesses, 0, 0, 0.0, 100.0]
+    miss_ratio = float (sampled [1] + sampled [2]) / accesses
+    error = 0.0
+    n = len (samples)
+    if (sampled_fraction < 1
+        and len ([sample for sample in samples if sample [0]]) < 2):
+        # A single cluster tells nothing of the spread.
+        error = float ('inf')
+    elif n > 1:
+        # Variance of a ratio estimator over n clusters of accesses,
+        # less the part already covered (finite population correction).
+        mean_accesses = float (accesses) / n
+        residuals = sum ((cold + conflict - miss_ratio * count) ** 2
+                         for count, cold, conflict in samples)
+        variance = (residuals / (n - 1) / n / mean_accesses ** 2
+                    * max (0.0, 1 - sampled_fraction))
+        error = 100 * z * math.sqrt (variance)
+    scale = float (total_accesses) / accesses
+    return [total_accesses,
+            int (round (sampled [1] * scale)),
+            int (round (sampled [2] * scale)),
+            100 * (1 - miss_ratio),
+            error]
+
+def _counts (cache):
+    return [cache.getCumulativeCount (count)
+            for count in ['access_count',
+                          'cold_miss_count',
+                          'conflict_miss_count']]
+
+def simulate_time_sampled (cache, filename, window, period, warmup = 0,
+                           z = Z_95):
+    """Simulate window accesses after warmup warm-up accesses out of
+    every period accesses of trace file filename on cache. Return the
+    estimated statistics (see the module docstring)."""
+    if warmup + window > period:
+        raise ValueError ("warmup + window must not exceed period")
+    samples = []
+    position = 0
+    for ops, addrs in Trace.genTraceChunks (filename):
+        start = 0
+        while start < len (ops):
+            phase = position % period
+            if phase < warmup:
+                end = start + warmup - phase
+            elif phase < warmup + window:
+                end = start + warmup + window - phase
+            else:
+                end = start + period - phase
+            end = min (end, len (ops))
+            if phase < warmup + window:
+                if phase == warmup:
+                    before = _counts (cache)
+                cache.accessArrays (ops [start:end], addrs [start:end])
+                window_end = position - phase + warmup + window
+                if position + end - start == window_end:
+                    samples.append ([after - first for after, first
+                                     in zip (_counts (cache), before)])
+            position += end - start
+            start = end
+    if warmup < position % period < warmup + window:
+        # The trace ended in the middle of a window.
+        samples.append ([after - first for after, first
+                         in zip (_counts (cache), before)])
+    measured = sum (sample [0] for sample in samples)
+    return _estimate (samples, position,
+                      float (measured) / position if position else 1.0, z)
+
+def _sampledSetNumbers (n_sets, n_sampled_sets, seed):
+    return sorted (random.Random (seed).sample (xrange (n_sets),
+                                                n_sampled_sets))
+
+def simulate_set_sampled (cache, filename, n_sampled_sets, seed = 0,
+                          z = Z_95):
+    """Simulate the accesses of trace file filename that fall in
+    n_sampled_sets sets of cache, picked at random with seed. Return
+    the estimated statistics (see the module docstring)."""
+    if cache.shadow is not None:
+        raise ValueError ("Set sampling can not classify misses: the"
+                          " fully associative shadow spans all sets")
+    n_sampled_sets = min (n_sampled_sets, cache.n_sets)
+    set_numbers = _sampledSetNumbers (cache.n_sets, n_sampled_sets, seed)
+    sampled = bytearray (cache.n_sets)
+    for set_number in set_numbers:
+        sampled [set_number] = 1
+    offset_bits = cache.block_offset_bit_length
+    set_mask = cache.n_sets - 1
+    total_accesses = 0
+    for ops, addrs in Trace.genTraceChunks (filename):
+        total_accesses += len (ops)
+        if Trace.numpy is not None and isinstance (addrs,
+                                                   Trace.numpy.ndarray):
+            numpy = Trace.numpy
+            keep = numpy.frombuffer (sampled, dtype = numpy.uint8) [
+                (addrs >> numpy.uint64 (offset_bits))
+                & numpy.uint64 (set_mask)].astype (bool)
+            cache.accessArrays (ops [keep], addrs [keep])
+        else:
+            keep = [i for i, addr in enumerate (addrs)
+                    if sampled [(addr >> offset_bits) & set_mask]]
+            cache.accessArrays ([ops [i] for i in keep],
+                                [addrs [i] for i in keep])
+    if hasattr (cache, 'array'):
+        samples = [[cache.array [set_number].access_count,
+                    cache.array [set_number].cold_miss_count,
+                    cache.array [set_number].conflict_miss_count]
+                   for set_number in set_numbers]
+    else:
+        samples = [[cache.counts [count] [set_number]
+                    for count in ['access_count',
+                                  'cold_miss_count',
+                                  'conflict_miss_count']]
+                   for set_number in set_numbers]
+    return _estimate (samples, total_accesses,
+                      float (n_sampled_sets) / cache.n_sets, z)
+
+def printEstimate (cache, estimate):
+    """Print estimate for cache like Cache.printStats."""
+    separator = "=================="
+    print pad (cache.__class__.__name__ + " estimate", len (separator))
+    print separator
+    for count, name in zip (estimate [:3], ['access count',
+                                            'cold miss count',
+                                            'conflict miss count']):
+        print str (count) + '\t~' + name
+    print ("Hit Rate: "
+           + str (round (estimate [3], 3))
+           + "% +/- "
+           + str (round (estimate [4], 3))
+           + "%")
+
+if __name__ == '__main__':
+    if len (sys.argv) not in [3, 5]:
+        print ('Usage: ./Sampling.py <trace file> <#sampled sets>\n'
+               '       ./Sampling.py <trace file> <window> <period>'
+               ' <warm-up>')
+        exit (1)
+    trace_file = sys.argv [1]
+    block_size, cache_size, num_ways = 1024, 1048576, 16
+    cache = LRUCache ((cache_size / block_size) / num_ways,
+                      num_ways,
+                      block_size)
+    if len (sys.argv) == 3:
+        estimate = simulate_set_sampled (cache, trace_file,
+                                         int (sys.argv [2]))
+    else:
+        estimate = simulate_time_sampled (cache, trace_file,
+                                          *[int (arg)
+                                            for arg in sys.argv [2:]])
+    printEstimate (cache, estimate)
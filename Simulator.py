@@ -2,38 +2,92 @@
 
 import getopt
 # import matplotlib.pyplot as plot
+import random
 import sys
 
 from Cache import *
+import Native
+import Timing
+import Trace
 
 file_name = "pinatrace.out"
 block_size = 1024
 cache_size = 1048576
 num_ways = 16
 num_sets = 1
+timing = Timing.TimingModel ()
+cold_miss_tracker = None
+# See Sampling: the number of sets to simulate, and (window, period,
+# warm-up) of time sampling.
+sampled_sets = None
+time_sampling = None
+# See Parallel: the number of shards to split the simulation into.
+shards = None
+# The replacement policy of run, a key of policy_classes.
+policy = 'lru'
+policy_classes = {'random': Cache,
+                  'fifo': FIFOCache,
+                  'lru': LRUCache,
+                  'lfu': LFUCache,
+                  'plru': TreePLRUCache,
+                  'bitplru': BitPLRUCache,
+                  'srrip': SRRIPCache,
+                  'brrip': BRRIPCache,
+                  'drrip': DRRIPCache,
+                  'opt': OPTCache}
+# The policies that make random choices: sharded, they draw from a
+# generator per set (see Parallel).
+random_policies = ('random', 'brrip')
 
 def readOptions(argv):
-    global file_name, block_size, cache_size, num_ways, num_sets
+    """Set the globals from the options in argv, return the other
+    arguments."""
+    global file_name, block_size, cache_size, num_ways, num_sets, timing
+    global cold_miss_tracker, sampled_sets, time_sampling, shards, policy
 
     help_message = """
 Usage:
 
-$ ./cache_simulator.py [options]
+$ ./Simulator.py run [options] [<trace file>]
 
 -f --trace-file: name of the trace file (mem.trace default)
 -b --block-size: block size for the cache in bytes (1K default)
 -c --cache-size: size of the cache in bytes (1M default)
 -w --ways      : number of ways in the cache (16 default)
+-P --policy    : replacement policy, one of random, fifo, lru, lfu,
+                 plru (tree), bitplru, srrip, brrip, drrip or opt
+                 (lru default)
+-l --hit-latency      : cycles of a cache access (1 default)
+-p --miss-penalty     : extra cycles of a miss (100 default)
+-r --writeback-penalty: cycles to write back a dirty block (0 default)
+                        (the AMAT and cycles are printed unless sampled)
+-t --cold-miss-tracker: 'exact' or 'bloom', to remember the blocks seen
+                        in bounded memory (a set per cache set default)
+-S --sample-sets      : simulate only this many sets, for an estimate
+-T --time-sample      : window:period:warm-up, simulate window accesses
+                        after warm-up ones out of every period, for an
+                        estimate
+-j --shards           : simulate in this many processes, split by set
+                        (not with -t, drrip or opt)
 
 Note: All byte numbers should be non-negative powers of 2.
+opt needs every access of the trace, so it can not be sampled.
 """
     try:
-        opts, args = getopt.getopt (argv,
-                                    "hb:c:f:m:w:",
+        opts, args = getopt.gnu_getopt (argv,
+                                    "hb:c:f:m:w:P:l:p:r:t:S:T:j:",
                                     ["block-size=",
                                      "cache-size=",
                                      "trace-file=",
-                                     "ways="])
+                                     "ways=",
+                                     "policy=",
+                                     "hit-latency=",
+                                     "miss-penalty=",
+                                     "writeback-penalty=",
+                                     "cold-miss-tracker=",
+                                     "sample-sets=",
+                                     "time-sample=",
+                                     "shards="])
     except getopt.GetoptError:
         print help_message
         sys.exit(2)
@@ -62,19 +116,127 @@ Note: All byte numbers should be non-negative powers of 2.
                     cache_size = int (arg [:-1]) * 1024
         elif opt in ("-w", "--ways"):
             num_ways = int(arg)
-    
+        elif opt in ("-P", "--policy"):
+            policy = arg
+        elif opt in ("-l", "--hit-latency"):
+            timing.hit_latency = int(arg)
+        elif opt in ("-p", "--miss-penalty"):
+            timing.miss_penalty = int(arg)
+        elif opt in ("-r", "--writeback-penalty"):
+            timing.writeback_penalty = int(arg)
+        elif opt in ("-t", "--cold-miss-tracker"):
+            cold_miss_tracker = arg
+        elif opt in ("-S", "--sample-sets"):
+            sampled_sets = int(arg)
+        elif opt in ("-T", "--time-sample"):
+            time_sampling = tuple (int (part) for part in arg.split (':'))
+        elif opt in ("-j", "--shards"):
+            shards = int(arg)
+
+    if (policy not in policy_classes
+        or (policy == 'opt'
+            and (sampled_sets is not None or time_sampling is not None))
+        or (shards is not None
+            and (cold_miss_tracker is not None
+                 or policy in ('drrip', 'opt')))):
+        print help_message
+        sys.exit(2)
     num_sets =  (cache_size/block_size)/num_ways
+    return args
 
 def simulate (cache, memtrace):
-    for mode, addr in memtrace:
+    """Simulate memtrace (as from genMemtrace) on cache. Return the
+    number of non-memory instructions in it, as simulate_file."""
+    instruction_count = 0
+    for access in memtrace:
+        mode, addr = access [0], access [1]
         if mode == 'R':
             cache.read (addr)
         elif mode == 'W':
             cache.write (addr)
+        if len (access) > 2:
+            instruction_count += int (access [2])
     # cache.printStats ()
+    return instruction_count
+
+def simulate_file (cache, filename):
+    """Same as simulate (cache, genMemtrace (filename)), but reads the
+    trace in bulk chunks and feeds them to cache.accessArrays.
+
+    Return the number of non-memory instructions in the trace (0 if it
+    does not record them), for Timing."""
+    instruction_count = 0
+    for ops, addrs, gaps in Trace.genTraceChunks (filename,
+                                                  with_gaps = True):
+        cache.accessArrays (ops, addrs)
+        instruction_count += int (sum (gaps))
+    return instruction_count
     
+def simulate_estimate (cache, filename):
+    """Simulate trace file filename on cache as set by the sampling
+    and sharding options. Return ([#accesses, #cold misses, #conflict
+    misses, hit rate, hit rate error] as in Sampling (error 0 if not
+    sampled), the number of non-memory instructions as simulate_file
+    (None if sampled))."""
+    import Sampling
+    if sampled_sets is not None:
+        return (Sampling.simulate_set_sampled (cache, filename,
+                                               sampled_sets),
+                None)
+    if time_sampling is not None:
+        return (Sampling.simulate_time_sampled (cache, filename,
+                                                *time_sampling),
+                None)
+    if shards is not None:
+        import Parallel
+        instruction_count = Parallel.simulate_file_sharded (cache,
+                                                            filename,
+                                                            shards)
+        return cache.getStats () + [0.0], instruction_count
+    instruction_count = simulate_file (cache, filename)
+    return cache.getStats () + [0.0], instruction_count
+
+def run_from_options (argv):
+    """Simulate the trace given by the options in argv (see readOptions)
+    on a cache as they describe, and print its statistics and
+    timing, or the estimate of them with the half width of the
+    confidence interval of the hit rate if sampled."""
+    args = readOptions (argv)
+    filename = args [0] if args else file_name
+    if policy == 'opt':
+        cache = OPTCache (num_sets,
+                          num_ways,
+                          block_size,
+                          genSampleAddr (filename),
+                          cold_miss_tracker = cold_miss_tracker,
+                          filename = filename)
+    else:
+        set_seed = None
+        if shards is not None and policy in random_policies:
+            set_seed = random.getrandbits (32)
+        cache = Native.fastCacheOf (policy_classes [policy],
+                                    num_sets,
+                                    num_ways,
+                                    block_size,
+                                    genSampleAddr (filename),
+                                    cold_miss_tracker = cold_miss_tracker,
+                                    set_seed = set_seed)
+    estimate, instruction_count = simulate_estimate (cache, filename)
+    if sampled_sets is not None or time_sampling is not None:
+        import Sampling
+        Sampling.printEstimate (cache, estimate)
+        return
+    cache.printStats ()
+    amat, cycles = timing.getStats (cache, instruction_count or 0)
+    print "AMAT: " + str (round (amat, 3)) + " cycles"
+    print str (cycles) + '\testimated cycles'
+
 def genMemtrace (filename):
     """ Returns a list of pairs, [r/w, addr] """
+    if Trace.isBinaryTrace (filename):
+        for pair in Trace.genBinaryMemtrace (filename):
+            yield pair
+        return
     tracefile = open (filename)
     line = tracefile.readline ()
     while line :
@@ -88,6 +250,8 @@ def genMemtrace (filename):
     # return trace
 
 def genSampleAddr(filename):
+    if Trace.isBinaryTrace (filename):
+        return Trace.binarySampleAddr (filename)
     tracefile = open (filename)
     line = tracefile.readline ()
     return line.strip().split() [1]
@@ -168,6 +332,36 @@ def plot_cache_graphs (cache_list, blocking_factor_list):
     for cache_type in cache_list:
         plot_graph (cache_type, blocking_factor_list)
         
+def plot_files (series, xlabel, ylabel, title, output_filename,
+                logx = False):
+    """Plot a line for each (label, filename) of series, through the
+    points of the file (as written by write_result_to_file), and save
+    the graph to output_filename.
+
+    matplotlib is only needed (and imported) here.
+    """
+    import matplotlib
+    matplotlib.use ('Agg')
+    import matplotlib.pyplot as plot
+    for label, filename in series:
+        f = open (filename, 'r')
+        points = [(float (line.split (',')[0]),
+                   float (line.split (',')[1]))
+                  for line in f if line.strip ()]
+        f.close ()
+        if not points:
+            continue
+        x_vals, y_vals = zip (*points)
+        plot.plot (x_vals, y_vals, label = label)
+    if logx:
+        plot.xscale ('log', basex = 2)
+    plot.xlabel (xlabel)
+    plot.ylabel (ylabel)
+    plot.legend (loc = 'upper right')
+    plot.title (title)
+    plot.savefig (output_filename)
+    plot.close ()
+
 def plot_graph (cache_type, blocking_factor_list):
     """
     Plot graph 'Conflict Miss Rate vs Matrix Size' for given blocking
@@ -175,27 +369,20 @@ def plot_graph (cache_type, blocking_factor_list):
 
     Read stats from 'results-<Cache name>-<Blocking factor>.txt' file.
     """
-    for blocking_factor in blocking_factor_list:
-        filename = 'results-{0}-{1}.txt'.format (cache_type.__name__, blocking_factor)
-        f = open (filename, 'r')
-        size_miss_rate_list = [(int (line.split (',')[0]),
-                                float (line.split (',')[1]))
-                                for line in f]
-        f.close ()
-        x_vals, y_vals = zip (*size_miss_rate_list)
-        # print x_vals
-        # print y_vals
-        plot.plot (x_vals, y_vals, label = 'BF - {0}'.format (blocking_factor))
-    plot.xlabel ('Matrix Size')
-    plot.ylabel ('Conflict Miss Rate')
-    plot.legend (loc = 'upper right')
-    plot.title (r'Graph for Block Matrix Multiplication using {0}'.format (
-        cache_type.__name__))
-    plot.savefig ('results-{0}.png'.format (cache_type.__name__))
-    plot.close ()
+    plot_files ([('BF - {0}'.format (blocking_factor),
+                  'results-{0}-{1}.txt'.format (cache_type.__name__,
+                                                blocking_factor))
+                 for blocking_factor in blocking_factor_list],
+                'Matrix Size',
+                'Conflict Miss Rate',
+                r'Graph for Block Matrix Multiplication using {0}'.format (
+                    cache_type.__name__),
+                'results-{0}.png'.format (cache_type.__name__))
     
 if __name__ == "__main__":
-    # readOptions (sys.argv [1:])
+    if sys.argv [1:2] == ['run']:
+        run_from_options (sys.argv [2:])
+        sys.exit ()
     file_name = 'sample-mem-trace.txt'
     memtrace = genMemtrace (file_name)
     sample_addr = genSampleAddr (file_name)
@@ -215,35 +402,102 @@ if __name__ == "__main__":
     matrix_size_list = range (16, 100, 16)
 
     if len (sys.argv) != 2:
-        print 'Enter exactly 1 argument out of:\nplot\nsimulate\nsimulate_all\n'
+        print 'Enter exactly 1 argument out of:\nplot\nsimulate\nsimulate_generated\nsimulate_all\nsweep\nor: run [options] <trace file> (run -h for the options)\n'
         exit (1)
 
     if sys.argv[1] == 'simulate':
+        # Results of traces and configurations simulated before are
+        # taken from the store.
+        import random
+        import ResultStore
+        store = ResultStore.ResultStore ()
         output_dict = {}
         for cache_type in cache_list:
             output_dict[cache_type] = {}
             cache_size = cache_size_list[-1]
             block_size = block_size_list[-1]
             num_ways = ways_list[-1]
-            cache = cache_type ((cache_size / block_size) / num_ways,
-                                num_ways,
-                                block_size,
-                                sample_addr,
-                                write_no_allocate = True)
             for blocking_factor in blocking_factor_list:
                 output_dict[cache_type][blocking_factor] = []
                 for matrix_size in matrix_size_list:
                     # TODO: Have actual memtraces in these files
-                    memtrace = genMemtrace ('memtrace-{0}-{1}.txt'.format (
-                        matrix_size, blocking_factor))
-                    simulate (cache, memtrace)
+                    trace_file = 'memtrace-{0}-{1}.txt'.format (
+                        matrix_size, blocking_factor)
+                    key = (store.getTraceDigest (trace_file),
+                           cache_type.__name__,
+                           {'cache_size': cache_size,
+                            'block_size': block_size,
+                            'num_ways': num_ways,
+                            'write_no_allocate': True,
+                            'cold_miss_tracker': cold_miss_tracker,
+                            'matrix_size': matrix_size,
+                            'blocking_factor': blocking_factor},
+                           0)
+                    result = store.get (*key)
+                    if result is None:
+                        # A fresh cache for every trace, so that the
+                        # results of one run don't bleed into the next.
+                        random.seed (key [-1])
+                        cache = Native.fastCacheOf (
+                            cache_type,
+                            (cache_size / block_size) / num_ways,
+                            num_ways,
+                            block_size,
+                            sample_addr,
+                            write_no_allocate = True,
+                            cold_miss_tracker = cold_miss_tracker)
+                        simulate_file (cache, trace_file)
+                        result = dict (zip (['access_count',
+                                             'cold_miss_count',
+                                             'conflict_miss_count',
+                                             'hit_rate'],
+                                            cache.getStats ()))
+                        store.put (*(key + (result,)))
                     output_dict[cache_type][blocking_factor].append (
-                        (matrix_size, cache.getHitRate ()))
+                        (matrix_size, result ['hit_rate']))
                 # print output_dict[cache_type][blocking_factor]
                 write_result_to_file (
                     'results-{0}-{1}.txt'.format (cache_type.__name__, blocking_factor),
                     output_dict[cache_type][blocking_factor])
+    elif sys.argv[1] == 'simulate_generated':
+        # Same as simulate, on the accesses of the multiply generated
+        # by MatrixTrace instead of pin traces.
+        import MatrixTrace
+        for cache_type in cache_list:
+            cache_size = cache_size_list[-1]
+            block_size = block_size_list[-1]
+            num_ways = ways_list[-1]
+            for blocking_factor in blocking_factor_list:
+                results = []
+                for matrix_size in matrix_size_list:
+                    cache = Native.fastCacheOf (
+                        cache_type,
+                        (cache_size / block_size) / num_ways,
+                        num_ways,
+                        block_size,
+                        '0x' + '0' * 16,
+                        write_no_allocate = True,
+                        cold_miss_tracker = cold_miss_tracker)
+                    MatrixTrace.simulate_matmul (cache, matrix_size,
+                                                 blocking_factor)
+                    results.append ((matrix_size, cache.getHitRate ()))
+                write_result_to_file (
+                    'results-{0}-{1}.txt'.format (cache_type.__name__, blocking_factor),
+                    results)
     elif sys.argv[1] == 'plot':
         plot_cache_graphs (cache_list, blocking_factor_list)
     elif sys.argv[1] == 'simulate_all':
         ye_old_simulation_attempt ()
+    elif sys.argv[1] == 'sweep':
+        import Sweep
+        import ResultStore
+        Sweep.sweep ({'cache_type': [cache_type.__name__
+                                     for cache_type in cache_list],
+                      'write_no_allocate': true_false_list,
+                      'cache_size': cache_size_list,
+                      'block_size': block_size_list,
+                      'num_ways': ways_list,
+                      'matrix_size': matrix_size_list,
+                      'blocking_factor': blocking_factor_list},
+                     'sweep-results.jsonl',
+                     store = ResultStore.ResultStore ())
@@ -0,0 +1,189 @@
+#! /usr/bin/python
+
+"""LRU stack distance (Mattson) analysis.
+
+In an LRU set, an access hits iff fewer than n_ways distinct tags of
+that set have been touched since the previous access to the same tag.
+That count is the stack distance of the access. So one pass over a
+trace, recording a histogram of stack distances, gives the hit and
+miss counts of LRUCache for every associativity at once. For a given
+block size and number of sets, it gives them for every cache size.
+With n_sets = 1 it covers fully associative caches of every capacity.
+
+Stack distances are computed with a Fenwick tree over access times,
+marking the time of the latest access of each block (Bennett and
+Kruskal), which costs O(log n) per access instead of a walk down the
+LRU stack.
+
+The curves are exact for write allocate caches. With write no
+allocate, write misses do not enter the stack, which a single pass
+cannot know for every size at once.
+"""
+
+import collections
+import math
+import sys
+
+import Cache
+import Trace
+
+INFINITE = -1
+
+class FenwickTree (object):
+    """Prefix sums over positions 0 .. size - 1."""
+    def __init__ (self, size):
+        self.size = size
+        self.tree = [0] * (size + 1)
+
+    def add (self, position, value):
+        position += 1
+        while position <= self.size:
+            self.tree [position] += value
+            position += position & -position
+
+    def prefixSum (self, position):
+        """Sum of positions 0 .. position - 1."""
+        total = 0
+        while position > 0:
+            total += self.tree [position]
+            position -= position & -position
+        return total
+
+
+class StackDistanceCounter (object):
+    """Stack distances of a sequence of tags of one set."""
+    def __init__ (self, initial_size = 1024):
+        self.initial_size = initial_size
+        self.tree = FenwickTree (initial_size)
+        # {tag: time of its latest access}
+        self.last_access = {}
+        self.time = 0
+
+    def __compact (self):
+        """Renumber the latest accesses 0, 1, ... so that the tree only
+        needs to be as large as the number of distinct tags."""
+        tags = sorted (self.last_access, key = self.last_access.get)
+        self.tree = FenwickTree (max (self.initial_size, 2 * len (tags)))
+        for time, tag in enumerate (tags):
+            self.last_access [tag] = time
+            self.tree.add (time, 1)
+        self.time = len (tags)
+
+    def access (self, tag):
+        """Return the stack distance of this access to tag, INFINITE
+        if tag was never accessed before."""
+        if self.time == self.tree.size:
+            self.__compact ()
+        previous = self.last_access.get (tag)
+        if previous is None:
+            distance = INFINITE
+        else:
+            distance = (self.tree.prefixSum (self.time)
+                        - self.tree.prefixSum (previous + 1))
+            self.tree.add (previous, -1)
+        self.tree.add (self.time, 1)
+        self.last_access [tag] = self.time
+        self.time += 1
+        return distance
+
+
+class StackDistanceAnalyzer (object):
+    """Stack distance histogram of a trace for a block size and number
+    of sets, from which LRU statistics for any number of ways follow.
+    """
+    def __init__ (self, n_sets, block_size):
+        self.n_sets = n_sets
+        self.block_size = block_size
+        self.block_offset_bit_length = int (math.log (block_size, 2))
+        self.set_number_bit_length = int (math.log (n_sets, 2))
+        # {set number: StackDistanceCounter}, of the sets touched so
+        # far; those of caches with many sets start small.
+        initial_size = max (64, 1024 / n_sets)
+        self.counters = collections.defaultdict (
+            lambda: StackDistanceCounter (initial_size))
+        # {stack distance: #accesses}
+        self.histogram = collections.defaultdict (int)
+        self.access_count = 0
+
+    def access (self, addr):
+        block_addr = addr >> self.block_offset_bit_length
+        set_number = block_addr & ((1 << self.set_number_bit_length) - 1)
+        tag = block_addr >> self.set_number_bit_length
+        self.histogram [self.counters [set_number].access (tag)] += 1
+        self.access_count += 1
+
+    def accessArrays (self, ops, addrs):
+        if Trace.numpy is not None and isinstance (addrs,
+                                                   Trace.numpy.ndarray):
+            addrs = addrs.tolist ()
+        for addr in addrs:
+            self.access (addr)
+
+    def getStats (self, n_ways):
+        """Return the LRUCache.getStats () list (write allocate) for a
+        cache of this analyzer's sets and block size with n_ways."""
+        cold = self.histogram [INFINITE]
+        hits = sum (count for distance, count in self.histogram.iteritems ()
+                    if 0 <= distance < n_ways)
+        conflict = self.access_count - hits - cold
+        return [self.access_count,
+                cold,
+                conflict,
+                100 * (1 - float (cold + conflict) / self.access_count)]
+
+    def getMissCurve (self, ways_list):
+        """Return [(cache size in bytes, #misses)] for each number of
+        ways in ways_list."""
+        return [(self.n_sets * n_ways * self.block_size,
+                 sum (self.getStats (n_ways) [1:3]))
+                for n_ways in ways_list]
+
+    def getHitRateCurve (self, ways_list):
+        """Return [(cache size in bytes, hit rate %)] for each number of
+        ways in ways_list."""
+        return [(self.n_sets * n_ways * self.block_size,
+                 self.getStats (n_ways) [3])
+                for n_ways in ways_list]
+
+
+def analyze_file (filename, n_sets_list, block_size):
+    """Return {n_sets: StackDistanceAnalyzer} for trace file filename,
+    reading the trace once for all of n_sets_list."""
+    analyzers = dict ((n_sets, StackDistanceAnalyzer (n_sets, block_size))
+                      for n_sets in n_sets_list)
+    for ops, addrs in Trace.genTraceChunks (filename):
+        if Trace.numpy is not None:
+            addrs = addrs.tolist ()
+        for analyzer in analyzers.values ():
+            analyzer.accessArrays (ops, addrs)
+    return analyzers
+
+def cross_check (filename, n_sets, block_size, ways_list, sample_addr):
+    """Compare the analyzer with LRUCache runs for each of ways_list.
+
+    Return the list of (n_ways, analyzer stats, LRUCache stats) that
+    differ, empty if they all agree.
+    """
+    analyzer = analyze_file (filename, [n_sets], block_size) [n_sets]
+    mismatches = []
+    for n_ways in ways_list:
+        cache = Cache.LRUCache (n_sets, n_ways, block_size, sample_addr)
+        for ops, addrs in Trace.genTraceChunks (filename):
+            cache.accessArrays (ops, addrs)
+        if analyzer.getStats (n_ways) != cache.getStats ():
+            mismatches.append ((n_ways,
+                                analyzer.getStats (n_ways),
+                                cache.getStats ()))
+    return mismatches
+
+if __name__ == '__main__':
+    if len (sys.argv) != 4:
+        print 'Usage: ./StackDistance.py <trace file> <block size> <#sets>'
+        exit (1)
+    block_size, n_sets = int (sys.argv [2]), int (sys.argv [3])
+    analyzer = analyze_file (sys.argv [1], [n_sets], block_size) [n_sets]
+    ways_list = [2 ** i for i in range (17)]
+    for (size, misses), (size, hit_rate) in zip (
+        analyzer.getMissCurve (ways_list),
+        analyzer.getHitRateCurve (ways_list)):
+        print Cache.getHumanReadableSize (size), misses, hit_rate
@@ -0,0 +1,212 @@
+#! /usr/bin/python
+
+"""Parallel parameter sweeps.
+
+A sweep is described by a grid, a dict mapping each parameter to the
+list of values to try:
+
+grid = {'cache_type'       : ['Cache', 'LRUCache'],
+        'write_no_allocate': [True, False],
+        'cache_size'       : [1048576],
+        'block_size'       : [16],
+        'num_ways'         : [4],
+        'matrix_size'      : [16, 32],
+        'blocking_factor'  : [1, 2, 4]}
+
+Every combination is simulated in a pool of worker processes. The
+trace of a configuration is trace_pattern formatted with the
+configuration (so it may depend on matrix_size and blocking_factor).
+Text traces are converted once to the binary format first, stored
+uncompressed and without delta encoding: the workers memory-map them,
+sharing the records through the page cache, and decoding a block is
+a copy of it instead of a decompression. One JSON line per
+configuration is written to the output file as soon as its result
+comes in.
+
+Given a ResultStore.ResultStore, sweep only simulates the
+configurations whose results are not in it yet, and stores them.
+"""
+
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+
+import Cache
+import Native
+import Simulator
+import Timing
+import Trace
+
+DEFAULT_TRACE_PATTERN = 'memtrace-{matrix_size}-{blocking_factor}.txt'
+
+def expand_grid (grid):
+    """Return the list of configurations (dicts) in grid."""
+    keys = sorted (grid)
+    return [dict (zip (keys, values))
+            for values in itertools.product (*[grid [key] for key in keys])]
+
+def make_cache (config, sample_addr):
+    """Return an empty cache as described by config (through
+    Native.fastCacheOf, but for OPTCache which reads the trace up
+    front)."""
+    cache_type = getattr (Cache, config ['cache_type'])
+    num_ways = config ['num_ways']
+    block_size = config ['block_size']
+    if cache_type is Cache.OPTCache:
+        return Cache.OPTCache (
+            (config ['cache_size'] / block_size) / num_ways,
+            num_ways,
+            block_size,
+            sample_addr,
+            write_no_allocate = config ['write_no_allocate'],
+            classify_misses = config.get ('classify_misses', False),
+            cold_miss_tracker = config.get ('cold_miss_tracker'),
+            filename = config ['trace'])
+    return Native.fastCacheOf (
+        cache_type,
+        (config ['cache_size'] / block_size) / num_ways,
+        num_ways,
+        block_size,
+        sample_addr,
+        write_no_allocate = config ['write_no_allocate'],
+        classify_misses = config.get ('classify_misses', False),
+        cold_miss_tracker = config.get ('cold_miss_tracker'))
+
+def run_config (config):
+    """Simulate one configuration, return config with its statistics.
+
+    config must have a 'trace' key naming the trace file. The optional
+    hit_latency, miss_penalty, writeback_penalty and
+    cycles_per_instruction keys set the Timing.TimingModel used for
+    the 'amat' and 'cycles' results. If classify_misses is true, the
+    misses are split into cold, capacity and conflict misses. The
+    optional cold_miss_tracker key ('exact' or 'bloom') is passed on to
+    the cache.
+    """
+    random.seed (config.get ('seed', 0))
+    cache = make_cache (config, Simulator.genSampleAddr (config ['trace']))
+    instruction_count = Simulator.simulate_file (cache, config ['trace'])
+    timing = Timing.TimingModel (**dict (
+        (key, config [key]) for key in ['hit_latency',
+                                        'miss_penalty',
+                                        'writeback_penalty',
+                                        'cycles_per_instruction']
+        if key in config))
+    result = dict (config)
+    (result ['access_count'],
+     result ['cold_miss_count'],
+     result ['conflict_miss_count'],
+     result ['hit_rate']) = cache.getStats ()
+    result ['amat'], result ['cycles'] = timing.getStats (cache,
+                                                          instruction_count)
+    if config.get ('classify_misses'):
+        (result ['cold_miss_count'],
+         result ['capacity_miss_count'],
+         result ['conflict_miss_count']) = cache.getMissBreakdown ()
+    if cache.cold_miss_tracker is not None:
+        result ['cold_miss_error_bound'] = (
+            cache.cold_miss_tracker.getErrorBound ())
+    return result
+
+def prepare_traces (filenames, directory):
+    """Convert the text traces among filenames to binary traces in
+    directory. Return {filename: trace file to simulate}."""
+    prepared = {}
+    for filename in filenames:
+        if Trace.isBinaryTrace (filename):
+            prepared [filename] = filename
+        else:
+            prepared [filename] = os.path.join (
+                directory, str (len (prepared)) + '.trace')
+            # Raw records: nothing to decompress or sum up per worker.
+            Trace.convertTextTrace (filename, prepared [filename],
+                                    compress = False, delta = False)
+    return prepared
+
+def storeKey (config, digests):
+    """Return the ResultStore key (trace digest, cache type, params,
+    seed) of config, given {trace: digest}."""
+    params = dict ((key, config [key]) for key in config
+                   if key not in ['trace', 'cache_type', 'seed'])
+    return (digests [config ['trace']], config ['cache_type'], params,
+            config.get ('seed', 0))
+
+def sweep (grid,
+           output_filename,
+           trace_pattern = DEFAULT_TRACE_PATTERN,
+           processes = None,
+           store = None):
+    """Simulate every configuration of grid across processes worker
+    processes (all cores by default), appending one JSON line per
+    result to output_filename. Return the list of results.
+
+    store: a ResultStore.ResultStore to take the results already known
+    from and to put the new ones in."""
+    configs = expand_grid (grid)
+    for config in configs:
+        config ['trace'] = trace_pattern.format (**config)
+
+    results = []
+    output = open (output_filename, 'a')
+    if store is not None:
+        digests = dict ((trace, store.getTraceDigest (trace))
+                        for trace in set (config ['trace']
+                                          for config in configs))
+        missing = []
+        for config in configs:
+            result = store.get (*storeKey (config, digests))
+            if result is None:
+                missing.append (config)
+                continue
+            result = dict (result, trace = config ['trace'])
+            output.write (json.dumps (result, sort_keys = True) + '\n')
+            results.append (result)
+        output.flush ()
+        configs = missing
+    if not configs:
+        output.close ()
+        return results
+
+    directory = tempfile.mkdtemp (prefix = 'sweep-')
+    pool = None
+    try:
+        prepared = prepare_traces (
+            sorted (set (config ['trace'] for config in configs)),
+            directory)
+        jobs = []
+        for config in configs:
+            job = dict (config)
+            job ['trace'] = prepared [config ['trace']]
+            jobs.append (job)
+
+        pool = multiprocessing.Pool (processes)
+        # Workers only know the converted trace, put the original back.
+        trace_names = dict ((prepared [name], name) for name in prepared)
+        for result in pool.imap_unordered (run_config, jobs):
+            result ['trace'] = trace_names [result ['trace']]
+            output.write (json.dumps (result, sort_keys = True) + '\n')
+            output.flush ()
+            results.append (result)
+            if store is not None:
+                # Every config has the keys of the grid and 'trace'.
+                config = dict ((key, result [key]) for key in configs [0])
+                store.put (*(storeKey (config, digests) + (result,)))
+        pool.close ()
+        pool.join ()
+        return results
+    finally:
+        output.close ()
+        if pool is not None:
+            pool.terminate ()
+        shutil.rmtree (directory)
+
+def read_results (filename):
+    """Return the list of results written by sweep to filename."""
+    f = open (filename)
+    results = [json.loads (line) for line in f if line.strip ()]
+    f.close ()
+    return results
@@ -0,0 +1,110 @@
+#! /usr/bin/python
+
+"""Timing estimates from cache statistics.
+
+The simulation itself only counts accesses, misses and write backs.
+These models turn the counts into cycles: the average memory access
+time (AMAT) and an estimate of the total cycles of the traced run,
+using the number of instructions executed between memory accesses
+(the third column of the trace, see Trace).
+"""
+
+class TimingModel (object):
+    """Latencies of a single cache level in front of main memory.
+
+    hit_latency: cycles of every access, hit or miss (the lookup).
+    miss_penalty: extra cycles of a miss, to get the block.
+    writeback_penalty: cycles to write a dirty block back.
+    cycles_per_instruction: cycles of each non-memory instruction.
+    """
+    def __init__ (self,
+                  hit_latency = 1,
+                  miss_penalty = 100,
+                  writeback_penalty = 0,
+                  cycles_per_instruction = 1):
+        self.hit_latency = hit_latency
+        self.miss_penalty = miss_penalty
+        self.writeback_penalty = writeback_penalty
+        self.cycles_per_instruction = cycles_per_instruction
+
+    def getMemoryCycles (self, cache):
+        """Return the cycles spent in memory accesses by cache.
+
+        A block read, written to, then evicted costs one write back:
+
+        >>> from Cache import LRUCache
+        >>> cache = LRUCache (1, 1, 16, '0x0000')
+        >>> [cache.read (0), cache.write (0), cache.read (16)]
+        [False, True, False]
+        >>> model = TimingModel (miss_penalty = 10, writeback_penalty = 100)
+        >>> model.getMemoryCycles (cache) # 3 accesses, 2 misses
+        123
+        """
+        accesses = cache.getCumulativeCount ('access_count')
+        misses = (cache.getCumulativeCount ('cold_miss_count')
+                  + cache.getCumulativeCount ('conflict_miss_count'))
+        writebacks = cache.getCumulativeCount ('writeback_count')
+        return (accesses * self.hit_latency
+                + misses * self.miss_penalty
+                + writebacks * self.writeback_penalty)
+
+    def getAMAT (self, cache):
+        """Return the average memory access time, in cycles."""
+        accesses = cache.getCumulativeCount ('access_count')
+        if accesses == 0:
+            return 0.0
+        return float (self.getMemoryCycles (cache)) / accesses
+
+    def getCycles (self, cache, instruction_count):
+        """Return the estimated cycles of a run of instruction_count
+        non-memory instructions plus the accesses simulated by cache."""
+        return (instruction_count * self.cycles_per_instruction
+                + self.getMemoryCycles (cache))
+
+    def getStats (self, cache, instruction_count):
+        """Return [AMAT, estimated cycles]."""
+        return [self.getAMAT (cache),
+                self.getCycles (cache, instruction_count)]
+
+
+class HierarchyTimingModel (TimingModel):
+    """Latencies of a Hierarchy.CacheHierarchy.
+
+    hit_latencies: lookup cycles of each level, L1 first, paid by
+                   every access reaching that level (write backs
+                   from the level above included).
+    memory_latency: cycles of a read from main memory.
+    memory_write_latency: cycles of a write to main memory, same as
+                          memory_latency by default.
+    """
+    def __init__ (self,
+                  hit_latencies,
+                  memory_latency = 100,
+                  memory_write_latency = None,
+                  cycles_per_instruction = 1):
+        self.hit_latencies = hit_latencies
+        self.memory_latency = memory_latency
+        if memory_write_latency is None:
+            memory_write_latency = memory_latency
+        self.memory_write_latency = memory_write_latency
+        self.cycles_per_instruction = cycles_per_instruction
+
+    def getMemoryCycles (self, hierarchy):
+        return (sum (level.getCumulativeCount ('access_count') * latency
+                     for level, latency in zip (hierarchy.levels,
+                                                self.hit_latencies))
+                + hierarchy.memory_read_count * self.memory_latency
+                + hierarchy.memory_write_count * self.memory_write_latency)
+
+    def getAMAT (self, hierarchy):
+        """Return the average time of the accesses of the trace (the L1
+        accesses), in cycles."""
+        accesses = hierarchy.levels [0].getCumulativeCount ('access_count')
+        if accesses == 0:
+            return 0.0
+        return float (self.getMemoryCycles (hierarchy)) / accesses
+
+if __name__ == '__main__':
+    # Check the examples above.
+    import doctest
+    doctest.testmod ()
@@ -0,0 +1,370 @@
+#! /usr/bin/python
+
+"""Bulk loading of memory traces, text and binary.
+
+A trace is turned into two parallel arrays, one op per access
+(READ / WRITE, which are the same values as Set.clean / Set.dirty) and
+one integer byte address per access, instead of one tuple of strings
+per line. With numpy the arrays are numpy arrays (uint8 and uint64)
+and the hex addresses are decoded column-wise without a Python-level
+int () per access; without numpy, plain lists are returned.
+
+Binary trace format (little endian), see convertTextTrace:
+
+header: magic 'CSDT', version (B), flags (B), hex digits of the
+        addresses in the text trace (B), pad (x), records (Q)
+blocks: records in the block (I), payload bytes (I), payload
+payload: one op byte per record, then one 8-byte address per record,
+         as differences from the previous address if FLAG_DELTA,
+         then one 4-byte instruction count per record if FLAG_GAPS,
+         the whole payload zlib compressed if FLAG_COMPRESSED.
+
+The array readers take a with_gaps argument; if true, a third array is
+returned with the number of instructions executed since the previous
+access (the optional third column of text traces, 0 if absent).
+"""
+
+import array
+import mmap
+import struct
+import sys
+import zlib
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+READ, WRITE = 0, 1
+_op_tokens = frozenset (['R', 'W'])
+
+# Bytes of trace text read per chunk by genTraceChunks.
+DEFAULT_CHUNK_SIZE = 1 << 24
+
+BINARY_MAGIC = 'CSDT'
+BINARY_VERSION = 1
+FLAG_COMPRESSED, FLAG_DELTA, FLAG_GAPS = 1, 2, 4
+_header = struct.Struct ('<4sBBBxQ')
+_block_header = struct.Struct ('<II')
+# Records per block written by BinaryTraceWriter.
+DEFAULT_BLOCK_RECORDS = 1 << 16
+_mask_64 = (1 << 64) - 1
+
+if numpy is not None:
+    # Value of each hex digit, indexed by its ASCII code. Anything
+    # else (including the 'x' of '0x') decodes to 0.
+    _hex_digit_values = numpy.zeros (256, dtype = numpy.uint64)
+    for _digit in '0123456789abcdef':
+        _hex_digit_values [ord (_digit)] = int (_digit, 16)
+        _hex_digit_values [ord (_digit.upper ())] = int (_digit, 16)
+
+
+def _parseHexAddrs (addr_tokens):
+    """Return a uint64 array of the '0x' prefixed addr_tokens.
+
+    The tokens are right-aligned in a fixed-width byte matrix, each
+    column is mapped to its digit value and the columns are folded in
+    with shifts, so the work is per column rather than per address.
+    """
+    tokens = numpy.array (addr_tokens, dtype = numpy.string_)
+    width = tokens.dtype.itemsize
+    tokens = numpy.char.rjust (tokens, width, '0')
+    digits = _hex_digit_values [
+        tokens.view (numpy.uint8).reshape (len (tokens), width)]
+    addrs = numpy.zeros (len (tokens), dtype = numpy.uint64)
+    four = numpy.uint64 (4)
+    for column in range (width):
+        addrs <<= four
+        addrs |= digits [:, column]
+    return addrs
+
+def _gapArray (gap_tokens):
+    if numpy is None:
+        return array.array ('L', [int (gap) for gap in gap_tokens])
+    return numpy.array (gap_tokens, dtype = numpy.string_).astype (
+        numpy.uint32)
+
+def parseTraceLines (lines, with_gaps = False):
+    """Return (ops, addrs) for the trace lines.
+
+    Each line is '<R|W> <addr> [<#instructions since last access>]';
+    anything after that is ignored and blank lines are skipped.
+    """
+    tokens = ''.join (lines).split ()
+    n_lines = sum (1 for line in lines if not line.isspace ())
+    gap_tokens = None
+    op_tokens = None
+    # Slice the columns out of the tokens if every line has as many,
+    # and check they did line up.
+    if len (tokens) == 2 * n_lines:
+        op_tokens, addr_tokens = tokens [0::2], tokens [1::2]
+    elif len (tokens) == 3 * n_lines:
+        op_tokens, addr_tokens = tokens [0::3], tokens [1::3]
+        gap_tokens = tokens [2::3]
+    if op_tokens is None or not set (op_tokens) <= _op_tokens:
+        fields = [line.split () for line in lines if line.strip ()]
+        op_tokens = [field [0] for field in fields]
+        addr_tokens = [field [1] for field in fields]
+        gap_tokens = [field [2] if len (field) > 2 else '0'
+                      for field in fields]
+    if gap_tokens is None:
+        gap_tokens = ['0'] * len (op_tokens)
+
+    if numpy is None:
+        ops = array.array ('B', [WRITE if op == 'W' else READ
+                                 for op in op_tokens])
+        addrs = [int (addr, 0) for addr in addr_tokens]
+        if with_gaps:
+            return ops, addrs, _gapArray (gap_tokens)
+        return ops, addrs
+
+    ops = (numpy.array (op_tokens, dtype = numpy.string_) == 'W').astype (
+        numpy.uint8)
+    if all (addr [:2] in ('0x', '0X') for addr in addr_tokens):
+        addrs = _parseHexAddrs (addr_tokens)
+    else:
+        addrs = numpy.array ([int (addr, 0) for addr in addr_tokens],
+                             dtype = numpy.uint64)
+    if with_gaps:
+        return ops, addrs, _gapArray (gap_tokens)
+    return ops, addrs
+
+def genTraceChunks (filename,
+                    chunk_size = DEFAULT_CHUNK_SIZE,
+                    with_gaps = False):
+    """Yield (ops, addrs) for successive chunks of about chunk_size
+    bytes of the trace file, so that huge traces need not fit in
+    memory. Binary traces are read block by block instead."""
+    if isBinaryTrace (filename):
+        for chunk in genBinaryTraceChunks (filename, with_gaps):
+            yield chunk
+        return
+    tracefile = open (filename)
+    try:
+        lines = tracefile.readlines (chunk_size)
+        while lines:
+            yield parseTraceLines (lines, with_gaps)
+            lines = tracefile.readlines (chunk_size)
+    finally:
+        tracefile.close ()
+
+def readTraceArrays (filename, with_gaps = False):
+    """Return (ops, addrs) for the whole trace file."""
+    if isBinaryTrace (filename):
+        chunks = list (genBinaryTraceChunks (filename, with_gaps))
+        if numpy is None:
+            whole = (array.array ('B'), [], array.array ('L'))
+            for chunk in chunks:
+                for arrays, chunk_arrays in zip (whole, chunk):
+                    arrays.extend (chunk_arrays)
+        elif not chunks:
+            whole = (numpy.zeros (0, dtype = numpy.uint8),
+                     numpy.zeros (0, dtype = numpy.uint64),
+                     numpy.zeros (0, dtype = numpy.uint32))
+        else:
+            whole = tuple (numpy.concatenate (arrays)
+                           for arrays in zip (*chunks))
+        return whole [:3 if with_gaps else 2]
+    tracefile = open (filename)
+    lines = tracefile.readlines ()
+    tracefile.close ()
+    return parseTraceLines (lines, with_gaps)
+
+def isBinaryTrace (filename):
+    tracefile = open (filename, 'rb')
+    magic = tracefile.read (len (BINARY_MAGIC))
+    tracefile.close ()
+    return magic == BINARY_MAGIC
+
+def readBinaryTraceHeader (filename):
+    """Return (flags, hex digits of addresses, #records) of a binary
+    trace."""
+    tracefile = open (filename, 'rb')
+    header = tracefile.read (_header.size)
+    tracefile.close ()
+    magic, version, flags, digits, records = _header.unpack (header)
+    if magic != BINARY_MAGIC or version != BINARY_VERSION:
+        raise ValueError (filename + " is not a version "
+                          + str (BINARY_VERSION) + " binary trace")
+    return flags, digits, records
+
+def _encodeBlock (ops, addrs, gaps, flags):
+    """Return the payload for one block of records."""
+    if numpy is not None:
+        ops = numpy.asarray (ops, dtype = numpy.uint8)
+        addrs = numpy.asarray (addrs, dtype = numpy.uint64)
+        if flags & FLAG_DELTA:
+            previous = numpy.zeros (len (addrs), dtype = numpy.uint64)
+            previous [1:] = addrs [:-1]
+            addrs = addrs - previous
+        payload = ops.tostring () + addrs.astype ('<u8').tostring ()
+        if flags & FLAG_GAPS:
+            payload += numpy.asarray (gaps).astype ('<u4').tostring ()
+    else:
+        addrs = list (addrs)
+        if flags & FLAG_DELTA:
+            addrs = [(addr - previous) & _mask_64
+                     for addr, previous in zip (addrs, [0] + addrs [:-1])]
+        payload = (array.array ('B', ops).tostring ()
+                   + struct.pack ('<' + str (len (addrs)) + 'Q', *addrs))
+        if flags & FLAG_GAPS:
+            payload += struct.pack ('<' + str (len (gaps)) + 'I', *gaps)
+    if flags & FLAG_COMPRESSED:
+        payload = zlib.compress (payload)
+    return payload
+
+def _decodeBlock (payload, n_records, flags, with_gaps):
+    """Return (ops, addrs) for one block payload."""
+    if flags & FLAG_COMPRESSED:
+        payload = zlib.decompress (payload)
+    gaps_offset = 9 * n_records
+    if numpy is not None:
+        ops = numpy.frombuffer (payload, numpy.uint8, n_records)
+        addrs = numpy.frombuffer (payload, numpy.dtype ('<u8'),
+                                  n_records, n_records).astype (numpy.uint64)
+        if flags & FLAG_DELTA:
+            addrs = numpy.cumsum (addrs, dtype = numpy.uint64)
+        if not with_gaps:
+            return ops, addrs
+        if flags & FLAG_GAPS:
+            gaps = numpy.frombuffer (payload, numpy.dtype ('<u4'), n_records,
+                                     gaps_offset).astype (numpy.uint32)
+        else:
+            gaps = numpy.zeros (n_records, dtype = numpy.uint32)
+        return ops, addrs, gaps
+    ops = array.array ('B', payload [:n_records])
+    addrs = struct.unpack_from ('<' + str (n_records) + 'Q',
+                                payload, n_records)
+    if flags & FLAG_DELTA:
+        total, absolute = 0, []
+        for delta in addrs:
+            total = (total + delta) & _mask_64
+            absolute.append (total)
+        addrs = absolute
+    if not with_gaps:
+        return ops, list (addrs)
+    if flags & FLAG_GAPS:
+        gaps = array.array ('L', struct.unpack_from (
+            '<' + str (n_records) + 'I', payload, gaps_offset))
+    else:
+        gaps = array.array ('L', [0] * n_records)
+    return ops, list (addrs), gaps
+
+class BinaryTraceWriter (object):
+    """Writes records to a file in the binary trace format, one block
+    per block_records records of each write at most.
+
+    flags: FLAG_* of the blocks (FLAG_GAPS to keep the gaps given to
+           write).
+    digits: hex digits of the addresses, for binarySampleAddr.
+    """
+    def __init__ (self, filename, flags = 0, digits = 0,
+                  block_records = DEFAULT_BLOCK_RECORDS):
+        self.flags = flags
+        self.digits = digits
+        self.block_records = block_records
+        self.records = 0
+        self.binaryfile = open (filename, 'wb')
+        self.binaryfile.write (_header.pack (BINARY_MAGIC, BINARY_VERSION,
+                                             flags, digits, 0))
+
+    def write (self, ops, addrs, gaps = None):
+        """Append the records of the parallel arrays ops, addrs (and
+        gaps, if FLAG_GAPS)."""
+        for start in range (0, len (ops), self.block_records):
+            end = start + self.block_records
+            block_ops = ops [start:end]
+            payload = _encodeBlock (block_ops, addrs [start:end],
+                                    gaps [start:end] if gaps is not None
+                                    else None,
+                                    self.flags)
+            self.binaryfile.write (_block_header.pack (len (block_ops),
+                                                       len (payload)))
+            self.binaryfile.write (payload)
+            self.records += len (block_ops)
+
+    def close (self):
+        """Fill in the number of records and close the file. Return the
+        number of records written."""
+        self.binaryfile.seek (0)
+        self.binaryfile.write (_header.pack (BINARY_MAGIC, BINARY_VERSION,
+                                             self.flags, self.digits,
+                                             self.records))
+        self.binaryfile.close ()
+        return self.records
+
+def convertTextTrace (text_filename,
+                      binary_filename,
+                      compress = True,
+                      delta = True,
+                      block_records = DEFAULT_BLOCK_RECORDS):
+    """Write the text trace text_filename (as produced by pinatrace) to
+    binary_filename in the binary trace format.
+
+    compress: zlib compress each block.
+    delta: store each address as the difference from the previous one,
+           which makes the blocks compress much better.
+    Instruction counts are kept if the first line has a third column.
+    Returns the number of records written.
+    """
+    tracefile = open (text_filename)
+    first_line = tracefile.readline ().split ()
+    tracefile.close ()
+    digits = len (first_line [1].split ('x') [-1]) if first_line else 0
+    flags = ((FLAG_COMPRESSED if compress else 0)
+             | (FLAG_DELTA if delta else 0)
+             | (FLAG_GAPS if len (first_line) > 2 else 0))
+
+    writer = BinaryTraceWriter (binary_filename, flags, digits,
+                                block_records)
+    for ops, addrs, gaps in genTraceChunks (text_filename,
+                                            with_gaps = True):
+        writer.write (ops, addrs, gaps)
+    return writer.close ()
+
+def genBinaryTraceChunks (filename, with_gaps = False):
+    """Yield (ops, addrs) for each block of a binary trace.
+
+    The file is memory-mapped and only one block is decoded at a time.
+    """
+    flags, digits, records = readBinaryTraceHeader (filename)
+    tracefile = open (filename, 'rb')
+    try:
+        if records == 0:
+            return
+        tracemap = mmap.mmap (tracefile.fileno (), 0,
+                              access = mmap.ACCESS_READ)
+        try:
+            offset = _header.size
+            while offset < len (tracemap):
+                n_records, length = _block_header.unpack_from (tracemap,
+                                                               offset)
+                offset += _block_header.size
+                yield _decodeBlock (tracemap [offset:offset + length],
+                                    n_records, flags, with_gaps)
+                offset += length
+        finally:
+            tracemap.close ()
+    finally:
+        tracefile.close ()
+
+def genBinaryMemtrace (filename):
+    """Like Simulator.genMemtrace, yield ('R' or 'W', addr) pairs, with
+    integer addresses, from a binary trace."""
+    for ops, addrs in genBinaryTraceChunks (filename):
+        if numpy is not None:
+            ops, addrs = ops.tolist (), addrs.tolist ()
+        for op, addr in zip (ops, addrs):
+            yield ('W' if op == WRITE else 'R', addr)
+
+def binarySampleAddr (filename):
+    """Return a sample address string with as many hex digits as the
+    addresses of the text trace the binary trace came from."""
+    flags, digits, records = readBinaryTraceHeader (filename)
+    return '0x' + '0' * digits
+
+if __name__ == '__main__':
+    if len (sys.argv) != 3:
+        print 'Usage: ./Trace.py <text trace> <binary trace>'
+        exit (1)
+    print convertTextTrace (sys.argv [1], sys.argv [2]), 'records'
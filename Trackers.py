@@ -0,0 +1,166 @@
+#! /usr/bin/python
+
+"""Trackers of the blocks seen so far, to tell cold misses apart.
+
+By default every Set keeps a Python set of the tags it has ever seen,
+which grows with the footprint of the trace. A tracker replaces those
+with one structure for the whole cache, keyed by block address:
+
+ExactTracker -> compressed bitmap, exact.
+BloomTracker -> Bloom filter of fixed size. A block never seen may
+                be taken for a seen one (a cold miss counted as a
+                conflict miss) with probability getErrorBound ().
+
+Pass one to Cache (cold_miss_tracker = ...) or use makeTracker.
+"""
+
+import array
+import bisect
+import math
+
+_mix_1, _mix_2 = 0xff51afd7ed558ccd, 0xc4ceb9fe1a85ec53
+_mask_64 = (1 << 64) - 1
+
+def _mix (value):
+    """64-bit finalizer of MurmurHash3."""
+    value &= _mask_64
+    value ^= value >> 33
+    value = (value * _mix_1) & _mask_64
+    value ^= value >> 33
+    value = (value * _mix_2) & _mask_64
+    value ^= value >> 33
+    return value
+
+
+class ExactTracker (object):
+    """Set of block addresses as a roaring-style compressed bitmap.
+
+    Addresses are grouped by their high bits into containers of
+    2 ** 16 addresses. A container is a sorted array of the 2-byte low
+    bits while it is sparse and becomes a 8K bitmap once it holds more
+    than SPARSE_LIMIT of them (where the array would be larger).
+
+    Blocks spread so thin that the containers hold a few each cost
+    more than in a plain set (a container per block or two); the
+    memory of BloomTracker is bounded whatever the blocks.
+    """
+    SPARSE_LIMIT = 4096
+    LOW_BITS = 16
+
+    def __init__ (self):
+        # {high bits: array ('H') of low bits or bytearray bitmap}
+        self.containers = {}
+        self.count = 0
+
+    def __contains__ (self, block_addr):
+        container = self.containers.get (block_addr >> self.LOW_BITS)
+        if container is None:
+            return False
+        low = block_addr & 0xffff
+        if isinstance (container, bytearray):
+            return bool (container [low >> 3] & (1 << (low & 7)))
+        i = bisect.bisect_left (container, low)
+        return i < len (container) and container [i] == low
+
+    def add (self, block_addr):
+        high = block_addr >> self.LOW_BITS
+        low = block_addr & 0xffff
+        container = self.containers.get (high)
+        if container is None:
+            container = self.containers [high] = array.array ('H')
+        if isinstance (container, bytearray):
+            if not container [low >> 3] & (1 << (low & 7)):
+                container [low >> 3] |= 1 << (low & 7)
+                self.count += 1
+            return
+        i = bisect.bisect_left (container, low)
+        if i == len (container) or container [i] != low:
+            container.insert (i, low)
+            self.count += 1
+            if len (container) > self.SPARSE_LIMIT:
+                bitmap = bytearray (1 << (self.LOW_BITS - 3))
+                for low in container:
+                    bitmap [low >> 3] |= 1 << (low & 7)
+                self.containers [high] = bitmap
+
+    def __len__ (self):
+        return self.count
+
+    def getErrorBound (self):
+        return 0.0
+
+
+class BloomTracker (object):
+    """Set of block addresses as a Bloom filter.
+
+    Sized for expected_blocks distinct blocks at a false positive rate
+    of error_rate; past that, the rate grows (see getErrorBound).
+    """
+    def __init__ (self, expected_blocks = 1 << 20, error_rate = 0.001):
+        n_bits = (-expected_blocks * math.log (error_rate)
+                  / math.log (2) ** 2)
+        self.n_bits = max (64, int (math.ceil (n_bits)))
+        self.n_hashes = max (1, int (round (self.n_bits * math.log (2)
+                                            / expected_blocks)))
+        self.bitmap = bytearray ((self.n_bits + 7) / 8)
+        self.count = 0
+
+    def __positions (self, block_addr):
+        # Double hashing: h1 + i * h2 for the i-th hash function.
+        value = _mix (block_addr)
+        h1, h2 = value & 0xffffffff, (value >> 32) | 1
+        return [(h1 + i * h2) % self.n_bits for i in range (self.n_hashes)]
+
+    def __contains__ (self, block_addr):
+        bitmap = self.bitmap
+        for position in self.__positions (block_addr):
+            if not bitmap [position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def add (self, block_addr):
+        new = False
+        for position in self.__positions (block_addr):
+            if not self.bitmap [position >> 3] & (1 << (position & 7)):
+                self.bitmap [position >> 3] |= 1 << (position & 7)
+                new = True
+        if new:
+            self.count += 1
+
+    def __len__ (self):
+        """Number of blocks added (that were not false positives)."""
+        return self.count
+
+    def getErrorBound (self):
+        """Probability that a block never added is reported as added,
+        at the current fill of the filter."""
+        return (1 - math.exp (-float (self.n_hashes) * self.count
+                              / self.n_bits)) ** self.n_hashes
+
+
+class SetView (object):
+    """What a Set sees of a tracker: tags of one set in, block
+    addresses of the whole cache out."""
+    __slots__ = ('tracker', 'set_number', 'set_number_bit_length')
+
+    def __init__ (self, tracker, set_number, set_number_bit_length):
+        self.tracker = tracker
+        self.set_number = set_number
+        self.set_number_bit_length = set_number_bit_length
+
+    def __contains__ (self, tag):
+        return ((tag << self.set_number_bit_length) | self.set_number
+                in self.tracker)
+
+    def add (self, tag):
+        self.tracker.add ((tag << self.set_number_bit_length)
+                          | self.set_number)
+
+
+def makeTracker (kind, expected_blocks = 1 << 20, error_rate = 0.001):
+    """Return a tracker by name: 'exact' or 'bloom'."""
+    if kind == 'exact':
+        return ExactTracker ()
+    elif kind == 'bloom':
+        return BloomTracker (expected_blocks, error_rate)
+    raise ValueError ("Unknown cold miss tracker: " + str (kind))
@@ -0,0 +1,214 @@
+#! /usr/bin/python
+
+"""Virtual to physical address translation in front of a cache.
+
+Traces have virtual addresses, which a physically indexed cache never
+sees. A TranslatedCache maps the pages of every access to physical
+frames with a PageAllocator and passes the physical address on to its
+cache, looking the page up in a hierarchy of TLBs on the way.
+
+A TLB is a Cache whose blocks are pages (block_size = page_size),
+accessed with the virtual addresses: its statistics are the TLB's,
+with any replacement policy of Cache. The levels are looked up in
+order until one hits, a miss in the last one being a page walk.
+
+Allocators, for the frame of a page touched the first time:
+
+'sequential' -> the next free frame, as for a fresh process.
+'random'     -> any free frame, as for a long running system.
+'coloring'   -> the next free frame of the same color as the page
+                (frame and page equal mod n_colors), so that the cache
+                sets of a page stay those of its virtual address.
+"""
+
+import random
+import sys
+
+from Cache import *
+import Trace
+
+PAGE_SIZE_4K = 1 << 12
+PAGE_SIZE_2M = 1 << 21
+
+def pageColors (cache, page_size):
+    """Return the number of page colors of cache: the pages one way of
+    it holds."""
+    return max (1, cache.n_sets * cache.block_size / page_size)
+
+class PageAllocator (object):
+    """Frames for pages, allocated on first touch out of n_frames
+    frames (of physical memory) by kind: 'sequential', 'random' or
+    'coloring' with n_colors colors."""
+    kinds = ('sequential', 'random', 'coloring')
+
+    def __init__ (self, kind = 'sequential', n_frames = 1 << 22,
+                  n_colors = 1, seed = 0):
+        if kind not in self.kinds:
+            raise ValueError ("Unknown page allocator: " + str (kind))
+        self.kind = kind
+        self.n_frames = n_frames
+        self.n_colors = n_colors
+        self.random = random.Random (seed)
+        # {page number: frame number}
+        self.frames = {}
+        self.used_frames = set ()
+        # Frames handed out, of each color for 'coloring'.
+        self.next_frames = [0] * n_colors
+
+    def __allocate (self, page):
+        if len (self.used_frames) == self.n_frames:
+            raise MemoryError ("Out of physical frames")
+        if self.kind == 'sequential':
+            frame = len (self.used_frames)
+        elif self.kind == 'random':
+            frame = self.random.randrange (self.n_frames)
+            while frame in self.used_frames:
+                frame = self.random.randrange (self.n_frames)
+        else:
+            color = page % self.n_colors
+            frame = color + self.n_colors * self.next_frames [color]
+            if frame >= self.n_frames:
+                raise MemoryError ("Out of physical frames of color "
+                                   + str (color))
+            self.next_frames [color] += 1
+        self.used_frames.add (frame)
+        self.frames [page] = frame
+        return frame
+
+    def getFrame (self, page):
+        """Return the frame of page, allocating one if need be."""
+        frame = self.frames.get (page)
+        if frame is None:
+            frame = self.__allocate (page)
+        return frame
+
+
+def makeTLBs (page_size = PAGE_SIZE_4K, sample_addr = "0xb7737f64"):
+    """Return a two level TLB: 64 entries 4 way, then 1536 entries 12
+    way, both LRU."""
+    return [LRUCache (16, 4, page_size, sample_addr),
+            LRUCache (128, 12, page_size, sample_addr)]
+
+class TranslatedCache (object):
+    """cache (any Cache, FlatCache...) behind address translation.
+
+    tlbs: the TLB levels, caches of block_size page_size (makeTLBs ()
+          by default).
+    allocator: a PageAllocator (sequential by default).
+    """
+    def __init__ (self, cache, page_size = PAGE_SIZE_4K, tlbs = None,
+                  allocator = None):
+        if page_size & (page_size - 1):
+            raise ValueError ("Page size should be a power of 2")
+        self.cache = cache
+        self.page_size = page_size
+        self.page_bit_length = page_size.bit_length () - 1
+        if tlbs is None:
+            tlbs = makeTLBs (page_size)
+        if any (tlb.block_size != page_size for tlb in tlbs):
+            raise ValueError ("TLB entries should be pages")
+        self.tlbs = tlbs
+        self.allocator = allocator or PageAllocator ()
+        self.page_walk_count = 0
+        # The last page translated and its frame, for runs of accesses
+        # to one page.
+        self.last_page = None
+        self.last_frame = None
+
+    def __lookup (self, addr):
+        """Look the page of virtual address addr up in the TLBs."""
+        for tlb in self.tlbs:
+            if tlb.read (addr):
+                return
+        self.page_walk_count += 1
+
+    def translate (self, addr):
+        """Return the physical address of virtual address addr, without
+        looking it up in the TLBs."""
+        page = addr >> self.page_bit_length
+        if page != self.last_page:
+            self.last_page = page
+            self.last_frame = self.allocator.getFrame (page)
+        return ((self.last_frame << self.page_bit_length)
+                | (addr & (self.page_size - 1)))
+
+    def access (self, addr, dirty_status):
+        try:
+            addr = int (addr, 0)
+        except TypeError:
+            pass
+        self.__lookup (addr)
+        return self.cache.access (self.translate (addr), dirty_status)
+
+    def read (self, addr):
+        return self.access (addr, Set.clean)
+
+    def write (self, addr):
+        return self.access (addr, Set.dirty)
+
+    def accessArrays (self, ops, addrs):
+        """Look the batch up in the TLBs one access at a time, then
+        pass it on translated as a whole (one getFrame per distinct
+        page of the batch with numpy)."""
+        numpy = Trace.numpy
+        if numpy is not None and isinstance (addrs, numpy.ndarray):
+            for addr in addrs.tolist ():
+                self.__lookup (addr)
+            shift = numpy.uint64 (self.page_bit_length)
+            pages, first, inverse = numpy.unique (addrs >> shift,
+                                                  return_index = True,
+                                                  return_inverse = True)
+            frames = numpy.zeros (len (pages), dtype = numpy.uint64)
+            # New pages get their frames in the order of first touch.
+            for index in numpy.argsort (first, kind = 'mergesort').tolist ():
+                frames [index] = self.allocator.getFrame (int (pages [index]))
+            physical_addrs = ((frames [inverse] << shift)
+                              | (addrs & numpy.uint64 (self.page_size - 1)))
+        else:
+            for addr in addrs:
+                self.__lookup (addr)
+            physical_addrs = [self.translate (addr) for addr in addrs]
+        self.cache.accessArrays (ops, physical_addrs)
+
+    def getTLBStats (self):
+        """Return getStats () of each TLB level, then [#page walks,
+        #pages mapped]."""
+        return ([tlb.getStats () for tlb in self.tlbs]
+                + [[self.page_walk_count, len (self.allocator.frames)]])
+
+    def getStats (self):
+        return self.cache.getStats ()
+
+    def getCumulativeCount (self, attr_name):
+        return self.cache.getCumulativeCount (attr_name)
+
+    def printStats (self):
+        self.cache.printStats ()
+        for number, tlb in enumerate (self.tlbs):
+            print ('TLB L%d: %d accesses, %d misses, %.3f%% hits'
+                   % (number + 1,
+                      tlb.getCumulativeCount ('access_count'),
+                      tlb.getCumulativeCount ('cold_miss_count')
+                      + tlb.getCumulativeCount ('conflict_miss_count'),
+                      tlb.getHitRate ()))
+        print str (self.page_walk_count) + '\tpage walk count'
+        print str (len (self.allocator.frames)) + '\tpages mapped'
+
+if __name__ == '__main__':
+    if len (sys.argv) not in [3, 4]:
+        print ('Usage: ./Translation.py <sequential|random|coloring>'
+               ' <trace file> [<page size>]')
+        exit (1)
+    block_size, cache_size, num_ways = 64, 1048576, 16
+    page_size = int (sys.argv [3]) if len (sys.argv) == 4 else PAGE_SIZE_4K
+    cache = LRUCache ((cache_size / block_size) / num_ways,
+                      num_ways,
+                      block_size,
+                      "0x" + "0" * 16)
+    translated = TranslatedCache (
+        cache, page_size,
+        allocator = PageAllocator (sys.argv [1],
+                                   n_colors = pageColors (cache, page_size)))
+    ops, addrs = Trace.readTraceArrays (sys.argv [2])
+    translated.accessArrays (ops, addrs)
+    translated.printStats ()
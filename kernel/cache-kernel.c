@@ -0,0 +1,735 @@
+/*
+  Compiled core of FlatCache (see FlatCache.py and Native.py).
+
+  The cache state lives in arrays allocated on the Python side, laid
+  out as in FlatCache: slot set_number * n_ways + way of blocks,
+  stamps, frequencies, valid and dirty is one way of one set. The
+  blocks seen so far (for cold misses) and the state of the random
+  number generator are kept here, and so are indexes derived from
+  those arrays (rebuilt by ck_rebuild when they are loaded): a hash
+  of the slot of every block in the cache, and for lru and fifo the
+  slots of each set in stamp order, so that an access does not scan
+  the ways of its set.
+
+  Every policy makes the same choices as FlatCache, so the statistics
+  are the same. For the random policy this includes the random
+  numbers: the generator is the Mersenne Twister of Python's random
+  module, started from a copy of random.getstate () (see Native.py).
+
+  The legacy policies make the choices of the Set classes of Cache.py
+  instead: random_legacy those of Set (random.choice of the tags of
+  the set), lfu_legacy those of LFUSet (the first least frequently
+  used tag of the set). Both depend on the order of the tags in a
+  Python 2 dict, so the tags of each set are kept in a copy of one
+  (dict_* below, lookdict, insertdict and dictresize of Python 2.7's
+  dictobject.c, for int keys: the hash of a tag is the tag).
+*/
+
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+
+enum {POLICY_RANDOM, POLICY_LRU, POLICY_FIFO, POLICY_LFU,
+      POLICY_RANDOM_LEGACY, POLICY_LFU_LEGACY};
+
+#define IS_LEGACY(cache) ((cache)->policy >= POLICY_RANDOM_LEGACY)
+#define HAS_ORDER(cache) ((cache)->policy == POLICY_LRU \
+                          || (cache)->policy == POLICY_FIFO)
+
+/* States of the entries of the dicts. */
+enum {DICT_EMPTY, DICT_DUMMY, DICT_ACTIVE};
+#define DICT_MIN_SIZE 8
+#define PERTURB_SHIFT 5
+
+/* Results of ck_access and ck_insert. */
+#define RESULT_HIT     1
+#define RESULT_EVICTED 2
+#define RESULT_DIRTY   4
+/* Out of memory for the blocks seen, nothing done. */
+#define RESULT_ERROR   (-1)
+
+#define MT_N 624
+#define MT_M 397
+
+typedef struct {
+    uint64_t n_sets, n_ways, set_mask, set_bits;
+    int policy, write_no_allocate;
+
+    uint64_t *blocks, *stamps, *frequencies, *occupancy;
+    uint8_t *valid, *dirty;
+    uint64_t *access_count, *cold_miss_count, *conflict_miss_count,
+        *writeback_count;
+    uint64_t clock;
+
+    /* Open addressing hash set of the block addresses seen, 0 marking
+       empty entries: whether block 0 was seen is seen_zero. */
+    uint64_t *seen;
+    uint64_t seen_capacity, seen_count;
+    int seen_zero;
+
+    /* The valid slots by block, chained: slot + 1 of the first slot of
+       each of bucket_mask + 1 buckets and of the next slot in the
+       chain of each slot (0 for none). */
+    uint64_t *buckets, *chain;
+    uint64_t bucket_mask;
+    /* lru and fifo: the valid slots of each set, from the oldest stamp
+       to the newest, as a list linked by slot + 1 (0 for none). */
+    uint64_t *older, *newer, *oldest, *newest;
+    /* Room for the (stamp, slot) of the ways of one set. */
+    uint64_t *order_scratch;
+
+    uint32_t mt [MT_N];
+    int mt_index;
+
+    /* Legacy policies: the dict of each set, dict_capacity entries
+       (key, slot of the block in the cache, state) from set_number *
+       dict_capacity, of which mask + 1 in use, and its fill and used
+       counts as in dictobject.c. */
+    uint64_t dict_capacity;
+    uint64_t *dict_keys, *dict_slots;
+    uint8_t *dict_states;
+    uint64_t *dict_masks, *dict_fills, *dict_used;
+    /* Room for the entries of one dict while it is resized. */
+    uint64_t *dict_scratch;
+} ck_cache;
+
+static uint64_t mix (uint64_t value){
+    value ^= value >> 33;
+    value *= 0xff51afd7ed558ccdULL;
+    value ^= value >> 33;
+    value *= 0xc4ceb9fe1a85ec53ULL;
+    value ^= value >> 33;
+    return value;
+}
+
+/**
+ * Make room for one more block seen, growing the table if need be.
+ * Return 0, or RESULT_ERROR (the table left as it was) if out of
+ * memory.
+ */
+static int seen_reserve (ck_cache *cache){
+    uint64_t *seen, capacity = 2 * cache->seen_capacity, i;
+    if (2 * (cache->seen_count + 1) <= cache->seen_capacity)
+        return 0;
+    seen = (uint64_t *) calloc (capacity, sizeof (uint64_t));
+    if (!seen)
+        return RESULT_ERROR;
+    for (i = 0; i < cache->seen_capacity; i++){
+        if (cache->seen [i]){
+            uint64_t j = mix (cache->seen [i]) & (capacity - 1);
+            while (seen [j])
+                j = (j + 1) & (capacity - 1);
+            seen [j] = cache->seen [i];
+        }
+    }
+    free (cache->seen);
+    cache->seen = seen;
+    cache->seen_capacity = capacity;
+    return 0;
+}
+
+/**
+ * Add block to the blocks seen, return 1 if it was not seen before.
+ * There must be room for it (seen_reserve).
+ */
+static int seen_add (ck_cache *cache, uint64_t block){
+    uint64_t i;
+    if (block == 0){
+        if (cache->seen_zero)
+            return 0;
+        cache->seen_zero = 1;
+        cache->seen_count++;
+        return 1;
+    }
+    i = mix (block) & (cache->seen_capacity - 1);
+    while (cache->seen [i]){
+        if (cache->seen [i] == block)
+            return 0;
+        i = (i + 1) & (cache->seen_capacity - 1);
+    }
+    cache->seen [i] = block;
+    cache->seen_count++;
+    return 1;
+}
+
+static uint64_t *bucket_of (ck_cache *cache, uint64_t block){
+    return cache->buckets + (mix (block) & cache->bucket_mask);
+}
+
+/**
+ * Index valid slot by its block.
+ */
+static void index_add (ck_cache *cache, uint64_t slot){
+    uint64_t *bucket = bucket_of (cache, cache->blocks [slot]);
+    cache->chain [slot] = *bucket;
+    *bucket = slot + 1;
+}
+
+static void index_remove (ck_cache *cache, uint64_t slot){
+    uint64_t *link = bucket_of (cache, cache->blocks [slot]);
+    while (*link != slot + 1)
+        link = cache->chain + *link - 1;
+    *link = cache->chain [slot];
+}
+
+/**
+ * Put slot last (newest) in the order of its set.
+ */
+static void order_append (ck_cache *cache, uint64_t slot){
+    uint64_t set_number = slot / cache->n_ways;
+    uint64_t last = cache->newest [set_number];
+    cache->older [slot] = last;
+    cache->newer [slot] = 0;
+    if (last)
+        cache->newer [last - 1] = slot + 1;
+    else
+        cache->oldest [set_number] = slot + 1;
+    cache->newest [set_number] = slot + 1;
+}
+
+static void order_remove (ck_cache *cache, uint64_t slot){
+    uint64_t set_number = slot / cache->n_ways;
+    uint64_t older = cache->older [slot], newer = cache->newer [slot];
+    if (older)
+        cache->newer [older - 1] = newer;
+    else
+        cache->oldest [set_number] = newer;
+    if (newer)
+        cache->older [newer - 1] = older;
+    else
+        cache->newest [set_number] = older;
+}
+
+/**
+ * Return the entry of key in the dict of set_number, or the one it
+ * would go in if absent (lookdict).
+ */
+static uint64_t dict_lookup (ck_cache *cache, uint64_t set_number,
+                             uint64_t key){
+    uint64_t base = set_number * cache->dict_capacity;
+    uint64_t mask = cache->dict_masks [set_number];
+    const uint64_t *keys = cache->dict_keys + base;
+    const uint8_t *states = cache->dict_states + base;
+    uint64_t i = key & mask, perturb, entry, free_entry = 0;
+    int has_free = 0;
+    if (states [i] == DICT_EMPTY
+        || (states [i] == DICT_ACTIVE && keys [i] == key))
+        return base + i;
+    if (states [i] == DICT_DUMMY){
+        free_entry = i;
+        has_free = 1;
+    }
+    for (perturb = key; ; perturb >>= PERTURB_SHIFT){
+        i = (i << 2) + i + perturb + 1;
+        entry = i & mask;
+        if (states [entry] == DICT_EMPTY)
+            return base + (has_free ? free_entry : entry);
+        if (states [entry] == DICT_ACTIVE && keys [entry] == key)
+            return base + entry;
+        if (states [entry] == DICT_DUMMY && !has_free){
+            free_entry = entry;
+            has_free = 1;
+        }
+    }
+}
+
+/**
+ * Put key in an empty entry of the dict of set_number, which has no
+ * dummies (insertdict_clean).
+ */
+static void dict_insert_clean (ck_cache *cache, uint64_t set_number,
+                               uint64_t key, uint64_t slot){
+    uint64_t base = set_number * cache->dict_capacity;
+    uint64_t mask = cache->dict_masks [set_number];
+    uint64_t i = key & mask, perturb;
+    for (perturb = key; cache->dict_states [base + (i & mask)] != DICT_EMPTY;
+         perturb >>= PERTURB_SHIFT)
+        i = (i << 2) + i + perturb + 1;
+    i = base + (i & mask);
+    cache->dict_states [i] = DICT_ACTIVE;
+    cache->dict_keys [i] = key;
+    cache->dict_slots [i] = slot;
+    cache->dict_fills [set_number]++;
+    cache->dict_used [set_number]++;
+}
+
+/**
+ * Rebuild the dict of set_number with more entries than min_used, in
+ * the order of its entries (dictresize).
+ */
+static void dict_resize (ck_cache *cache, uint64_t set_number,
+                         uint64_t min_used){
+    uint64_t base = set_number * cache->dict_capacity;
+    uint64_t size = DICT_MIN_SIZE, n = 0, i;
+    uint64_t *scratch = cache->dict_scratch;
+    while (size <= min_used)
+        size <<= 1;
+    for (i = base; i <= base + cache->dict_masks [set_number]; i++){
+        if (cache->dict_states [i] == DICT_ACTIVE){
+            scratch [2 * n] = cache->dict_keys [i];
+            scratch [2 * n + 1] = cache->dict_slots [i];
+            n++;
+        }
+    }
+    memset (cache->dict_states + base, DICT_EMPTY, cache->dict_capacity);
+    cache->dict_masks [set_number] = size - 1;
+    cache->dict_fills [set_number] = 0;
+    cache->dict_used [set_number] = 0;
+    for (i = 0; i < n; i++)
+        dict_insert_clean (cache, set_number, scratch [2 * i],
+                           scratch [2 * i + 1]);
+}
+
+/**
+ * Add key, absent from the dict of set_number, with the slot of its
+ * block (insertdict, then the resize check of PyDict_SetItem).
+ */
+static void dict_insert (ck_cache *cache, uint64_t set_number, uint64_t key,
+                         uint64_t slot){
+    uint64_t entry = dict_lookup (cache, set_number, key);
+    if (cache->dict_states [entry] == DICT_EMPTY)
+        cache->dict_fills [set_number]++;
+    cache->dict_states [entry] = DICT_ACTIVE;
+    cache->dict_keys [entry] = key;
+    cache->dict_slots [entry] = slot;
+    cache->dict_used [set_number]++;
+    if (cache->dict_fills [set_number] * 3
+        >= (cache->dict_masks [set_number] + 1) * 2)
+        dict_resize (cache, set_number, 4 * cache->dict_used [set_number]);
+}
+
+/**
+ * Remove key from the dict of set_number, if there.
+ */
+static void dict_delete (ck_cache *cache, uint64_t set_number, uint64_t key){
+    uint64_t entry = dict_lookup (cache, set_number, key);
+    if (cache->dict_states [entry] == DICT_ACTIVE){
+        cache->dict_states [entry] = DICT_DUMMY;
+        cache->dict_used [set_number]--;
+    }
+}
+
+/* genrand_int32 and random_random of Python's _randommodule.c */
+static uint32_t genrand_int32 (ck_cache *cache){
+    static const uint32_t mag01 [2] = {0x0U, 0x9908b0dfU};
+    uint32_t *mt = cache->mt, y;
+    if (cache->mt_index >= MT_N){
+        int kk;
+        for (kk = 0; kk < MT_N - MT_M; kk++){
+            y = (mt [kk] & 0x80000000U) | (mt [kk + 1] & 0x7fffffffU);
+            mt [kk] = mt [kk + MT_M] ^ (y >> 1) ^ mag01 [y & 0x1U];
+        }
+        for (; kk < MT_N - 1; kk++){
+            y = (mt [kk] & 0x80000000U) | (mt [kk + 1] & 0x7fffffffU);
+            mt [kk] = mt [kk + (MT_M - MT_N)] ^ (y >> 1) ^ mag01 [y & 0x1U];
+        }
+        y = (mt [MT_N - 1] & 0x80000000U) | (mt [0] & 0x7fffffffU);
+        mt [MT_N - 1] = mt [MT_M - 1] ^ (y >> 1) ^ mag01 [y & 0x1U];
+        cache->mt_index = 0;
+    }
+    y = mt [cache->mt_index++];
+    y ^= (y >> 11);
+    y ^= (y << 7) & 0x9d2c5680U;
+    y ^= (y << 15) & 0xefc60000U;
+    y ^= (y >> 18);
+    return y;
+}
+
+static double random_random (ck_cache *cache){
+    uint32_t a = genrand_int32 (cache) >> 5, b = genrand_int32 (cache) >> 6;
+    return (a * 67108864.0 + b) * (1.0 / 9007199254740992.0);
+}
+
+void ck_free (ck_cache *cache);
+
+ck_cache *ck_new (uint64_t n_sets, uint64_t n_ways, int policy,
+                  int write_no_allocate,
+                  uint64_t *blocks, uint64_t *stamps, uint64_t *frequencies,
+                  uint64_t *occupancy, uint8_t *valid, uint8_t *dirty,
+                  uint64_t *access_count, uint64_t *cold_miss_count,
+                  uint64_t *conflict_miss_count, uint64_t *writeback_count){
+    ck_cache *cache = (ck_cache *) calloc (1, sizeof (ck_cache));
+    uint64_t n_slots = n_sets * n_ways, n_buckets = 1;
+    if (!cache)
+        return NULL;
+    cache->n_sets = n_sets;
+    cache->n_ways = n_ways;
+    cache->set_mask = n_sets - 1;
+    while ((1ULL << cache->set_bits) < n_sets)
+        cache->set_bits++;
+    cache->policy = policy;
+    cache->write_no_allocate = write_no_allocate;
+    cache->blocks = blocks;
+    cache->stamps = stamps;
+    cache->frequencies = frequencies;
+    cache->occupancy = occupancy;
+    cache->valid = valid;
+    cache->dirty = dirty;
+    cache->access_count = access_count;
+    cache->cold_miss_count = cold_miss_count;
+    cache->conflict_miss_count = conflict_miss_count;
+    cache->writeback_count = writeback_count;
+    cache->seen_capacity = 1024;
+    cache->seen = (uint64_t *) calloc (cache->seen_capacity,
+                                       sizeof (uint64_t));
+    cache->mt_index = MT_N;
+    while (n_buckets < n_slots)
+        n_buckets <<= 1;
+    cache->bucket_mask = n_buckets - 1;
+    cache->buckets = (uint64_t *) calloc (n_buckets, sizeof (uint64_t));
+    cache->chain = (uint64_t *) calloc (n_slots, sizeof (uint64_t));
+    cache->older = (uint64_t *) calloc (n_slots, sizeof (uint64_t));
+    cache->newer = (uint64_t *) calloc (n_slots, sizeof (uint64_t));
+    cache->oldest = (uint64_t *) calloc (n_sets, sizeof (uint64_t));
+    cache->newest = (uint64_t *) calloc (n_sets, sizeof (uint64_t));
+    cache->order_scratch = (uint64_t *) malloc (2 * n_ways
+                                                * sizeof (uint64_t));
+    if (!cache->seen || !cache->buckets || !cache->chain || !cache->older
+        || !cache->newer || !cache->oldest || !cache->newest
+        || !cache->order_scratch){
+        ck_free (cache);
+        return NULL;
+    }
+    return cache;
+}
+
+void ck_free (ck_cache *cache){
+    free (cache->dict_scratch);
+    free (cache->seen);
+    free (cache->buckets);
+    free (cache->chain);
+    free (cache->older);
+    free (cache->newer);
+    free (cache->oldest);
+    free (cache->newest);
+    free (cache->order_scratch);
+    free (cache);
+}
+
+static int compare_stamps (const void *a, const void *b){
+    const uint64_t *x = (const uint64_t *) a, *y = (const uint64_t *) b;
+    return x [0] < y [0] ? -1 : x [0] > y [0];
+}
+
+/**
+ * Rebuild the indexes from the arrays, once they are loaded.
+ */
+void ck_rebuild (ck_cache *cache){
+    uint64_t set_number, slot, n, i;
+    uint64_t *scratch = cache->order_scratch;
+    memset (cache->buckets, 0,
+            (cache->bucket_mask + 1) * sizeof (uint64_t));
+    memset (cache->oldest, 0, cache->n_sets * sizeof (uint64_t));
+    memset (cache->newest, 0, cache->n_sets * sizeof (uint64_t));
+    for (set_number = 0; set_number < cache->n_sets; set_number++){
+        n = 0;
+        for (slot = set_number * cache->n_ways;
+             slot < (set_number + 1) * cache->n_ways; slot++){
+            if (!cache->valid [slot])
+                continue;
+            index_add (cache, slot);
+            scratch [2 * n] = cache->stamps [slot];
+            scratch [2 * n + 1] = slot;
+            n++;
+        }
+        if (!HAS_ORDER (cache))
+            continue;
+        qsort (scratch, n, 2 * sizeof (uint64_t), compare_stamps);
+        for (i = 0; i < n; i++)
+            order_append (cache, scratch [2 * i + 1]);
+    }
+}
+
+/**
+ * Give the legacy policies their dicts (arrays laid out as in
+ * ck_cache). Return 0, or RESULT_ERROR if out of memory.
+ */
+int ck_set_dicts (ck_cache *cache, uint64_t capacity, uint64_t *keys,
+                  uint64_t *slots, uint8_t *states, uint64_t *masks,
+                  uint64_t *fills, uint64_t *used){
+    uint64_t *scratch = NULL;
+    if (capacity){
+        scratch = (uint64_t *) malloc (2 * capacity * sizeof (uint64_t));
+        if (!scratch)
+            return RESULT_ERROR;
+    }
+    free (cache->dict_scratch);
+    cache->dict_scratch = scratch;
+    cache->dict_capacity = capacity;
+    cache->dict_keys = keys;
+    cache->dict_slots = slots;
+    cache->dict_states = states;
+    cache->dict_masks = masks;
+    cache->dict_fills = fills;
+    cache->dict_used = used;
+    return 0;
+}
+
+void ck_set_random_state (ck_cache *cache, const uint32_t *mt, int index){
+    memcpy (cache->mt, mt, sizeof (cache->mt));
+    cache->mt_index = index;
+}
+
+int ck_get_random_state (ck_cache *cache, uint32_t *mt){
+    memcpy (mt, cache->mt, sizeof (cache->mt));
+    return cache->mt_index;
+}
+
+uint64_t ck_clock (ck_cache *cache){
+    return cache->clock;
+}
+
+void ck_set_clock (ck_cache *cache, uint64_t clock){
+    cache->clock = clock;
+}
+
+uint64_t ck_seen_count (ck_cache *cache){
+    return cache->seen_count;
+}
+
+/**
+ * Copy the blocks seen so far to blocks (ck_seen_count of them).
+ */
+void ck_seen_blocks (ck_cache *cache, uint64_t *blocks){
+    uint64_t i, n = 0;
+    if (cache->seen_zero)
+        blocks [n++] = 0;
+    for (i = 0; i < cache->seen_capacity; i++)
+        if (cache->seen [i])
+            blocks [n++] = cache->seen [i];
+}
+
+int ck_seen_add (ck_cache *cache, uint64_t block){
+    if (seen_reserve (cache))
+        return RESULT_ERROR;
+    seen_add (cache, block);
+    return 0;
+}
+
+/**
+ * Return the slot of block, or -1 if it is not in the cache.
+ */
+static int64_t find (ck_cache *cache, uint64_t block){
+    uint64_t next;
+    for (next = *bucket_of (cache, block); next;
+         next = cache->chain [next - 1])
+        if (cache->blocks [next - 1] == block)
+            return (int64_t) next - 1;
+    return -1;
+}
+
+static void touch (ck_cache *cache, uint64_t slot){
+    if (cache->policy == POLICY_LRU){
+        cache->stamps [slot] = cache->clock;
+        order_remove (cache, slot);
+        order_append (cache, slot);
+    }
+    else if (cache->policy == POLICY_LFU){
+        cache->stamps [slot] = cache->clock;
+        cache->frequencies [slot]++;
+    }
+    else if (cache->policy == POLICY_LFU_LEGACY)
+        cache->frequencies [slot]++;
+}
+
+/**
+ * Pick the victim of the full set at base as Set (random.choice of
+ * the tags) or LFUSet (the first tag of the least frequency) would,
+ * and remove its tag from the dict of the set.
+ */
+static uint64_t pick_legacy_slot_to_evict (ck_cache *cache, uint64_t base){
+    uint64_t set_number = base / cache->n_ways;
+    uint64_t entry = set_number * cache->dict_capacity;
+    uint64_t slot, least = UINT64_MAX, n = 0;
+    if (cache->policy == POLICY_RANDOM_LEGACY)
+        n = (uint64_t) (random_random (cache) * cache->dict_used [set_number]);
+    else
+        for (slot = base; slot < base + cache->n_ways; slot++)
+            if (cache->frequencies [slot] < least)
+                least = cache->frequencies [slot];
+    /* The tags in the order of the dict's entries. */
+    for (; ; entry++){
+        if (cache->dict_states [entry] != DICT_ACTIVE)
+            continue;
+        slot = cache->dict_slots [entry];
+        if (cache->policy == POLICY_RANDOM_LEGACY
+            ? n-- == 0 : cache->frequencies [slot] == least)
+            break;
+    }
+    cache->dict_states [entry] = DICT_DUMMY;
+    cache->dict_used [set_number]--;
+    return slot;
+}
+
+static uint64_t pick_slot_to_evict (ck_cache *cache, uint64_t base){
+    uint64_t slot, best = base;
+    if (IS_LEGACY (cache))
+        return pick_legacy_slot_to_evict (cache, base);
+    if (cache->policy == POLICY_RANDOM)
+        return base + (uint64_t) (random_random (cache) * cache->n_ways);
+    if (HAS_ORDER (cache))
+        return cache->oldest [base / cache->n_ways] - 1;
+    for (slot = base + 1; slot < base + cache->n_ways; slot++){
+        if (cache->policy == POLICY_LFU
+            && cache->frequencies [slot] != cache->frequencies [best]){
+            if (cache->frequencies [slot] < cache->frequencies [best])
+                best = slot;
+        }
+        else if (cache->stamps [slot] < cache->stamps [best])
+            best = slot;
+    }
+    return best;
+}
+
+/**
+ * Put block in its set, evicting a block if the set is full. Return
+ * RESULT_EVICTED (and RESULT_DIRTY) with the evicted block in victim.
+ */
+static int allocate (ck_cache *cache, uint64_t block, uint8_t dirty_status,
+                     uint64_t *victim){
+    uint64_t set_number = block & cache->set_mask;
+    uint64_t base = set_number * cache->n_ways, slot;
+    int result = 0;
+    if (cache->occupancy [set_number] < cache->n_ways){
+        slot = (uint8_t *) memchr (cache->valid + base, 0, cache->n_ways)
+            - cache->valid;
+        cache->occupancy [set_number]++;
+    }
+    else {
+        slot = pick_slot_to_evict (cache, base);
+        index_remove (cache, slot);
+        if (HAS_ORDER (cache))
+            order_remove (cache, slot);
+        *victim = cache->blocks [slot];
+        result = RESULT_EVICTED;
+        if (cache->dirty [slot]){
+            result |= RESULT_DIRTY;
+            cache->writeback_count [set_number]++;
+        }
+    }
+    cache->blocks [slot] = block;
+    cache->valid [slot] = 1;
+    cache->dirty [slot] = dirty_status;
+    cache->stamps [slot] = cache->clock;
+    cache->frequencies [slot] = 1;
+    index_add (cache, slot);
+    if (HAS_ORDER (cache))
+        order_append (cache, slot);
+    if (IS_LEGACY (cache))
+        dict_insert (cache, set_number, block >> cache->set_bits, slot);
+    return result;
+}
+
+static void count_miss (ck_cache *cache, uint64_t block){
+    if (seen_add (cache, block))
+        cache->cold_miss_count [block & cache->set_mask]++;
+    else
+        cache->conflict_miss_count [block & cache->set_mask]++;
+}
+
+/**
+ * Access block (FlatCache.accessBlock). Return RESULT_HIT on a hit,
+ * else the result of allocating it (0 if not allocated), or
+ * RESULT_ERROR.
+ */
+int ck_access (ck_cache *cache, uint64_t block, uint8_t dirty_status,
+               uint64_t *victim){
+    int64_t slot;
+    if (seen_reserve (cache))
+        return RESULT_ERROR;
+    cache->access_count [block & cache->set_mask]++;
+    cache->clock++;
+    slot = find (cache, block);
+    if (slot >= 0){
+        touch (cache, (uint64_t) slot);
+        if (dirty_status)
+            cache->dirty [slot] = 1;
+        return RESULT_HIT;
+    }
+    count_miss (cache, block);
+    if (cache->write_no_allocate && dirty_status)
+        return 0;
+    return allocate (cache, block, dirty_status, victim);
+}
+
+/**
+ * Access the n byte addresses addrs, reads where ops is 0 and writes
+ * where it is 1. Return the number of hits, or RESULT_ERROR (after
+ * the accesses before the one that failed).
+ */
+int64_t ck_access_batch (ck_cache *cache, const uint8_t *ops,
+                         const uint64_t *addrs, uint64_t n,
+                         int block_offset_bit_length){
+    uint64_t i, victim;
+    int64_t hits = 0;
+    int result;
+    for (i = 0; i < n; i++){
+        result = ck_access (cache, addrs [i] >> block_offset_bit_length,
+                            ops [i], &victim);
+        if (result == RESULT_ERROR)
+            return RESULT_ERROR;
+        hits += result == RESULT_HIT;
+    }
+    return hits;
+}
+
+int ck_probe (ck_cache *cache, uint64_t block){
+    if (seen_reserve (cache))
+        return RESULT_ERROR;
+    cache->access_count [block & cache->set_mask]++;
+    if (find (cache, block) >= 0)
+        return 1;
+    count_miss (cache, block);
+    return 0;
+}
+
+int ck_insert (ck_cache *cache, uint64_t block, uint8_t dirty_status,
+               uint64_t *victim){
+    int64_t slot;
+    if (seen_reserve (cache))
+        return RESULT_ERROR;
+    cache->clock++;
+    slot = find (cache, block);
+    if (slot >= 0){
+        touch (cache, (uint64_t) slot);
+        if (dirty_status)
+            cache->dirty [slot] = 1;
+        return RESULT_HIT;
+    }
+    seen_add (cache, block);
+    return allocate (cache, block, dirty_status, victim);
+}
+
+int ck_contains (ck_cache *cache, uint64_t block){
+    return find (cache, block) >= 0;
+}
+
+void ck_mark_dirty (ck_cache *cache, uint64_t block){
+    int64_t slot = find (cache, block);
+    if (slot >= 0)
+        cache->dirty [slot] = 1;
+}
+
+void ck_mark_clean (ck_cache *cache, uint64_t block){
+    int64_t slot = find (cache, block);
+    if (slot >= 0)
+        cache->dirty [slot] = 0;
+}
+
+/**
+ * Drop block from the cache. Return its dirty status, or -1 if it was
+ * not in the cache.
+ */
+int ck_invalidate (ck_cache *cache, uint64_t block){
+    int64_t slot = find (cache, block);
+    if (slot < 0)
+        return -1;
+    index_remove (cache, (uint64_t) slot);
+    if (HAS_ORDER (cache))
+        order_remove (cache, (uint64_t) slot);
+    cache->valid [slot] = 0;
+    cache->occupancy [block & cache->set_mask]--;
+    if (IS_LEGACY (cache))
+        dict_delete (cache, block & cache->set_mask, block >> cache->set_bits);
+    return cache->dirty [slot];
+}